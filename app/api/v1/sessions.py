@@ -7,17 +7,19 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
+from app.core.drain import RECONNECT_AFTER, DrainingError
 from app.models.schemas import (
     SessionCreate, 
     SessionResponse, 
     SessionDetailResponse, 
     SessionListResponse,
+    MessageResponse,
+    ComputerUseEventResponse,
     ChatRequest
 )
-from app.services.computer_use.agent_service import ComputerUseAgentService
+from app.services.computer_use.agent_service import agent_service
 
 router = APIRouter()
-agent_service = ComputerUseAgentService()
 
 
 @router.post("/", response_model=SessionResponse)
@@ -29,6 +31,11 @@ async def create_session(
     try:
         session = await agent_service.create_session(session_data, db)
         return session
+    except DrainingError as e:
+        # nginx retries the request on another backend
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(int(RECONNECT_AFTER))}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
 
@@ -55,7 +62,13 @@ async def get_session(
     """Get detailed session information including messages and events"""
     try:
         result = await agent_service.get_session_history(session_id, db)
-        return result
+        return SessionDetailResponse(
+            **SessionResponse.model_validate(result["session"]).model_dump(),
+            messages=[MessageResponse.model_validate(m) for m in result["messages"]],
+            computer_use_events=[
+                ComputerUseEventResponse.model_validate(e) for e in result["events"]
+            ],
+        )
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
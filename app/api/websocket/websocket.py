@@ -4,21 +4,53 @@ WebSocket endpoints for real-time communication
 
 import json
 import asyncio
+from contextlib import aclosing
 from typing import Dict, Any
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.services.computer_use.agent_service import ComputerUseAgentService
+from app.core.drain import RECONNECT_AFTER, TurnInterrupted, drain
+from app.core.metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_SEND_QUEUE, gauge_function
+from app.services.computer_use.agent_service import agent_service
 from app.models.schemas import ChatRequest
 
 websocket_router = APIRouter()
-agent_service = ComputerUseAgentService()
 
 # Store active WebSocket connections
 active_connections: Dict[str, WebSocket] = {}
 
 
+async def send_json(websocket: WebSocket, message: Dict[str, Any]):
+    """Send a JSON message, tracking how many sends are waiting on the socket"""
+    WEBSOCKET_SEND_QUEUE.inc()
+    try:
+        await websocket.send_text(json.dumps(message))
+    finally:
+        WEBSOCKET_SEND_QUEUE.dec()
+
+
+async def send_bytes(websocket: WebSocket, data: bytes):
+    """Send a binary message, tracked like `send_json`"""
+    WEBSOCKET_SEND_QUEUE.inc()
+    try:
+        await websocket.send_bytes(data)
+    finally:
+        WEBSOCKET_SEND_QUEUE.dec()
+
+
+def reconnect_message(reason: str) -> Dict[str, Any]:
+    """Tells the client to reconnect, which lands it on another worker"""
+    return {"type": "reconnect", "data": {"reason": reason, "retry_after": RECONNECT_AFTER}}
+
+
+# "Service Restart", the client should reconnect
+CLOSE_SERVICE_RESTART = 1012
+# application close code: there is no session of that id
+CLOSE_SESSION_NOT_FOUND = 4404
+
+
 class ConnectionManager:
     """Manages WebSocket connections"""
     
@@ -39,13 +71,34 @@ class ConnectionManager:
         """Send a message to a specific WebSocket client"""
         if session_id in self.active_connections:
             try:
-                await self.active_connections[session_id].send_text(json.dumps(message))
+                await send_json(self.active_connections[session_id], message)
             except Exception:
                 # Remove broken connection
                 self.disconnect(session_id)
 
+    async def reconnect(self, session_id: str, reason: str):
+        """Tell a client to reconnect and close its connection"""
+        websocket = self.active_connections.pop(session_id, None)
+        if websocket is None:
+            return
+        try:
+            await send_json(websocket, reconnect_message(reason))
+            await websocket.close(code=CLOSE_SERVICE_RESTART)
+        except Exception:
+            pass
+
+    async def reconnect_all(self, reason: str) -> int:
+        """Tell every client to reconnect; returns how many there were"""
+        session_ids = list(self.active_connections)
+        await asyncio.gather(*(self.reconnect(session_id, reason) for session_id in session_ids))
+        return len(session_ids)
+
 
 manager = ConnectionManager()
+# VNC viewers are tracked separately so they don't replace the chat connection
+vnc_manager = ConnectionManager()
+gauge_function(WEBSOCKET_CONNECTIONS.labels("chat"), lambda: len(manager.active_connections))
+gauge_function(WEBSOCKET_CONNECTIONS.labels("vnc"), lambda: len(vnc_manager.active_connections))
 
 
 @websocket_router.websocket("/chat/{session_id}")
@@ -56,16 +109,19 @@ async def websocket_chat(
     """WebSocket endpoint for real-time chat with computer use agent"""
     
     await manager.connect(websocket, session_id)
+    if drain.draining:
+        await manager.reconnect(session_id, "worker draining")
+        return
     
     try:
         # Send connection confirmation
-        await websocket.send_text(json.dumps({
+        await send_json(websocket, {
             "type": "connection",
             "data": {
                 "message": "Connected to computer use agent",
                 "session_id": session_id
             }
-        }))
+        })
         
         while True:
             # Receive message from client
@@ -78,112 +134,191 @@ async def websocket_chat(
                 if not user_message:
                     continue
                 
+                if drain.draining:
+                    # the message goes to the worker the client reconnects to
+                    await manager.reconnect(session_id, "worker draining")
+                    return
+                
                 # Send acknowledgment
-                await websocket.send_text(json.dumps({
+                await send_json(websocket, {
                     "type": "ack",
                     "data": {
                         "message": "Message received",
                         "user_message": user_message
                     }
-                }))
+                })
                 
                 # Process message with computer use agent
                 async def progress_callback(chunk: Dict[str, Any]):
                     """Callback for streaming progress updates"""
-                    await websocket.send_text(json.dumps(chunk))
+                    await send_json(websocket, chunk)
                 
                 try:
                     # Get database session
                     from app.core.database import AsyncSessionLocal
                     async with AsyncSessionLocal() as db:
-                        # Stream the agent response
-                        async for chunk in agent_service.send_message(
+                        # Stream the agent response; closed even if sending fails,
+                        # which ends the turn
+                        chunks = agent_service.send_message(
                             session_id, 
                             user_message, 
                             db, 
                             progress_callback
-                        ):
-                            await websocket.send_text(json.dumps(chunk))
-                            
+                        )
+                        async with aclosing(chunks):
+                            async for chunk in chunks:
+                                await send_json(websocket, chunk)
+                
+                except TurnInterrupted:
+                    # the turn ran past the drain deadline, it resumes from
+                    # its checkpoint once the client reconnects
+                    await manager.reconnect(session_id, "turn interrupted")
+                    return
                 except Exception as e:
                     # Send error message
-                    await websocket.send_text(json.dumps({
+                    await send_json(websocket, {
                         "type": "error",
                         "data": {
                             "error": f"Failed to process message: {str(e)}"
                         }
-                    }))
+                    })
             
             elif message_data.get("type") == "ping":
                 # Respond to ping with pong
-                await websocket.send_text(json.dumps({
+                await send_json(websocket, {
                     "type": "pong",
                     "data": {"timestamp": asyncio.get_event_loop().time()}
-                }))
+                })
                 
     except WebSocketDisconnect:
         manager.disconnect(session_id)
     except Exception as e:
         # Send error and disconnect
         try:
-            await websocket.send_text(json.dumps({
+            await send_json(websocket, {
                 "type": "error",
                 "data": {
                     "error": f"WebSocket error: {str(e)}"
                 }
-            }))
+            })
         except:
             pass
         finally:
             manager.disconnect(session_id)
 
 
+async def stream_display(websocket: WebSocket, stream):
+    """Run a viewer's frame stream, telling the viewer why it stopped"""
+    try:
+        await stream.run()
+    except Exception as e:
+        try:
+            await send_json(websocket, {
+                "type": "viewer_error",
+                "data": {
+                    "error": f"Display stream stopped: {str(e)}"
+                }
+            })
+        except Exception:
+            pass
+
+
 @websocket_router.websocket("/vnc/{session_id}")
 async def websocket_vnc(
     websocket: WebSocket,
     session_id: str
 ):
-    """WebSocket endpoint for VNC connection status"""
+    """
+    WebSocket endpoint for VNC connection status, and the built-in viewer:
+    after a `viewer_start` message the session's display is streamed as
+    binary frames, each acknowledged with a `frame_ack` (see viewer.py)
+    """
     
-    await manager.connect(websocket, session_id)
+    await vnc_manager.connect(websocket, session_id)
+    if drain.draining:
+        await vnc_manager.reconnect(session_id, "worker draining")
+        return
     
+    stream = None
+    stream_task = None
     try:
         # Send VNC connection info
-        await websocket.send_text(json.dumps({
+        await send_json(websocket, {
             "type": "vnc_info",
             "data": {
                 "vnc_host": "localhost",  # This should come from config
                 "vnc_port": 5901,
-                "vnc_url": f"vnc://localhost:5901"
+                "vnc_url": f"vnc://localhost:5901",
+                "viewer": True
             }
-        }))
+        })
         
         while True:
             # Keep connection alive and handle VNC-related messages
             data = await websocket.receive_text()
             message_data = json.loads(data)
+            message_type = message_data.get("type")
             
-            if message_data.get("type") == "vnc_status":
+            if message_type == "vnc_status":
                 # Send VNC status update
-                await websocket.send_text(json.dumps({
+                await send_json(websocket, {
                     "type": "vnc_status",
                     "data": {
-                        "status": "connected",
+                        "status": "streaming" if stream_task else "connected",
                         "session_id": session_id
                     }
-                }))
+                })
+            
+            elif message_type == "viewer_start" and stream_task is None:
+                # imported with the first viewer, like the tools it captures with
+                from app.services.computer_use.viewer import FrameStream, session_display
+                
+                display = await session_display(session_id)
+                if display is None:
+                    await send_json(websocket, {
+                        "type": "error",
+                        "data": {
+                            "error": f"Session {session_id} not found"
+                        }
+                    })
+                    vnc_manager.disconnect(session_id)
+                    await websocket.close(code=CLOSE_SESSION_NOT_FOUND)
+                    return
+                
+                # viewers can ask for fewer frames, not more
+                max_fps = float(message_data.get("data", {}).get("max_fps") or settings.VIEWER_MAX_FPS)
+                max_fps = min(max(max_fps, 0.1), settings.VIEWER_MAX_FPS)
+                stream = FrameStream(
+                    display,
+                    lambda frame: send_bytes(websocket, frame),
+                    max_fps=max_fps,
+                )
+                stream_task = asyncio.create_task(stream_display(websocket, stream))
+            
+            elif message_type == "frame_ack" and stream:
+                stream.ack(int(message_data.get("data", {}).get("sequence", 0)))
+            
+            elif message_type == "keyframe" and stream:
+                stream.keyframe()
+            
+            elif message_type == "viewer_stop" and stream_task:
+                stream_task.cancel()
+                stream, stream_task = None, None
                 
     except WebSocketDisconnect:
-        manager.disconnect(session_id)
+        vnc_manager.disconnect(session_id)
     except Exception as e:
         try:
-            await websocket.send_text(json.dumps({
+            await send_json(websocket, {
                 "type": "error",
                 "data": {
                     "error": f"VNC WebSocket error: {str(e)}"
                 }
-            }))
+            })
         except:
             pass
         finally:
-            manager.disconnect(session_id)
+            vnc_manager.disconnect(session_id)
+    finally:
+        if stream_task:
+            stream_task.cancel()
@@ -2,24 +2,53 @@
 Database connection and initialization
 """
 
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
-import asyncio
+import logging
 
 from app.core.config import settings
-from app.models.session import Base
+from app.core.metrics import instrument_engine
 
-# Convert PostgreSQL URL to async format
-async_database_url = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+logger = logging.getLogger(__name__)
+
+# Alembic revision the models match; bump it with every new migration
+SCHEMA_REVISION = "0003"
+
+
+class SchemaVersionError(RuntimeError):
+    """Raised at startup when the database is not migrated to SCHEMA_REVISION"""
+
+
+def async_url(url: str) -> str:
+    """Convert a PostgreSQL URL to the asyncpg driver"""
+    return url.replace("postgresql://", "postgresql+asyncpg://")
+
+
+async_database_url = async_url(settings.DATABASE_URL)
+
+# SQLite (local development and load tests) shares one connection only when it
+# lives in memory; PostgreSQL gets a real pool so concurrent sessions don't
+# queue behind a single connection
+if async_database_url.startswith("sqlite") and ":memory:" in async_database_url:
+    engine_options = {"poolclass": StaticPool}
+elif async_database_url.startswith("sqlite"):
+    engine_options = {}
+else:
+    engine_options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
 
 # Create async engine
 engine = create_async_engine(
     async_database_url,
     echo=settings.DEBUG,
-    poolclass=StaticPool,
     pool_pre_ping=True,
+    **engine_options,
 )
+instrument_engine(engine)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -36,10 +65,21 @@ SessionLocal = sessionmaker(
 )
 
 
-async def init_db():
-    """Initialize database tables"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def check_schema():
+    """
+    Check the database is at SCHEMA_REVISION; creating and altering tables is
+    left to `alembic upgrade head`, run once per deploy rather than per worker
+    """
+    async with engine.connect() as conn:
+        revision = None
+        if await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("alembic_version")):
+            revision = (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+    if revision != SCHEMA_REVISION:
+        raise SchemaVersionError(
+            f"Database schema is at revision {revision or 'none'}, expected {SCHEMA_REVISION}; "
+            "run `alembic upgrade head` first"
+        )
+    logger.info("Database schema at revision %s", revision)
 
 
 async def get_db():
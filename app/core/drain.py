@@ -0,0 +1,137 @@
+"""
+Graceful drain of a worker before it stops
+
+On SIGTERM the worker first reports itself not ready, so the load balancer
+stops sending it work, and refuses new sessions and new agent turns. The turns
+already running get up to DRAIN_TIMEOUT seconds to finish, anything still
+running after that is cancelled. Only then are clients told to reconnect and
+the worker shuts down as usual.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Iterator, Optional, Set
+
+from app.core.metrics import AGENT_TURNS_IN_FLIGHT, gauge_function
+
+logger = logging.getLogger(__name__)
+
+# seconds a client should wait before reconnecting, to land on another worker
+RECONNECT_AFTER = 1.0
+# seconds cancelled turns get to unwind
+CANCEL_GRACE = 5.0
+
+
+class DrainingError(Exception):
+    """Raised for new work while the worker drains"""
+
+
+class TurnInterrupted(Exception):
+    """Raised to the consumer of a turn the drain cancelled"""
+
+
+class Drain:
+    """Drain state of the worker and the agent turns it is running"""
+
+    def __init__(self):
+        self.draining = False
+        self.started_at: Optional[float] = None
+        self._turns: Dict[asyncio.Task, str] = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def ready(self) -> bool:
+        return not self.draining
+
+    def start(self) -> bool:
+        """Start draining; False if the worker already is"""
+        if self.draining:
+            return False
+        self.draining = True
+        self.started_at = time.monotonic()
+        logger.info("Draining, %d agent turns in flight", len(self._turns))
+        return True
+
+    @contextmanager
+    def turn(self, session_id: str) -> Iterator[None]:
+        """Track the agent turn the current task runs for a session"""
+        task = asyncio.current_task()
+        self._turns[task] = session_id
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._turns.pop(task, None)
+            if not self._turns:
+                self._idle.set()
+
+    async def stream_turn(
+        self, session_id: str, chunks: AsyncGenerator[Any, None]
+    ) -> AsyncIterator[Any]:
+        """
+        Run the agent turn producing `chunks` in a task of its own and yield
+        what it produces. A drain cancels that task rather than the caller's,
+        e.g. the client's connection, which gets TurnInterrupted instead.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def run() -> None:
+            with self.turn(session_id):
+                try:
+                    async for chunk in chunks:
+                        await queue.put(chunk)
+                finally:
+                    await chunks.aclose()
+
+        task = asyncio.create_task(run())
+        get: Optional[asyncio.Future] = None
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait([get, task], return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    break
+                yield get.result()
+            while not queue.empty():
+                yield queue.get_nowait()
+            if task.cancelled():
+                raise TurnInterrupted(f"The agent turn of session {session_id} was interrupted")
+            # the turn's own error, if it failed
+            task.result()
+        finally:
+            if get is not None:
+                get.cancel()
+            # the caller stopped reading, or was cancelled itself
+            if not task.done():
+                task.cancel()
+                await asyncio.wait([task])
+
+    def in_flight(self) -> int:
+        return len(self._turns)
+
+    async def wait_for_turns(self, timeout: float) -> Set[str]:
+        """
+        Wait up to `timeout` seconds for the running turns to finish, then
+        cancel the rest; returns the sessions whose turns were cancelled.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return set()
+        except asyncio.TimeoutError:
+            pass
+        interrupted = dict(self._turns)
+        logger.warning(
+            "Cancelling %d agent turns still running after %.0fs", len(interrupted), timeout
+        )
+        for task in interrupted:
+            task.cancel()
+        # the cancelled turns unwind, flushing what they can
+        await asyncio.wait(list(interrupted), timeout=CANCEL_GRACE)
+        return set(interrupted.values())
+
+
+drain = Drain()
+gauge_function(AGENT_TURNS_IN_FLIGHT, drain.in_flight)
@@ -0,0 +1,216 @@
+"""
+Prometheus metrics for tools, subprocesses, database, WebSockets and the event loop
+
+Everything recorded on the hot path is a counter increment or a histogram
+observation; gauges that can be derived from existing state are computed at
+scrape time instead.
+
+With several workers (python -m app.server), set PROMETHEUS_MULTIPROC_DIR in
+the environment: each worker then keeps its metrics in files there and
+/metrics of any worker reports all of them. prometheus_client reads the
+variable when it is imported, so it can't come from the .env file.
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+if MULTIPROC_DIR:
+    # before the metrics below create their files
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Buckets from 1ms to ~2min, tool calls include the 2s screenshot settle delay
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+TOOL_CALLS = Counter(
+    "energetic_tool_calls_total", "Tool calls", ["tool", "action"]
+)
+TOOL_ERRORS = Counter(
+    "energetic_tool_errors_total", "Tool calls that failed", ["tool", "action"]
+)
+TOOL_LATENCY = Histogram(
+    "energetic_tool_call_seconds", "Tool call latency", ["tool", "action"],
+    buckets=LATENCY_BUCKETS,
+)
+SCREENSHOT_CAPTURE = Histogram(
+    "energetic_screenshot_capture_seconds", "Screenshot capture and resize time",
+    buckets=LATENCY_BUCKETS,
+)
+SCREENSHOT_READ = Histogram(
+    "energetic_screenshot_read_seconds", "Screenshot file read time",
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY = Histogram(
+    "energetic_db_query_seconds", "Database statement latency", buckets=LATENCY_BUCKETS
+)
+DB_COMMIT = Histogram(
+    "energetic_db_commit_seconds", "Database flush and commit latency", buckets=LATENCY_BUCKETS
+)
+DB_POOL_IN_USE = Gauge(
+    "energetic_db_pool_connections_in_use", "Database connections checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "energetic_db_pool_size", "Configured size of the database connection pool",
+    multiprocess_mode="livesum",
+)
+ACTIVE_SESSIONS = Gauge(
+    "energetic_active_sessions", "Agent sessions held in memory",
+    multiprocess_mode="livesum",
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "energetic_websocket_connections", "Open WebSocket connections", ["endpoint"],
+    multiprocess_mode="livesum",
+)
+WEBSOCKET_SEND_QUEUE = Gauge(
+    "energetic_websocket_send_queue_depth", "WebSocket messages waiting to be sent",
+    multiprocess_mode="livesum",
+)
+AGENT_TURNS_IN_FLIGHT = Gauge(
+    "energetic_agent_turns_in_flight", "Agent turns being processed",
+    multiprocess_mode="livesum",
+)
+SUBPROCESSES = Gauge(
+    "energetic_subprocesses", "Live tool subprocesses",
+    multiprocess_mode="livesum",
+)
+SUBPROCESS_SPAWN = Histogram(
+    "energetic_subprocess_spawn_seconds", "Time to fork and exec a tool subprocess",
+    buckets=LATENCY_BUCKETS,
+)
+SUBPROCESS_WAIT = Histogram(
+    "energetic_subprocess_slot_wait_seconds", "Time a tool command waited for a concurrency slot",
+    buckets=LATENCY_BUCKETS,
+)
+IMAGE_POOL_WAIT = Histogram(
+    "energetic_image_pool_wait_seconds", "Time an image operation waited for a pool slot",
+    buckets=LATENCY_BUCKETS,
+)
+IMAGE_POOL_IN_FLIGHT = Gauge(
+    "energetic_image_pool_in_flight", "Image operations submitted to the process pool",
+    multiprocess_mode="livesum",
+)
+VIEWER_FRAMES = Counter(
+    "energetic_viewer_frames_total", "Frames streamed to display viewers"
+)
+VIEWER_BYTES = Counter(
+    "energetic_viewer_bytes_total", "Bytes of frames streamed to display viewers"
+)
+EVENT_LOOP_LAG = Histogram(
+    "energetic_event_loop_lag_seconds", "Delay of the event loop in running a scheduled wakeup",
+    buckets=LAG_BUCKETS,
+)
+EVENT_LOOP_BLOCKS = Counter(
+    "energetic_event_loop_blocks_total", "Event loop stalls over the watchdog threshold", ["location"]
+)
+
+
+def tool_action(tool_input: Dict[str, Any]) -> str:
+    """Low cardinality action label of a tool call"""
+    if "action" in tool_input:
+        return str(tool_input["action"])
+    # the editor's `command` is an enum, bash's `command` is free-form shell
+    if "path" in tool_input and "command" in tool_input:
+        return str(tool_input["command"])
+    return "restart" if tool_input.get("restart") else "run"
+
+
+# gauges set from a function at scrape time, in multiprocess mode
+_gauge_functions: List[Tuple[Any, Callable[[], float]]] = []
+
+
+def gauge_function(gauge, function: Callable[[], float]) -> None:
+    """
+    Report `function()` as the value of `gauge` (or one of its labelled
+    children). In multiprocess mode the workers store the value in their file
+    whenever refresh_gauges runs, the worker answering the scrape just before.
+    """
+    if MULTIPROC_DIR:
+        _gauge_functions.append((gauge, function))
+    else:
+        gauge.set_function(function)
+
+
+def refresh_gauges() -> None:
+    for gauge, function in _gauge_functions:
+        gauge.set(function())
+
+
+def latest() -> bytes:
+    """The /metrics response, of every worker in multiprocess mode"""
+    if not MULTIPROC_DIR:
+        return generate_latest()
+    refresh_gauges()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+    return generate_latest(registry)
+
+
+def clear_multiprocess_dir() -> None:
+    """Remove the files of a previous run, before the workers start"""
+    if MULTIPROC_DIR:
+        for name in os.listdir(MULTIPROC_DIR):
+            if name.endswith(".db"):
+                os.unlink(os.path.join(MULTIPROC_DIR, name))
+
+
+def worker_exited(pid: int) -> None:
+    """Stop reporting the gauges of a worker; its counters and histograms still count"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+
+
+def instrument_engine(engine) -> None:
+    """Record statement latency and pool usage of a (sync or async) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        # on the statement's context, which a failed statement leaves behind with it
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY.observe(time.perf_counter() - context._query_start)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_IN_USE.inc()
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.dec()
+
+    pool_size = getattr(sync_engine.pool, "size", None)
+    if callable(pool_size):
+        gauge_function(DB_POOL_SIZE, pool_size)
+
+
+@event.listens_for(OrmSession, "before_commit")
+def _before_commit(session):
+    session.info["commit_start"] = time.perf_counter()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session):
+    start = session.info.pop("commit_start", None)
+    if start is not None:
+        DB_COMMIT.observe(time.perf_counter() - start)
+
@@ -0,0 +1,166 @@
+"""
+Lightweight tracing of agent turns
+
+Spans nest through a context variable, so code deep inside a tool can open a
+sub-span without being handed its parent. Finished root spans can be exported
+as OpenTelemetry (OTLP/JSON) lines, the format of the collector's file exporter.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+SERVICE_NAME = "energetic-backend"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """A timed operation with nested child spans"""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent: Optional["Span"] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    status: str = STATUS_OK
+    status_message: Optional[str] = None
+    children: List["Span"] = field(default_factory=list)
+
+    @classmethod
+    def start(cls, name: str, parent: Optional["Span"] = None, **attributes) -> "Span":
+        span = cls(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent=parent,
+            attributes=attributes,
+        )
+        if parent:
+            parent.children.append(span)
+        return span
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def fail(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    @property
+    def duration_ms(self) -> Optional[int]:
+        if self.end_ns is None:
+            return None
+        return round((self.end_ns - self.start_ns) / 1_000_000)
+
+    def walk(self) -> Iterator["Span"]:
+        """This span and all of its descendants, depth first"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Name and duration of every descendant, for storing alongside an event"""
+        return [
+            {"name": span.name, "duration_ms": span.duration_ms}
+            for span in self.walk()
+            if span is not self
+        ]
+
+    def to_otel(self) -> Dict[str, Any]:
+        otel = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _otel_attributes(self.attributes),
+            "status": {"code": 2 if self.status == STATUS_ERROR else 1},
+        }
+        if self.parent:
+            otel["parentSpanId"] = self.parent.span_id
+        if self.status_message:
+            otel["status"]["message"] = self.status_message
+        return otel
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes) -> Iterator[Span]:
+    """
+    Time the enclosed block as a child of `parent`, or of the current span
+
+    Exceptions mark the span as failed and propagate.
+    """
+    current = Span.start(name, parent or _current_span.get(), **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(str(e) or type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otel_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"key": key, "value": _otel_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class SpanExporter:
+    """Append finished traces to a file as OTLP/JSON, one trace per line"""
+
+    def __init__(self, path: Path, service_name: str = SERVICE_NAME):
+        self.path = Path(path)
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def to_otel(self, root: Span) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otel_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "energetic.agent"},
+                    "spans": [span.to_otel() for span in root.walk()],
+                }],
+            }]
+        }
+
+    def export(self, root: Span) -> None:
+        """Blocking write; call from a worker thread on the request path"""
+        line = json.dumps(self.to_otel(root), separators=(",", ":")) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
@@ -0,0 +1,119 @@
+"""
+Event loop watchdog
+
+A heartbeat coroutine records when the loop is next expected to wake up. A
+separate thread watches that deadline and, when the loop overshoots it by more
+than the threshold, captures the loop thread's stack while it is still blocked.
+When the loop catches up the stall is logged with that stack and counted by the
+code location it happened in.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.metrics import EVENT_LOOP_BLOCKS, EVENT_LOOP_LAG, refresh_gauges
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = str(Path(__file__).resolve().parents[1])
+MAX_REPORTS = 20
+
+
+@dataclass
+class BlockReport:
+    """One stall of the event loop"""
+
+    duration: float
+    location: str
+    task: Optional[str]
+    stack: str
+
+
+class LoopWatchdog:
+    """Detect event loop stalls longer than `threshold` seconds"""
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.reports: List[BlockReport] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._deadline = 0.0
+        self._captured: Optional[tuple] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the running loop; call from within it"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._deadline = time.monotonic() + self.interval
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._deadline)
+            EVENT_LOOP_LAG.observe(lag)
+            # what the other workers read of this one's gauges at scrape time
+            refresh_gauges()
+            captured, self._captured = self._captured, None
+            if lag > self.threshold and captured:
+                self._report(lag, *captured)
+
+    def _watch(self) -> None:
+        """Runs in the watchdog thread"""
+        poll = min(self.interval, self.threshold) / 2
+        captured_deadline = None
+        while not self._stopped.wait(poll):
+            deadline = self._deadline
+            if deadline == captured_deadline or time.monotonic() - deadline <= self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            captured_deadline = deadline
+            stack = traceback.extract_stack(frame)
+            task = asyncio.current_task(self._loop)
+            self._captured = (stack, task.get_name() if task else None)
+
+    def _report(self, duration: float, stack: traceback.StackSummary, task: Optional[str]) -> None:
+        location = _blocking_location(stack)
+        EVENT_LOOP_BLOCKS.labels(location).inc()
+        report = BlockReport(duration, location, task, "".join(stack.format()))
+        self.reports = [*self.reports[-(MAX_REPORTS - 1):], report]
+        logger.warning(
+            "Event loop blocked for %.0fms at %s (task %s)\n%s",
+            duration * 1000, location, task or "-", report.stack,
+        )
+
+
+def _blocking_location(stack: traceback.StackSummary) -> str:
+    """Innermost application frame of a stack, as `path:function`"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(APP_ROOT) and frame.filename != __file__:
+            return f"{Path(frame.filename).relative_to(Path(APP_ROOT).parent)}:{frame.name}"
+    return f"{Path(stack[-1].filename).name}:{stack[-1].name}" if stack else "unknown"
@@ -3,15 +3,28 @@ Energetic Backend - Computer Use Agent Session Management
 Main FastAPI application entry point
 """
 
-from fastapi import FastAPI
+import asyncio
+import logging
+import signal
+import sys
+import threading
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
 from app.api.v1.api import api_router
-from app.api.websocket.websocket import websocket_router
+from app.api.websocket.websocket import manager, vnc_manager, websocket_router
+from app.core import metrics
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import check_schema, close_db
+from app.core.drain import drain
+from app.core.watchdog import LoopWatchdog
+from app.services.computer_use.agent_service import agent_service
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Energetic Backend - Computer Use Agent",
@@ -44,24 +57,100 @@ async def api_health_check():
     """API health check endpoint"""
     return {"status": "healthy", "api_version": "v1"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness for the load balancer, failing as soon as the worker drains"""
+    if drain.draining:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "draining", "turns_in_flight": drain.in_flight()},
+        )
+    return {"status": "ready"}
+
+if settings.ENABLE_METRICS:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Prometheus scrape endpoint"""
+        return Response(metrics.latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 # Mount static files for frontend
 app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
 
+async def drain_worker():
+    """Stop taking work, let running turns finish, flush and send clients elsewhere"""
+    if not drain.start():
+        return
+    interrupted = await drain.wait_for_turns(settings.DRAIN_TIMEOUT)
+    await agent_service.drain(interrupted)
+    clients = await manager.reconnect_all("worker draining")
+    clients += await vnc_manager.reconnect_all("worker draining")
+    logger.info(
+        "Drained: %d turns interrupted, %d clients told to reconnect", len(interrupted), clients
+    )
+
+def install_drain_handler():
+    """
+    Drain on SIGTERM before uvicorn shuts down, which closes every WebSocket
+    right away; uvicorn's own shutdown follows through its SIGINT handler.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+
+    async def drain_and_exit():
+        await drain_worker()
+        signal.raise_signal(signal.SIGINT)
+
+    def on_sigterm():
+        if drain.draining:
+            # a second SIGTERM skips the rest of the drain
+            signal.raise_signal(signal.SIGINT)
+            return
+        app.state.drain_task = loop.create_task(drain_and_exit())
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    except NotImplementedError:  # Windows
+        pass
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database and other services on startup"""
-    await init_db()
+    """Check the database schema and start other services on startup"""
+    await check_schema()
+    install_drain_handler()
+    if settings.ENABLE_METRICS:
+        app.state.watchdog = LoopWatchdog(
+            interval=settings.EVENT_LOOP_LAG_INTERVAL,
+            threshold=settings.EVENT_LOOP_BLOCK_THRESHOLD,
+        )
+        app.state.watchdog.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    pass
+    # already done when the shutdown came from SIGTERM
+    await drain_worker()
+    watchdog = getattr(app.state, "watchdog", None)
+    if watchdog:
+        await watchdog.stop()
+    # the client and the tools are imported with the first live session
+    client = sys.modules.get("app.services.computer_use.client")
+    if client:
+        await client.close_client()
+    tools_supervisor = sys.modules.get("app.services.computer_use.tools.supervisor")
+    if tools_supervisor:
+        await tools_supervisor.supervisor.terminate_all()
+    imaging = sys.modules.get("app.services.computer_use.imaging")
+    if imaging:
+        imaging.image_pool.close()
+    await close_db()
 
 if __name__ == "__main__":
+    # development server; production runs `python -m app.server`
     uvicorn.run(
         "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        host=settings.HOST,
+        port=settings.PORT,
+        reload=settings.DEBUG,
         log_level="info"
     )
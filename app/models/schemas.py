@@ -4,7 +4,7 @@ Pydantic schemas for API requests and responses
 
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 from enum import Enum
 
 
@@ -46,6 +46,10 @@ class SessionBase(BaseModel):
     system_prompt: Optional[str] = None
     model_name: Optional[str] = None
     tool_version: Optional[str] = None
+    # milliseconds between keystrokes when the agent types, default TYPING_DELAY_MS
+    typing_delay_ms: Optional[int] = Field(default=None, ge=0, le=1000)
+    # paste text longer than TYPING_PASTE_THRESHOLD from the clipboard instead of typing it
+    paste_long_text: bool = False
 
 
 class MessageBase(BaseModel):
@@ -91,6 +95,10 @@ class SessionResponse(SessionBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    input_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -101,6 +109,11 @@ class MessageResponse(MessageBase):
     id: int
     session_id: int
     timestamp: datetime
+    # the ORM column is `message_metadata`, `metadata` is taken by SQLAlchemy
+    metadata: Optional[Dict[str, Any]] = Field(
+        default=None,
+        validation_alias=AliasChoices("message_metadata", "metadata"),
+    )
     
     class Config:
         from_attributes = True
@@ -7,7 +7,7 @@ from typing import Optional, List
 from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 
 Base = declarative_base()
 
@@ -29,6 +29,15 @@ class Session(Base):
     system_prompt = Column(Text, nullable=True)
     model_name = Column(String(100), nullable=True)
     tool_version = Column(String(100), nullable=True)
+    typing_delay_ms = Column(Integer, nullable=True)  # keystroke delay of the type action
+    paste_long_text = Column(Boolean, nullable=False, default=False, server_default=false())
+    
+    # Token usage, totals plus one entry per model turn
+    input_tokens = Column(Integer, default=0)
+    cache_creation_input_tokens = Column(Integer, default=0)
+    cache_read_input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    turn_usage = Column(JSON, nullable=True)
     
     # Relationships
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
@@ -0,0 +1,210 @@
+"""
+Production launcher: pre-forked uvicorn workers sharing one listening socket
+
+    python -m app.server
+
+Configured through Settings: WORKERS, LOOP, HTTP, GRACEFUL_TIMEOUT,
+MAX_REQUESTS, MAX_REQUESTS_JITTER and LOG_LEVEL, and PROMETHEUS_MULTIPROC_DIR
+in the environment for metrics covering every worker (see app/core/metrics.py). The app is imported once,
+before the workers are forked, so they start without importing it again.
+Workers that exit are replaced; a recycled one asks for its replacement as
+soon as it stops accepting connections, then drains its agent turns like on
+SIGTERM. A worker that fails to start stops the server, the others would fail
+the same way.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import signal
+import sys
+import time
+import traceback
+from socket import socket
+from typing import List, Set
+
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+
+from app.core.config import settings
+from app.core.drain import CANCEL_GRACE
+from app.core.metrics import MULTIPROC_DIR, clear_multiprocess_dir, worker_exited
+
+logger = logging.getLogger("uvicorn.error")
+
+HANDLED_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD, signal.SIGUSR1)
+# sent by a worker to the launcher when it starts recycling
+RECYCLE_SIGNAL = signal.SIGUSR1
+# seconds between checks of the workers when no signal arrives
+SUPERVISE_INTERVAL = 1.0
+
+
+def server_config() -> uvicorn.Config:
+    return uvicorn.Config(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        loop=settings.LOOP,
+        http=settings.HTTP,
+        timeout_graceful_shutdown=settings.GRACEFUL_TIMEOUT,
+        log_level=settings.LOG_LEVEL.lower(),
+    )
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server of one worker, recycled after `max_requests` requests"""
+
+    def __init__(self, config: uvicorn.Config, max_requests: int = 0, launcher_pid: int = 0):
+        super().__init__(config)
+        self.max_requests = max_requests
+        self.launcher_pid = launcher_pid
+        self.recycling = None
+
+    async def on_tick(self, counter: int) -> bool:
+        if (
+            self.max_requests
+            and self.recycling is None
+            and self.server_state.total_requests >= self.max_requests
+        ):
+            self.recycling = asyncio.create_task(self.recycle())
+        return await super().on_tick(counter)
+
+    async def recycle(self) -> None:
+        """Leave new connections to the other workers, drain and exit"""
+        from app.main import drain_worker
+
+        logger.info(
+            "Recycling worker [%d] after %d requests", os.getpid(), self.server_state.total_requests
+        )
+        for server in self.servers:
+            server.close()
+        if self.launcher_pid:
+            os.kill(self.launcher_pid, RECYCLE_SIGNAL)
+        await drain_worker()
+        self.should_exit = True
+
+
+class WorkerPool:
+    """Forks the workers, replaces the ones that exit and stops them on SIGTERM"""
+
+    def __init__(self, config: uvicorn.Config, sockets: List[socket], workers: int):
+        self.config = config
+        self.sockets = sockets
+        self.workers = workers
+        self.pids: Set[int] = set()
+        # workers that stopped accepting connections and already have a replacement
+        self.recycling: Set[int] = set()
+        self.failed = False
+
+    def run(self) -> int:
+        signal.pthread_sigmask(signal.SIG_BLOCK, HANDLED_SIGNALS)
+        logger.info("Starting %d workers from launcher [%d]", self.workers, os.getpid())
+        for _ in range(self.workers):
+            self.spawn()
+        while not self.failed:
+            info = signal.sigtimedwait(HANDLED_SIGNALS, SUPERVISE_INTERVAL)
+            if info and info.si_signo in (signal.SIGTERM, signal.SIGINT):
+                self.stop(info.si_signo)
+                return 0
+            if info and info.si_signo == RECYCLE_SIGNAL and info.si_pid in self.pids:
+                self.recycling.add(info.si_pid)
+                self.spawn()
+            self.reap()
+        logger.error("A worker failed to start, stopping")
+        self.stop(signal.SIGTERM)
+        return STARTUP_FAILURE
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return
+        code = 1
+        try:
+            for sig in HANDLED_SIGNALS:
+                signal.signal(sig, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_SETMASK, ())
+            code = run_worker(self.config, self.sockets, launcher_pid=os.getppid())
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+
+    def reap(self) -> None:
+        """Collect the workers that exited, replacing them unless stopping"""
+        while self.pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+            self.pids.discard(pid)
+            worker_exited(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if code == STARTUP_FAILURE:
+                self.failed = True
+            elif pid in self.recycling:
+                self.recycling.discard(pid)
+            elif not self.failed:
+                logger.warning("Worker [%d] exited with %d, replacing it", pid, code)
+                self.spawn()
+
+    def stop(self, sig: int) -> None:
+        """
+        Pass the signal on and wait for the workers to drain and shut down,
+        killing the ones still running after the drain and GRACEFUL_TIMEOUT
+        """
+        self.failed = True  # no replacements
+        # recycling workers are draining already, to them it would be a second signal
+        for pid in self.pids - self.recycling:
+            os.kill(pid, sig)
+        deadline = time.monotonic() + settings.DRAIN_TIMEOUT + CANCEL_GRACE + settings.GRACEFUL_TIMEOUT
+        while self.pids and time.monotonic() < deadline:
+            timeout = max(0.0, min(SUPERVISE_INTERVAL, deadline - time.monotonic()))
+            info = signal.sigtimedwait(HANDLED_SIGNALS, timeout)
+            if info and info.si_signo in (signal.SIGTERM, signal.SIGINT):
+                # a second signal skips the rest of the drain
+                for pid in self.pids:
+                    os.kill(pid, info.si_signo)
+            self.reap()
+        for pid in self.pids:
+            logger.warning("Killing worker [%d]", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            worker_exited(pid)
+        self.pids.clear()
+
+
+def run_worker(config: uvicorn.Config, sockets: List[socket], launcher_pid: int = 0) -> int:
+    max_requests = settings.MAX_REQUESTS
+    if max_requests and settings.MAX_REQUESTS_JITTER:
+        # workers forked together don't all recycle together
+        max_requests += random.randint(0, settings.MAX_REQUESTS_JITTER)
+    server = WorkerServer(config, max_requests=max_requests, launcher_pid=launcher_pid)
+    server.run(sockets=sockets)
+    return 0 if server.started else STARTUP_FAILURE
+
+
+def main() -> int:
+    config = server_config()
+    if settings.WORKERS > 1 and not settings.CHECKPOINT_DIR:
+        logger.warning(
+            "CHECKPOINT_DIR is not set, sessions moving between workers lose their history"
+        )
+    if settings.WORKERS > 1 and settings.ENABLE_METRICS and not MULTIPROC_DIR:
+        logger.warning(
+            "PROMETHEUS_MULTIPROC_DIR is not set, /metrics reports only the worker that answers"
+        )
+    clear_multiprocess_dir()
+    if settings.WORKERS == 1 and not settings.MAX_REQUESTS:
+        return run_worker(config, sockets=None)
+    # import the app once, the workers share it copy-on-write
+    config.load()
+    sock = config.bind_socket()
+    try:
+        return WorkerPool(config, [sock], settings.WORKERS).run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,27 @@
 """
 Computer Use Agent Service
-Simplified version for demo purposes
+Runs the sampling loop against the Anthropic API, or a simulated agent in demo mode
 """
 
 import asyncio
+import logging
+import time
 import uuid
-from datetime import datetime
-from typing import AsyncGenerator, Dict, Any, Optional, Callable
+from contextlib import aclosing
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncGenerator, Dict, Any, Optional, Callable, Set
 
 from app.core.config import settings
+from app.core.drain import DrainingError, drain
+from app.core.metrics import ACTIVE_SESSIONS, gauge_function, tool_action
+from app.core.tracing import STATUS_ERROR, Span, SpanExporter, span
 from app.models.session import Session, Message, ComputerUseEvent
 from app.models.schemas import SessionCreate, MessageCreate, ComputerUseEventCreate
+from app.services.computer_use.checkpoint import CheckpointStore, SessionCheckpoint
+from app.services.computer_use.history import ConversationHistory, estimate_request_tokens
+
+logger = logging.getLogger(__name__)
 
 
 class ComputerUseAgentService:
@@ -19,6 +30,13 @@ class ComputerUseAgentService:
     def __init__(self):
         self.active_sessions: Dict[str, Dict[str, Any]] = {}
         self.tool_version = "computer_use_20250124"  # Demo version
+        self._trace_library = None
+        self._span_exporter = (
+            SpanExporter(Path(settings.TRACE_EXPORT_PATH)) if settings.TRACE_EXPORT_PATH else None
+        )
+        self._checkpoints = (
+            CheckpointStore(Path(settings.CHECKPOINT_DIR)) if settings.CHECKPOINT_DIR else None
+        )
         
         # Simplified system prompt for demo
         self.system_prompt = f"""<SYSTEM_CAPABILITY>
@@ -30,6 +48,8 @@ class ComputerUseAgentService:
 
     async def create_session(self, session_data: SessionCreate, db_session) -> Session:
         """Create a new computer use agent session"""
+        if drain.draining:
+            raise DrainingError("Worker is draining, create the session on another one")
         session_id = str(uuid.uuid4())
         
         # Create session in database
@@ -39,6 +59,8 @@ class ComputerUseAgentService:
             system_prompt=session_data.system_prompt or self.system_prompt,
             model_name=session_data.model_name or settings.ANTHROPIC_MODEL,
             tool_version=session_data.tool_version or str(self.tool_version),
+            typing_delay_ms=session_data.typing_delay_ms,
+            paste_long_text=session_data.paste_long_text,
             status="active"
         )
         
@@ -47,14 +69,51 @@ class ComputerUseAgentService:
         await db_session.refresh(db_session_obj)
         
         # Store session in memory for active management
-        self.active_sessions[session_id] = {
+        self.active_sessions[session_id] = self._new_session_info(db_session_obj)
+        
+        return db_session_obj
+
+    def _new_session_info(self, db_session_obj: Session) -> Dict[str, Any]:
+        """Build the in-memory state of an active session"""
+        return {
             "db_session": db_session_obj,
             "messages": [],
+            "history": ConversationHistory(
+                images_to_keep=settings.ONLY_N_MOST_RECENT_IMAGES,
+                image_removal_threshold=settings.IMAGE_REMOVAL_THRESHOLD,
+                token_budget=settings.CONTEXT_TOKEN_BUDGET,
+                prompt_caching=settings.PROMPT_CACHING_ENABLED,
+            ),
             "status": "active",
-            "created_at": datetime.utcnow()
+            "created_at": datetime.utcnow(),
+            # messages stored for the session, to notice another worker took some
+            "message_count": 0,
+        }
+
+    def build_request_params(self, session_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the system prompt and messages for the next model call"""
+        history: ConversationHistory = session_info["history"]
+        db_session_obj = session_info["db_session"]
+        return {
+            "system": history.system_blocks(db_session_obj.system_prompt or self.system_prompt),
+            "messages": history.to_request_messages(),
         }
-        
-        return db_session_obj
+
+    async def record_usage(
+        self,
+        session_info: Dict[str, Any],
+        usage: Dict[str, Any],
+        db_session
+    ) -> Dict[str, int]:
+        """Record the token usage of one model turn on the session"""
+        turn = session_info["history"].record_usage(usage)
+        db_session_obj = session_info["db_session"]
+        for key, value in turn.items():
+            setattr(db_session_obj, key, (getattr(db_session_obj, key) or 0) + value)
+        # reassign so SQLAlchemy notices the change to the JSON column
+        db_session_obj.turn_usage = [*(db_session_obj.turn_usage or []), turn]
+        await db_session.commit()
+        return turn
 
     async def send_message(
         self, 
@@ -63,29 +122,25 @@ class ComputerUseAgentService:
         db_session,
         progress_callback: Optional[Callable] = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        """Send a message to the computer use agent and stream the response (demo version)"""
-        
-        # Check if session is in memory, if not load from database
-        if session_id not in self.active_sessions:
-            from sqlalchemy import select
-            
-            # Try to load session from database
-            session_stmt = select(Session).where(Session.session_id == session_id)
-            session_result = await db_session.execute(session_stmt)
-            db_session_obj = session_result.scalar_one_or_none()
-            
-            if not db_session_obj:
-                raise ValueError(f"Session {session_id} not found")
-            
-            # Add to active sessions
-            self.active_sessions[session_id] = {
-                "db_session": db_session_obj,
-                "messages": [],
-                "status": "active",
-                "created_at": datetime.utcnow()
-            }
-        
-        session_info = self.active_sessions[session_id]
+        """Send a message to the computer use agent and stream the response"""
+        if drain.draining:
+            raise DrainingError("Worker is draining, send the message to another one")
+        # a drain waits for the turn to finish, or cancels it
+        turn = drain.stream_turn(
+            session_id, self._send_message(session_id, user_message, db_session, progress_callback)
+        )
+        async with aclosing(turn):
+            async for chunk in turn:
+                yield chunk
+
+    async def _send_message(
+        self, 
+        session_id: str, 
+        user_message: str, 
+        db_session,
+        progress_callback: Optional[Callable] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        session_info = await self._load_session(session_id, db_session)
         
         # Store user message
         user_msg = Message(
@@ -96,8 +151,356 @@ class ComputerUseAgentService:
         )
         db_session.add(user_msg)
         await db_session.commit()
+        session_info["message_count"] += 1
+        session_info["history"].append_user_text(user_message)
+        
+        if settings.AGENT_MODE in ("live", "replay"):
+            responder = self._sampling_loop(session_info, user_message, db_session, progress_callback)
+        else:
+            responder = self._demo_response(session_info, user_message)
+        
+        assistant_texts = []
+        async for chunk in responder:
+            if chunk["type"] == "content":
+                assistant_texts.append(chunk["data"]["content"])
+            yield chunk
+        
+        # Store assistant message
+        assistant_msg = Message(
+            session_id=session_info["db_session"].id,
+            role="assistant",
+            content="\n\n".join(assistant_texts) or "Demo response completed",
+            message_type="text"
+        )
+        db_session.add(assistant_msg)
+        await db_session.commit()
+        session_info["message_count"] += 1
+        
+        # Mark session as completed
+        session_info["db_session"].status = "completed"
+        session_info["db_session"].completed_at = datetime.utcnow()
+        await db_session.commit()
         
-        # Simulate agent response for demo
+        yield {
+            "type": "complete",
+            "data": {"status": "completed"}
+        }
+        # after the client has its answer; the turn, which a drain waits for,
+        # lasts until the checkpoint is saved
+        await self.checkpoint(session_info, force=True)
+
+    async def _load_session(self, session_id: str, db_session) -> Dict[str, Any]:
+        """
+        In-memory state of a session, loaded from the database and its last
+        checkpoint when this worker doesn't hold it yet, or holds a copy that
+        is out of date because another worker has taken messages since
+        """
+        from sqlalchemy import select
+        
+        session_info = self.active_sessions.get(session_id)
+        if session_info is not None:
+            message_count = await self._message_count(session_info["db_session"].id, db_session)
+            if message_count == session_info["message_count"]:
+                return session_info
+            logger.info("Session %s moved on in another worker, reloading it", session_id)
+            await self._release(session_id, session_info)
+        
+        session_stmt = select(Session).where(Session.session_id == session_id)
+        session_result = await db_session.execute(session_stmt)
+        db_session_obj = session_result.scalar_one_or_none()
+        
+        if not db_session_obj:
+            raise ValueError(f"Session {session_id} not found")
+        
+        # Add to active sessions, where the last checkpoint left off
+        session_info = self._new_session_info(db_session_obj)
+        session_info["message_count"] = await self._message_count(db_session_obj.id, db_session)
+        await self._resume(session_info)
+        self.active_sessions[session_id] = session_info
+        return session_info
+
+    async def _message_count(self, session_pk: int, db_session) -> int:
+        from sqlalchemy import select, func
+        
+        count_stmt = select(func.count(Message.id)).where(Message.session_id == session_pk)
+        return (await db_session.execute(count_stmt)).scalar()
+
+    async def _release(self, session_id: str, session_info: Dict[str, Any]) -> None:
+        """Drop this worker's copy of a session and stop the processes its tools started"""
+        self.active_sessions.pop(session_id, None)
+        if "tools" in session_info:
+            from app.services.computer_use.tools.supervisor import supervisor
+            
+            # the bash shell and anything still running that the session started
+            await supervisor.terminate_session(session_id)
+
+    async def _sampling_loop(
+        self,
+        session_info: Dict[str, Any],
+        user_message: str,
+        db_session,
+        progress_callback: Optional[Callable] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Call the model and run the requested tools until it stops asking for them"""
+        from app.services.computer_use.tools.context import ToolContext
+        
+        client, tool_collection, tool_group = await self._get_backends(session_info, user_message)
+        db_session_obj = session_info["db_session"]
+        tool_context = ToolContext(
+            session_id=db_session_obj.session_id,
+            typing_delay_ms=db_session_obj.typing_delay_ms,
+            paste_long_text=bool(db_session_obj.paste_long_text),
+            progress=progress_callback,
+        )
+        betas = [tool_group.beta_flag] if tool_group.beta_flag else []
+        recorder = session_info.get("recorder")
+        if recorder:
+            recorder.record_user(user_message)
+        
+        model = db_session_obj.model_name or settings.ANTHROPIC_MODEL
+        turn = Span.start("agent.turn", session_id=db_session_obj.session_id, model=model)
+        try:
+            while True:
+                request_params = self.build_request_params(session_info)
+                tools = tool_collection.to_params()
+                # the usage the API reports counts them too, see trim_to_budget
+                session_info["history"].overhead_tokens = estimate_request_tokens(
+                    [], request_params["system"], tools
+                )
+                with span("model.call", parent=turn, model=model) as model_span:
+                    response = await client.create_message(
+                        model=model,
+                        max_tokens=settings.MAX_OUTPUT_TOKENS,
+                        tools=tools,
+                        betas=betas,
+                        **request_params,
+                    )
+                self._add_event(
+                    db_session, session_info, model_span, "model_call",
+                    input_data={
+                        "model": model,
+                        "messages": len(request_params["messages"]),
+                        # changes whenever the tool definitions, and so the prompt cache prefix, do
+                        "tools": tool_collection.definitions.digest,
+                    },
+                    output_data={
+                        "stop_reason": response.get("stop_reason"),
+                        "usage": response.get("usage"),
+                    },
+                )
+                with span("db.commit", parent=turn):
+                    await self.record_usage(session_info, response.get("usage") or {}, db_session)
+                session_info["history"].append({"role": "assistant", "content": response["content"]})
+                
+                tool_results = []
+                for block in response["content"]:
+                    if block["type"] == "text":
+                        yield {
+                            "type": "content",
+                            "data": {
+                                "role": "assistant",
+                                "content": block["text"],
+                                "message_type": "text"
+                            }
+                        }
+                    elif block["type"] == "tool_use":
+                        yield {
+                            "type": "tool_call",
+                            "data": {
+                                "tool_name": block["name"],
+                                "input": block["input"]
+                            }
+                        }
+                        with span(
+                            "tool.call", parent=turn,
+                            tool=block["name"], action=tool_action(block["input"]),
+                        ) as tool_span:
+                            tool_result = await self._execute_tool_call(
+                                tool_collection, block, tool_context
+                            )
+                            if tool_result["is_error"]:
+                                tool_span.fail(_tool_result_text(tool_result))
+                        self._add_event(
+                            db_session, session_info, tool_span, "tool_call",
+                            tool_name=block["name"],
+                            input_data=block["input"],
+                            output_data={"is_error": tool_result["is_error"]},
+                        )
+                        tool_results.append(tool_result)
+                        yield {
+                            "type": "tool_result",
+                            "data": {
+                                "tool_name": block["name"],
+                                "is_error": tool_result["is_error"],
+                                "output": _tool_result_text(tool_result)
+                            }
+                        }
+                
+                if not tool_results:
+                    return
+                session_info["history"].append({"role": "user", "content": tool_results})
+                await self.checkpoint(session_info)
+        finally:
+            turn.end()
+            if recorder:
+                await recorder.flush()
+            if self._span_exporter:
+                await asyncio.to_thread(self._span_exporter.export, turn)
+
+    def _add_event(
+        self,
+        db_session,
+        session_info: Dict[str, Any],
+        event_span: Span,
+        event_type: str,
+        tool_name: Optional[str] = None,
+        input_data: Optional[Dict[str, Any]] = None,
+        output_data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Store a finished span as a ComputerUseEvent, committed with the next turn"""
+        db_session.add(ComputerUseEvent(
+            session_id=session_info["db_session"].id,
+            event_type=event_type,
+            tool_name=tool_name,
+            input_data=input_data,
+            output_data={
+                **(output_data or {}),
+                "trace_id": event_span.trace_id,
+                "span_id": event_span.span_id,
+                "spans": event_span.breakdown(),
+            },
+            status="failed" if event_span.status == STATUS_ERROR else "completed",
+            error_message=event_span.status_message,
+            timestamp=datetime.fromtimestamp(event_span.start_ns / 1e9, timezone.utc),
+            duration_ms=event_span.duration_ms,
+        ))
+
+    async def _get_backends(self, session_info: Dict[str, Any], user_message: str):
+        """Model client and tool collection of a session, created on first use"""
+        from app.services.computer_use.tools import TOOL_GROUPS_BY_VERSION
+        
+        tool_version = session_info["db_session"].tool_version or self.tool_version
+        tool_group = TOOL_GROUPS_BY_VERSION[tool_version]
+        if "tools" in session_info:
+            return session_info["client"], session_info["tools"], tool_group
+        
+        if settings.AGENT_MODE == "replay":
+            from app.services.computer_use import replay
+            
+            if self._trace_library is None:
+                self._trace_library = await asyncio.to_thread(
+                    replay.TraceLibrary, Path(settings.AGENT_TRACE_DIR), speed=settings.REPLAY_SPEED
+                )
+            replayer = await asyncio.to_thread(self._trace_library.replayer_for, user_message)
+            if replayer is None:
+                raise ValueError(f"No replay traces found in {settings.AGENT_TRACE_DIR}")
+            session_info["client"] = replay.ReplayClient(replayer)
+            session_info["tools"] = replay.ReplayToolCollection(replayer)
+        elif settings.AGENT_RECORD_TRACES:
+            from app.services.computer_use import replay
+            from app.services.computer_use.client import get_client
+            
+            session_id = session_info["db_session"].session_id
+            recorder = replay.TraceRecorder(
+                Path(settings.AGENT_TRACE_DIR) / f"{session_id}{replay.TRACE_SUFFIX}",
+                session_id=session_id,
+                tool_version=tool_version,
+                tools=tool_group.definitions().params,
+            )
+            session_info["recorder"] = recorder
+            session_info["client"] = replay.RecordingClient(get_client(), recorder)
+            session_info["tools"] = tool_group.collection(
+                replay.RecordingToolCollection, recorder=recorder
+            )
+        else:
+            from app.services.computer_use.client import get_client
+            
+            session_info["client"] = get_client()
+            session_info["tools"] = tool_group.collection()
+        if "tool_state" in session_info:
+            session_info["tools"].restore_state(session_info.pop("tool_state"))
+        return session_info["client"], session_info["tools"], tool_group
+
+    async def checkpoint(self, session_info: Dict[str, Any], force: bool = False) -> None:
+        """Save the session's history and tool state, at most every CHECKPOINT_INTERVAL unless forced"""
+        if self._checkpoints is None:
+            return
+        now = time.monotonic()
+        if not force and now - session_info.get("checkpointed_at", 0.0) < settings.CHECKPOINT_INTERVAL:
+            return
+        if "tools" in session_info:
+            tool_state = await session_info["tools"].checkpoint_state()
+        else:
+            # restored but not used yet
+            tool_state = session_info.get("tool_state") or {}
+        checkpoint = SessionCheckpoint.of(
+            session_info["db_session"].session_id, session_info["history"], tool_state
+        )
+        try:
+            await asyncio.to_thread(self._checkpoints.save, checkpoint)
+        except OSError as e:
+            logger.warning("Checkpoint of session %s failed: %s", checkpoint.session_id, e)
+            return
+        session_info["checkpointed_at"] = now
+
+    async def drain(self, interrupted: Set[str]) -> None:
+        """
+        Flush what the sessions buffer before the worker exits; sessions whose
+        turn was `interrupted` keep their last checkpoint, taken between steps.
+        """
+        for session_id, session_info in list(self.active_sessions.items()):
+            if session_id not in interrupted:
+                await self.checkpoint(session_info, force=True)
+            recorder = session_info.get("recorder")
+            if recorder:
+                await recorder.flush()
+
+    async def _resume(self, session_info: Dict[str, Any]) -> None:
+        """Restore the history and tool state of a session from its last checkpoint"""
+        if self._checkpoints is None:
+            return
+        session_id = session_info["db_session"].session_id
+        start = time.perf_counter()
+        try:
+            checkpoint = await asyncio.to_thread(self._checkpoints.load, session_id)
+        except (OSError, ValueError) as e:
+            logger.warning("Checkpoint of session %s is unreadable: %s", session_id, e)
+            return
+        if checkpoint is None:
+            return
+        checkpoint.restore(session_info["history"])
+        # applied to the tools when they are created
+        session_info["tool_state"] = checkpoint.tool_state
+        logger.info(
+            "Resumed session %s from its checkpoint in %.1fms",
+            session_id, (time.perf_counter() - start) * 1000,
+        )
+
+    async def _execute_tool_call(
+        self, tool_collection, block: Dict[str, Any], tool_context
+    ) -> Dict[str, Any]:
+        """Run one tool_use block and convert the result to a tool_result block"""
+        from app.services.computer_use.tools.context import use_context
+        
+        with use_context(tool_context):
+            result = await tool_collection.run(name=block["name"], tool_input=block["input"])
+        return _make_api_tool_result(result, block["id"])
+
+    async def _demo_response(
+        self,
+        session_info: Dict[str, Any],
+        user_message: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Simulate agent response for demo"""
+        texts = []
+        async for chunk in self._demo_chunks(user_message):
+            if chunk["type"] == "content":
+                texts.append(chunk["data"]["content"])
+            yield chunk
+        session_info["history"].append_assistant_text("\n\n".join(texts))
+
+    async def _demo_chunks(self, user_message: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """Scripted responses used in demo mode"""
         if "weather" in user_message.lower() and "dubai" in user_message.lower():
             # Simulate weather search for Dubai
             yield {
@@ -109,7 +512,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "tool_call",
@@ -119,7 +522,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "tool_call",
@@ -129,7 +532,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "tool_call",
@@ -139,7 +542,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "content",
@@ -161,7 +564,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "tool_call",
@@ -171,7 +574,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "tool_call",
@@ -181,7 +584,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "tool_call",
@@ -191,7 +594,7 @@ class ComputerUseAgentService:
                 }
             }
             
-            await asyncio.sleep(1)
+            await asyncio.sleep(settings.DEMO_STEP_DELAY)
             
             yield {
                 "type": "content",
@@ -211,31 +614,6 @@ class ComputerUseAgentService:
                     "message_type": "text"
                 }
             }
-        
-        # Store assistant message
-        assistant_msg = Message(
-            session_id=session_info["db_session"].id,
-            role="assistant",
-            content="Demo response completed",
-            message_type="text"
-        )
-        db_session.add(assistant_msg)
-        await db_session.commit()
-        
-        # Mark session as completed
-        session_info["db_session"].status = "completed"
-        session_info["db_session"].completed_at = datetime.utcnow()
-        await db_session.commit()
-        
-        yield {
-            "type": "complete",
-            "data": {"status": "completed"}
-        }
-
-    # Simplified tool execution for demo
-    async def _execute_tool_call(self, *args, **kwargs):
-        """Placeholder for tool execution (demo version)"""
-        pass
 
     async def get_session_history(self, session_id: str, db_session) -> Dict[str, Any]:
         """Get complete session history including messages and events"""
@@ -295,14 +673,70 @@ class ComputerUseAgentService:
         }
 
     async def close_session(self, session_id: str, db_session) -> bool:
-        """Close an active session"""
+        """Close a session, wherever it was last active"""
         
-        if session_id not in self.active_sessions:
-            return False
+        from sqlalchemy import select
         
-        session_info = self.active_sessions[session_id]
-        session_info["db_session"].status = "cancelled"
+        # the session may be held by another worker, update it in the database
+        session_stmt = select(Session).where(Session.session_id == session_id)
+        db_session_obj = (await db_session.execute(session_stmt)).scalar_one_or_none()
+        if not db_session_obj:
+            return False
+        db_session_obj.status = "cancelled"
         await db_session.commit()
         
-        del self.active_sessions[session_id]
+        if self._checkpoints is not None:
+            await asyncio.to_thread(self._checkpoints.delete, session_id)
+        session_info = self.active_sessions.get(session_id)
+        if session_info is not None:
+            await self._release(session_id, session_info)
         return True
+
+
+# Shared by the REST and WebSocket routers so both see the same active sessions
+agent_service = ComputerUseAgentService()
+gauge_function(ACTIVE_SESSIONS, lambda: len(agent_service.active_sessions))
+
+
+def _maybe_prepend_system_tool_result(result, result_text: str) -> str:
+    if result.system:
+        result_text = f"<system>{result.system}</system>\n{result_text}"
+    return result_text
+
+
+def _make_api_tool_result(result, tool_use_id: str) -> Dict[str, Any]:
+    """Convert a ToolResult to a tool_result content block for the API"""
+    tool_result_content: Any = []
+    is_error = False
+    if result.error:
+        is_error = True
+        tool_result_content = _maybe_prepend_system_tool_result(result, result.error)
+    else:
+        if result.output:
+            tool_result_content.append({
+                "type": "text",
+                "text": _maybe_prepend_system_tool_result(result, result.output),
+            })
+        if result.image:
+            tool_result_content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": result.image.media_type,
+                    "data": result.image.base64,
+                },
+            })
+    return {
+        "type": "tool_result",
+        "content": tool_result_content,
+        "tool_use_id": tool_use_id,
+        "is_error": is_error,
+    }
+
+
+def _tool_result_text(tool_result: Dict[str, Any]) -> str:
+    """Text part of a tool_result block, for streaming to clients without images"""
+    content = tool_result["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(block["text"] for block in content if block["type"] == "text")
@@ -0,0 +1,152 @@
+"""
+Checkpoints of agent sessions, to resume them after a worker restart
+
+A checkpoint holds what the database doesn't: the conversation history sent to
+the model and the state of the session's tools (the bash shell's working
+directory and the variables it changed, without secrets). Screenshots are stored next to it once each,
+as PNG files named by the sha1 of their base64 text, and referenced from the
+history, so checkpointing a session again only writes its new images.
+
+Layout of CHECKPOINT_DIR:
+    <session_id>/checkpoint.json.gz   {"version": 1, "session_id": ..., "saved_at": ...,
+                                       "messages": [...], "last_input_tokens": ...,
+                                       "tool_state": {tool name: state}}
+    <session_id>/<sha1>.png           images referenced as {"type": "ref", "id": sha1, ...}
+"""
+
+import base64
+import copy
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.services.computer_use.history import ConversationHistory, Message
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FILE = "checkpoint.json.gz"
+
+
+@dataclass
+class SessionCheckpoint:
+    session_id: str
+    messages: List[Message]
+    last_input_tokens: Optional[int] = None
+    tool_state: Dict[str, Any] = field(default_factory=dict)
+    saved_at: float = 0.0
+
+    @classmethod
+    def of(
+        cls, session_id: str, history: ConversationHistory, tool_state: Dict[str, Any]
+    ) -> "SessionCheckpoint":
+        """Snapshot a session; the copy can be saved while the session goes on"""
+        return cls(
+            session_id=session_id,
+            messages=copy.deepcopy(history.messages),
+            last_input_tokens=history.last_input_tokens,
+            tool_state=copy.deepcopy(tool_state),
+            saved_at=time.time(),
+        )
+
+    def restore(self, history: ConversationHistory) -> None:
+        history.messages = self.messages
+        history.last_input_tokens = self.last_input_tokens
+
+
+def _image_sources(messages: List[Message]) -> Iterator[Dict[str, Any]]:
+    """The `source` of every image block, including those inside tool results"""
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                blocks = block["content"]
+            else:
+                blocks = [block]
+            for item in blocks:
+                if isinstance(item, dict) and item.get("type") == "image":
+                    yield item["source"]
+
+
+class CheckpointStore:
+    """Session checkpoints in a local directory; the methods do blocking file I/O"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def _session_dir(self, session_id: str) -> Path:
+        return self.directory / session_id
+
+    def save(self, checkpoint: SessionCheckpoint) -> None:
+        """Write a checkpoint, replacing the previous one atomically"""
+        session_dir = self._session_dir(checkpoint.session_id)
+        # conversations can hold anything the user typed
+        session_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        referenced = set()
+        for source in _image_sources(checkpoint.messages):
+            if source.get("type") != "base64":
+                continue
+            image_id = hashlib.sha1(source["data"].encode()).hexdigest()
+            image_path = session_dir / f"{image_id}.png"
+            if not image_path.exists():
+                tmp_path = image_path.with_suffix(".tmp")
+                tmp_path.write_bytes(base64.b64decode(source["data"]))
+                os.replace(tmp_path, image_path)
+            referenced.add(image_path.name)
+            # the snapshot is a copy, the live history keeps its data
+            source["type"] = "ref"
+            source["id"] = image_id
+            del source["data"]
+
+        payload = {
+            "version": CHECKPOINT_VERSION,
+            "session_id": checkpoint.session_id,
+            "saved_at": checkpoint.saved_at,
+            "messages": checkpoint.messages,
+            "last_input_tokens": checkpoint.last_input_tokens,
+            "tool_state": checkpoint.tool_state,
+        }
+        tmp_path = session_dir / f"{CHECKPOINT_FILE}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, session_dir / CHECKPOINT_FILE)
+
+        # images that dropped out of the history
+        for image_path in session_dir.glob("*.png"):
+            if image_path.name not in referenced:
+                image_path.unlink(missing_ok=True)
+
+    def load(self, session_id: str) -> Optional[SessionCheckpoint]:
+        """The latest checkpoint of a session, or None if it has none"""
+        session_dir = self._session_dir(session_id)
+        try:
+            with gzip.open(session_dir / CHECKPOINT_FILE, "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return None
+        if payload.get("version") != CHECKPOINT_VERSION:
+            return None
+
+        messages = payload["messages"]
+        for source in _image_sources(messages):
+            if source.get("type") == "ref":
+                data = (session_dir / f"{source.pop('id')}.png").read_bytes()
+                source["type"] = "base64"
+                source["data"] = base64.b64encode(data).decode("ascii")
+        return SessionCheckpoint(
+            session_id=session_id,
+            messages=messages,
+            last_input_tokens=payload.get("last_input_tokens"),
+            tool_state=payload.get("tool_state") or {},
+            saved_at=payload.get("saved_at", 0.0),
+        )
+
+    def delete(self, session_id: str) -> None:
+        shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
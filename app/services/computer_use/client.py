@@ -0,0 +1,301 @@
+"""
+Shared async Anthropic Messages API client
+
+A single client is shared by every session in the process:
+- one pooled httpx client with HTTP/2 keep-alive
+- exponential backoff with jitter on 429/529, honoring `retry-after`
+- token buckets for requests and tokens per minute, shared across sessions
+- `max_tokens` clamped to what the requested model can produce
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.computer_use.history import estimate_request_tokens
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_VERSION = "2023-06-01"
+RETRYABLE_STATUS_CODES = {429, 529}
+# up to this fraction of `retry-after` is added to it
+RETRY_AFTER_JITTER = 0.2
+# the request never reached the API, so it is safe to send again
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Output token limits by model name prefix, the longest matching prefix wins
+MODEL_MAX_OUTPUT_TOKENS = {
+    "claude-3-haiku": 4096,
+    "claude-3-opus": 4096,
+    "claude-3-5-haiku": 8192,
+    "claude-3-5-sonnet": 8192,
+    "claude-3-7-sonnet": 64000,
+    "claude-sonnet-4": 64000,
+    "claude-opus-4": 32000,
+}
+
+
+def max_output_tokens(model: str, requested: int) -> int:
+    """`requested`, lowered to the model's output limit when it is known"""
+    prefixes = [prefix for prefix in MODEL_MAX_OUTPUT_TOKENS if model.startswith(prefix)]
+    if not prefixes:
+        return requested
+    return min(requested, MODEL_MAX_OUTPUT_TOKENS[max(prefixes, key=len)])
+
+
+class AnthropicAPIError(Exception):
+    """Raised when the Messages API returns an error that is not retried"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Anthropic API error {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `capacity` per minute"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.level = float(capacity)
+        self._rate = capacity / 60.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self, amount: int = 1) -> float:
+        """Wait until `amount` tokens are available and take them; returns the wait"""
+        # a single request larger than the bucket can never fit, cap it
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return waited
+                delay = (amount - self.level) / self._rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def adjust(self, amount: int) -> None:
+        """Give back (positive) or charge extra (negative) tokens after the fact"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def clamp(self, remaining: int) -> None:
+        """Never believe we have more capacity than the server says we have"""
+        self._refill()
+        self.level = min(self.level, float(remaining))
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by all sessions"""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens:
+            waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        if self.tokens:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def refund(self, estimated_tokens: int) -> None:
+        """Give back the tokens of an attempt the API did not process"""
+        self.reconcile(estimated_tokens, 0)
+
+    def observe(self, headers: httpx.Headers) -> None:
+        """Follow the server's view of the remaining quota"""
+        requests_remaining = headers.get("anthropic-ratelimit-requests-remaining")
+        if self.requests and requests_remaining is not None:
+            self.requests.clamp(int(requests_remaining))
+        tokens_remaining = headers.get(
+            "anthropic-ratelimit-input-tokens-remaining"
+        ) or headers.get("anthropic-ratelimit-tokens-remaining")
+        if self.tokens and tokens_remaining is not None:
+            self.tokens.clamp(int(tokens_remaining))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a `retry-after` header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+class AnthropicClient:
+    """Pooled async client for the Messages API"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.anthropic.com",
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        timeout: float = 600.0,
+        max_retries: int = 5,
+        initial_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        max_retry_after: float = 120.0,
+        rate_limiter: Optional[RateLimiter] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                "x-api-key": api_key,
+                "anthropic-version": ANTHROPIC_VERSION,
+                "content-type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            transport=transport,
+        )
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # never before the server allows it; sessions told the same time spread out
+            return retry_after * (1 + random.uniform(0, RETRY_AFTER_JITTER))
+        # full jitter
+        return random.uniform(0, min(self.max_backoff, self.initial_backoff * 2 ** attempt))
+
+    async def create_message(
+        self,
+        *,
+        messages: List[Dict[str, Any]],
+        betas: Optional[List[str]] = None,
+        **params: Any,
+    ) -> Dict[str, Any]:
+        """POST /v1/messages and return the decoded response body"""
+        headers = {"anthropic-beta": ",".join(betas)} if betas else None
+        if "model" in params and "max_tokens" in params:
+            params["max_tokens"] = max_output_tokens(params["model"], params["max_tokens"])
+        body = {"messages": messages, **params}
+        estimated_tokens = estimate_request_tokens(
+            messages, params.get("system"), params.get("tools")
+        )
+
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(estimated_tokens)
+            try:
+                response = await self._http.post("/v1/messages", json=body, headers=headers)
+            except RETRYABLE_TRANSPORT_ERRORS as e:
+                # other transport errors, like a read timeout, may come after the
+                # API processed the request and are not retried
+                self.rate_limiter.refund(estimated_tokens)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, None)
+                logger.warning("Anthropic request failed (%s), retrying in %.2fs", e, delay)
+            else:
+                if response.status_code >= 400:
+                    self.rate_limiter.refund(estimated_tokens)
+                self.rate_limiter.observe(response.headers)
+                if response.status_code < 400:
+                    data = response.json()
+                    usage = data.get("usage") or {}
+                    self.rate_limiter.reconcile(
+                        estimated_tokens,
+                        int(usage.get("input_tokens") or 0)
+                        + int(usage.get("cache_creation_input_tokens") or 0),
+                    )
+                    return data
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                if (
+                    response.status_code not in RETRYABLE_STATUS_CODES
+                    or attempt >= self.max_retries
+                    # rather than holding the turn for that long
+                    or (retry_after is not None and retry_after > self.max_retry_after)
+                ):
+                    raise AnthropicAPIError(response.status_code, response.text)
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(
+                    "Anthropic API returned %s, retrying in %.2fs",
+                    response.status_code,
+                    delay,
+                )
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_client: Optional[AnthropicClient] = None
+
+
+def per_worker(limit: int) -> int:
+    """Share of an account-wide per-minute limit for each of the WORKERS processes"""
+    if limit <= 0:
+        return limit
+    return max(1, limit // max(1, settings.WORKERS))
+
+
+def get_client() -> AnthropicClient:
+    """Return the process-wide client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = AnthropicClient(
+            api_key=settings.ANTHROPIC_API_KEY,
+            base_url=settings.ANTHROPIC_BASE_URL,
+            max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+            http2=settings.ANTHROPIC_HTTP2,
+            timeout=settings.ANTHROPIC_TIMEOUT,
+            max_retries=settings.ANTHROPIC_MAX_RETRIES,
+            max_retry_after=settings.ANTHROPIC_MAX_RETRY_AFTER,
+            rate_limiter=RateLimiter(
+                requests_per_minute=per_worker(settings.ANTHROPIC_REQUESTS_PER_MINUTE),
+                tokens_per_minute=per_worker(settings.ANTHROPIC_TOKENS_PER_MINUTE),
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the process-wide client, if it was created"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
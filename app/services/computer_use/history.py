@@ -0,0 +1,350 @@
+"""
+Conversation history management for computer use agent sessions
+
+Keeps the message list sent to the model small and cache friendly:
+- cache-control breakpoints on the stable prefix (system prompt, recent user turns)
+- only the N most recent screenshots are kept, older ones become placeholders
+- once the estimated token count exceeds the budget, the oldest turns are trimmed
+  and replaced by a short summary
+"""
+
+import copy
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+Message = Dict[str, Any]
+
+IMAGE_PLACEHOLDER = "[screenshot omitted to save context]"
+TRIMMED_SUMMARY_PREFIX = "[earlier conversation trimmed to save context]"
+TRIMMED_COUNT = re.compile(re.escape(TRIMMED_SUMMARY_PREFIX) + r" (\d+) messages removed\.")
+# trimming leaves room below the budget, so the next turns don't trim again
+TRIM_TARGET_RATIO = 0.8
+
+# Rough token costs used when the API has not reported usage yet
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1600
+# Anthropic-defined tools (computer, bash, editor) come with a prompt of their own
+DEFINED_TOOL_TOKENS = 700
+
+# The API allows at most 4 cache breakpoints: 1 for the system prompt, the rest
+# on the most recent user turns so each new turn reads the previous turn's cache
+CACHE_BREAKPOINTS_ON_USER_TURNS = 3
+
+
+def _content_blocks(message: Message) -> List[Dict[str, Any]]:
+    content = message.get("content")
+    if isinstance(content, list):
+        return content
+    return []
+
+
+def _is_tool_result_turn(message: Message) -> bool:
+    return message.get("role") == "user" and any(
+        block.get("type") == "tool_result" for block in _content_blocks(message)
+    )
+
+
+def _estimate_block_tokens(block: Any) -> int:
+    if isinstance(block, str):
+        return len(block) // CHARS_PER_TOKEN
+    block_type = block.get("type")
+    if block_type == "image":
+        return IMAGE_TOKENS
+    if block_type == "text":
+        return len(block.get("text", "")) // CHARS_PER_TOKEN
+    if block_type == "tool_use":
+        return len(str(block.get("input", ""))) // CHARS_PER_TOKEN
+    if block_type == "tool_result":
+        content = block.get("content") or []
+        if isinstance(content, str):
+            return len(content) // CHARS_PER_TOKEN
+        return sum(_estimate_block_tokens(item) for item in content)
+    return len(str(block)) // CHARS_PER_TOKEN
+
+
+def estimate_tokens(messages: List[Message]) -> int:
+    """Cheap, local estimate of the input tokens used by a message list."""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += _estimate_block_tokens(content)
+        else:
+            total += sum(_estimate_block_tokens(block) for block in content or [])
+    return total
+
+
+def estimate_request_tokens(
+    messages: List[Message],
+    system: Any = None,
+    tools: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """Estimate of the input tokens of a whole request: system prompt, tools and messages."""
+    total = estimate_tokens(messages)
+    if isinstance(system, str):
+        total += _estimate_block_tokens(system)
+    elif system:
+        total += sum(_estimate_block_tokens(block) for block in system)
+    for tool in tools or []:
+        if "input_schema" in tool:
+            total += len(str(tool)) // CHARS_PER_TOKEN
+        else:
+            total += DEFINED_TOOL_TOKENS
+    return total
+
+
+def filter_to_n_most_recent_images(
+    messages: List[Message],
+    images_to_keep: int,
+    min_removal_threshold: int,
+) -> int:
+    """
+    Replace all but the `images_to_keep` most recent images with a text placeholder.
+
+    Images are removed in chunks of `min_removal_threshold` so that the cached prefix
+    only changes every few turns instead of on every turn. Returns the number of
+    images replaced. Mutates `messages` in place.
+    """
+    tool_results = [
+        block
+        for message in messages
+        for block in _content_blocks(message)
+        if block.get("type") == "tool_result"
+    ]
+    total_images = sum(
+        1
+        for tool_result in tool_results
+        for item in tool_result.get("content") or []
+        if isinstance(item, dict) and item.get("type") == "image"
+    )
+
+    images_to_remove = total_images - images_to_keep
+    if images_to_remove <= 0:
+        return 0
+    if min_removal_threshold > 1:
+        images_to_remove -= images_to_remove % min_removal_threshold
+
+    removed = 0
+    for tool_result in tool_results:
+        if removed >= images_to_remove:
+            break
+        content = tool_result.get("content")
+        if not isinstance(content, list):
+            continue
+        new_content = []
+        for item in content:
+            if (
+                removed < images_to_remove
+                and isinstance(item, dict)
+                and item.get("type") == "image"
+            ):
+                new_content.append({"type": "text", "text": IMAGE_PLACEHOLDER})
+                removed += 1
+            else:
+                new_content.append(item)
+        tool_result["content"] = new_content
+    return removed
+
+
+def inject_prompt_caching(messages: List[Message], breakpoints: int) -> None:
+    """
+    Set cache breakpoints on the last content block of the `breakpoints` most recent
+    user turns and clear them on every older turn. Mutates `messages` in place.
+    """
+    remaining = breakpoints
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        blocks = _content_blocks(message)
+        if not blocks:
+            continue
+        if remaining:
+            remaining -= 1
+            blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        else:
+            blocks[-1].pop("cache_control", None)
+
+
+def _summary_text(message: Message) -> Optional[str]:
+    """Text of a summary message left by an earlier trim, None for other messages"""
+    blocks = _content_blocks(message)
+    if message.get("role") == "user" and len(blocks) == 1 and blocks[0].get("type") == "text":
+        text = blocks[0].get("text", "")
+        if text.startswith(TRIMMED_SUMMARY_PREFIX):
+            return text
+    return None
+
+
+def summarize_messages(messages: List[Message], previous: Optional[str] = None) -> str:
+    """
+    Build a compact, deterministic summary of trimmed messages. The details of
+    a `previous` summary, which they replace, are carried over.
+    """
+    tool_calls: Counter = Counter()
+    user_requests: List[str] = []
+    for message in messages:
+        content = message.get("content")
+        if message.get("role") == "user" and isinstance(content, str):
+            user_requests.append(content)
+        for block in _content_blocks(message):
+            if block.get("type") == "tool_use":
+                tool_calls[block.get("name", "unknown")] += 1
+            elif (
+                message.get("role") == "user"
+                and block.get("type") == "text"
+                and not block.get("text", "").startswith(TRIMMED_SUMMARY_PREFIX)
+            ):
+                user_requests.append(block.get("text", ""))
+
+    removed = len(messages)
+    earlier: List[str] = []
+    if previous:
+        header, *earlier = previous.split("\n")
+        match = TRIMMED_COUNT.match(header)
+        if match:
+            removed += int(match.group(1))
+    parts = [f"{TRIMMED_SUMMARY_PREFIX} {removed} messages removed.", *earlier]
+    if user_requests:
+        parts.append(
+            "Earlier user requests: "
+            + "; ".join(request[:200] for request in user_requests[-5:])
+        )
+    if tool_calls:
+        parts.append(
+            "Tools used: "
+            + ", ".join(f"{name} x{count}" for name, count in sorted(tool_calls.items()))
+        )
+    return "\n".join(parts)
+
+
+TRIM_ACKNOWLEDGEMENT: Message = {"role": "assistant", "content": [{"type": "text", "text": "Understood."}]}
+
+
+class ConversationHistory:
+    """Message history of a single agent session, kept within a token budget"""
+
+    def __init__(
+        self,
+        images_to_keep: Optional[int] = 3,
+        image_removal_threshold: int = 3,
+        token_budget: Optional[int] = None,
+        prompt_caching: bool = True,
+    ):
+        self.messages: List[Message] = []
+        self.images_to_keep = images_to_keep
+        self.image_removal_threshold = image_removal_threshold
+        self.token_budget = token_budget
+        self.prompt_caching = prompt_caching
+        # input tokens reported by the API for the last request, including cache
+        self.last_input_tokens: Optional[int] = None
+        # estimate of the system prompt and tools sent with the messages
+        self.overhead_tokens = 0
+
+    def append(self, message: Message) -> None:
+        """Append a message and enforce the image and token limits."""
+        self.messages.append(message)
+        self.compact()
+
+    def append_user_text(self, text: str) -> None:
+        self.append({"role": "user", "content": [{"type": "text", "text": text}]})
+
+    def append_assistant_text(self, text: str) -> None:
+        self.append({"role": "assistant", "content": [{"type": "text", "text": text}]})
+
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.messages)
+
+    def compact(self) -> None:
+        """Drop old screenshots, then trim the oldest turns if over budget."""
+        if self.images_to_keep is not None:
+            filter_to_n_most_recent_images(
+                self.messages, self.images_to_keep, self.image_removal_threshold
+            )
+        if self.token_budget:
+            self.trim_to_budget(self.token_budget)
+
+    def trim_to_budget(self, token_budget: int) -> int:
+        """
+        Remove the oldest turns until the request fits in `token_budget` tokens,
+        counting the system prompt and tools in `overhead_tokens` like the API
+        usage in `last_input_tokens` does.
+
+        The history is only cut right before a plain user turn, so tool_use blocks are
+        never separated from their tool_result. The removed turns are replaced by a
+        summary message, which carries over the summary of earlier trims. The cut
+        aims for TRIM_TARGET_RATIO of the budget; a trim that can't get under the
+        budget isn't made, as it would only change the cached prefix. Returns the
+        number of messages removed.
+        """
+        current = max(
+            estimate_tokens(self.messages) + self.overhead_tokens, self.last_input_tokens or 0
+        )
+        if current <= token_budget:
+            return 0
+
+        previous = _summary_text(self.messages[0]) if self.messages else None
+        # an earlier summary and its acknowledgement are replaced, not counted as removed
+        start = 2 if previous else 0
+        target = int(token_budget * TRIM_TARGET_RATIO)
+        best = None
+        # the most recent message is always kept
+        for index in range(start + 1, len(self.messages)):
+            message = self.messages[index]
+            if message.get("role") != "user" or _is_tool_result_turn(message):
+                continue
+            kept = estimate_tokens(self.messages[index:]) + self.overhead_tokens
+            if kept > token_budget:
+                continue
+            summary = {
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": summarize_messages(self.messages[start:index], previous),
+                }],
+            }
+            total = kept + estimate_tokens([summary, TRIM_ACKNOWLEDGEMENT])
+            if total > token_budget:
+                continue
+            best = index, summary
+            if total <= target:
+                break
+        if best is None:
+            return 0
+
+        cut, summary = best
+        # keep user/assistant alternation: summary + acknowledgement precede the cut
+        self.messages = [summary, copy.deepcopy(TRIM_ACKNOWLEDGEMENT), *self.messages[cut:]]
+        self.last_input_tokens = None
+        return cut - start
+
+    def system_blocks(self, system_prompt: str) -> List[Dict[str, Any]]:
+        """System prompt as content blocks, with a cache breakpoint at its end."""
+        block: Dict[str, Any] = {"type": "text", "text": system_prompt}
+        if self.prompt_caching:
+            block["cache_control"] = {"type": "ephemeral"}
+        return [block]
+
+    def to_request_messages(self) -> List[Message]:
+        """Messages for the next model request, with cache breakpoints applied."""
+        messages = copy.deepcopy(self.messages)
+        if self.prompt_caching:
+            inject_prompt_caching(messages, CACHE_BREAKPOINTS_ON_USER_TURNS)
+        return messages
+
+    def record_usage(self, usage: Dict[str, Any]) -> Dict[str, int]:
+        """Normalize an API `usage` payload and remember the prompt size."""
+        turn = {
+            "input_tokens": int(usage.get("input_tokens") or 0),
+            "cache_creation_input_tokens": int(
+                usage.get("cache_creation_input_tokens") or 0
+            ),
+            "cache_read_input_tokens": int(usage.get("cache_read_input_tokens") or 0),
+            "output_tokens": int(usage.get("output_tokens") or 0),
+        }
+        self.last_input_tokens = (
+            turn["input_tokens"]
+            + turn["cache_creation_input_tokens"]
+            + turn["cache_read_input_tokens"]
+        )
+        return turn
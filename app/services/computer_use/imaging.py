@@ -0,0 +1,279 @@
+"""
+Resizing, encoding and diffing of screenshots in a pool of worker processes.
+
+Scaling a frame down to the model's resolution and compressing it takes tens
+of milliseconds of CPU, which would block the event loop and hold the GIL
+every other session needs. Frames travel to and from the workers through
+shared memory, only its name and a few sizes are pickled.
+
+This module is kept out of the tools package so the workers, which import it,
+don't load the tools and the Anthropic SDK.
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import AsyncIterator, Literal
+
+from PIL import Image, ImageChops
+
+from app.core.config import settings
+from app.core.metrics import IMAGE_POOL_IN_FLIGHT, IMAGE_POOL_WAIT, gauge_function
+
+ImageFormat = Literal["png", "webp"]
+
+MEDIA_TYPES: dict[str, str] = {"png": "image/png", "webp": "image/webp"}
+# room for the encoded frame beyond its raw pixels, for frames that don't compress
+OUTPUT_HEADROOM = 64 * 1024
+# rows compared at a time when looking for the areas of a frame that changed
+DIRTY_BAND = 32
+
+
+def _default_workers() -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, settings.WORKERS))
+
+
+def _open(path: str | None, shm: SharedMemory, size: int) -> Image.Image:
+    """The frame in the file at `path`, or in the first `size` bytes of `shm`"""
+    if path:
+        return Image.open(path)
+    with shm.buf[:size] as view:
+        return Image.open(io.BytesIO(bytes(view)))
+
+
+def _write(shm: SharedMemory, offset: int, output: bytes | memoryview) -> int | bytes:
+    """Write `output` to `shm` after `offset` bytes, or return it if it doesn't fit"""
+    length = len(output)
+    if offset + length > shm.size:
+        return bytes(output)
+    shm.buf[offset:offset + length] = output
+    return length
+
+
+def _encode(
+    name: str,
+    size: int,
+    path: str | None,
+    width: int,
+    height: int,
+    image_format: ImageFormat,
+    compress_level: int,
+) -> int | bytes:
+    """
+    Runs in a worker: decode the frame at `path`, or the first `size` bytes of
+    the shared memory block, scale it to `width` x `height` and encode it.
+    """
+    shm = SharedMemory(name)
+    try:
+        image = _open(path, shm, size)
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        if image_format == "webp":
+            # the fastest method is ten times faster than the default and still
+            # smaller than PNG on screen content
+            image.save(output, "WEBP", lossless=True, method=0)
+        else:
+            image.save(output, "PNG", compress_level=compress_level)
+        return _write(shm, size, output.getbuffer())
+    finally:
+        shm.close()
+
+
+def dirty_rects(previous: Image.Image, frame: Image.Image) -> list[tuple[int, int, int, int]]:
+    """
+    (x, y, width, height) of the areas that changed between two frames: the
+    changed columns of each band of DIRTY_BAND rows, merged with the band
+    above when their columns overlap.
+    """
+    diff = ImageChops.difference(previous, frame)
+    if diff.getbbox() is None:
+        return []
+    boxes: list[list[int]] = []
+    for top in range(0, frame.height, DIRTY_BAND):
+        bbox = diff.crop((0, top, frame.width, min(top + DIRTY_BAND, frame.height))).getbbox()
+        if bbox is None:
+            continue
+        left, right, bottom = bbox[0], bbox[2], top + bbox[3]
+        last = boxes[-1] if boxes else None
+        # changes reaching into the previous band, in overlapping columns
+        if last and last[3] > top - DIRTY_BAND and left < last[2] and right > last[0]:
+            last[0], last[2], last[3] = min(left, last[0]), max(right, last[2]), bottom
+        else:
+            boxes.append([left, top + bbox[1], right, bottom])
+    return [(left, top, right - left, bottom - top) for left, top, right, bottom in boxes]
+
+
+def _frame_update(
+    name: str,
+    size: int,
+    path: str,
+    previous_name: str,
+    keyframe: bool,
+    width: int,
+    height: int,
+    quality: int,
+) -> int | bytes:
+    """
+    Runs in a worker: the changes of the frame at `path`, scaled to `width` x
+    `height`, since the raw RGB frame in the `previous_name` block, which it
+    replaces. The update is the number of rectangles followed by each one's
+    position, size and length, and its lossy WebP image (see FrameStream).
+    """
+    shm, previous_shm = SharedMemory(name), SharedMemory(previous_name)
+    try:
+        frame = _open(path, shm, size).convert("RGB")
+        if frame.size != (width, height):
+            frame = frame.resize((width, height), Image.Resampling.LANCZOS)
+        pixels = frame.tobytes()
+        if keyframe:
+            rects = [(0, 0, width, height)]
+        else:
+            with previous_shm.buf[:len(pixels)] as view:
+                previous = Image.frombytes("RGB", (width, height), view)
+            rects = dirty_rects(previous, frame)
+        previous_shm.buf[:len(pixels)] = pixels
+
+        output = io.BytesIO()
+        output.write(struct.pack("<H", len(rects)))
+        for x, y, w, h in rects:
+            tile = io.BytesIO()
+            frame.crop((x, y, x + w, y + h)).save(tile, "WEBP", quality=quality, method=0)
+            output.write(struct.pack("<HHHHI", x, y, w, h, tile.tell()))
+            output.write(tile.getbuffer())
+        return _write(shm, size, output.getbuffer())
+    finally:
+        shm.close()
+        previous_shm.close()
+
+
+class ImagePool:
+    """
+    Process pool for image operations, shared by every session.
+
+    At most one operation per worker plus `queue` are submitted at a time;
+    others wait here for a slot, so a burst of screenshots holds neither
+    shared memory nor pool queue entries until a worker is close to free.
+    """
+
+    def __init__(self, workers: int | None = None, queue: int | None = None):
+        self.workers = workers or settings.IMAGE_POOL_WORKERS or _default_workers()
+        self.max_in_flight = self.workers + (settings.IMAGE_POOL_QUEUE if queue is None else queue)
+        self.in_flight = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._slots_loop: asyncio.AbstractEventLoop | None = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forked from a clean server process rather than from this one, with
+            # its threads and open sockets; the server imports this module once
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self._executor
+
+    def _global_slots(self) -> asyncio.Semaphore:
+        # semaphores belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._slots_loop = loop
+        return self._slots
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        async with self._global_slots():
+            IMAGE_POOL_WAIT.observe(time.perf_counter() - start)
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    async def _run(self, source: bytes, capacity: int, function, *args) -> bytes:
+        """
+        `function(name, size, *args)` in a worker, given a shared memory block
+        holding `source` followed by `capacity` bytes for the output it writes.
+        """
+        size = len(source)
+        async with self.slot():
+            shm = SharedMemory(create=True, size=size + capacity)
+            try:
+                if size:
+                    shm.buf[:size] = source
+                executor = self._pool()
+                future = asyncio.get_running_loop().run_in_executor(
+                    executor, function, shm.name, size, *args
+                )
+                try:
+                    result = await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # the worker can't be interrupted, it keeps the slot until it's done
+                    await asyncio.wait([future])
+                    raise
+                except BrokenProcessPool:
+                    # a worker died, e.g. killed for memory; the next call starts a new pool
+                    if self._executor is executor:
+                        self._executor = None
+                    raise
+                if isinstance(result, bytes):
+                    return result
+                return bytes(shm.buf[size:size + result])
+            finally:
+                shm.close()
+                shm.unlink()
+
+    async def encode(
+        self,
+        source: bytes | Path,
+        width: int,
+        height: int,
+        image_format: ImageFormat | None = None,
+    ) -> bytes:
+        """
+        `source`, an image file or its content, scaled to `width` x `height`
+        and encoded as `image_format`, SCREENSHOT_FORMAT by default.
+        """
+        path, data = (str(source), b"") if isinstance(source, Path) else (None, source)
+        return await self._run(
+            data, width * height * 4 + OUTPUT_HEADROOM, _encode,
+            path, width, height, image_format or settings.SCREENSHOT_FORMAT,
+            settings.PNG_COMPRESS_LEVEL,
+        )
+
+    async def frame_update(
+        self,
+        path: Path,
+        previous: SharedMemory,
+        keyframe: bool,
+        width: int,
+        height: int,
+        quality: int,
+    ) -> bytes:
+        """
+        Rectangles of the frame in `path` that changed since the one in
+        `previous`, `width` x `height` x 3 bytes of RGB the update replaces.
+        """
+        return await self._run(
+            b"", width * height * 4 + OUTPUT_HEADROOM, _frame_update,
+            str(path), previous.name, keyframe, width, height, quality,
+        )
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_pool = ImagePool()
+gauge_function(IMAGE_POOL_IN_FLIGHT, lambda: image_pool.in_flight)
@@ -0,0 +1,277 @@
+"""
+Record and replay of agent sessions
+
+A trace captures the model responses and tool results of a real session in a
+compact gzip'ed JSON lines file. Replaying it serves those responses instead of
+calling the model and the desktop, with the original or compressed timings, so
+the backend can be load tested deterministically.
+
+Trace lines:
+    {"kind": "header", "version": 1, "session_id": ..., "tool_version": ..., "tools": [...]}
+    {"kind": "user", "text": ...}
+    {"kind": "model", "elapsed": seconds, "response": {...}}
+    {"kind": "image", "id": sha1, "data": base64}   # written once per distinct image
+    {"kind": "tool", "elapsed": seconds, "name": ..., "input": {...}, "result": {...}}
+"""
+
+import asyncio
+import functools
+import gzip
+import hashlib
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.computer_use.tools import ToolCollection, ToolResult
+from app.services.computer_use.tools.collection import ToolDefinitions
+from app.services.computer_use.tools.base import ToolFailure, ToolImage
+
+TRACE_VERSION = 1
+TRACE_SUFFIX = ".trace.jsonl.gz"
+
+EXHAUSTED_RESPONSE = {
+    "content": [{"type": "text", "text": "[replay trace exhausted]"}],
+    "stop_reason": "end_turn",
+    "usage": {"input_tokens": 0, "output_tokens": 0},
+}
+
+
+class TraceRecorder:
+    """Buffers the events of one session and appends them to its trace file"""
+
+    def __init__(self, path: Path, session_id: str, tool_version: str, tools: List[Dict[str, Any]]):
+        self.path = path
+        self._seen_images: set = set()
+        self._pending: List[Dict[str, Any]] = []
+        # flushes append in the order they were made
+        self._lock = asyncio.Lock()
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._pending.append({
+                "kind": "header",
+                "version": TRACE_VERSION,
+                "session_id": session_id,
+                "tool_version": tool_version,
+                "tools": tools,
+            })
+
+    def record_user(self, text: str) -> None:
+        self._pending.append({"kind": "user", "text": text})
+
+    def record_model(self, response: Dict[str, Any], elapsed: float) -> None:
+        self._pending.append({"kind": "model", "elapsed": round(elapsed, 4), "response": response})
+
+    def record_tool(
+        self,
+        name: str,
+        tool_input: Dict[str, Any],
+        result: ToolResult,
+        elapsed: float,
+    ) -> None:
+        image_id = None
+        if result.image:
+            encoded = result.image.base64
+            image_id = hashlib.sha1(encoded.encode()).hexdigest()
+            if image_id not in self._seen_images:
+                self._seen_images.add(image_id)
+                self._pending.append({"kind": "image", "id": image_id, "data": encoded})
+        self._pending.append({
+            "kind": "tool",
+            "elapsed": round(elapsed, 4),
+            "name": name,
+            "input": tool_input,
+            "result": {
+                "output": result.output,
+                "error": result.error,
+                "system": result.system,
+                "image": image_id,
+                "failure": isinstance(result, ToolFailure),
+            },
+        })
+
+    async def flush(self) -> None:
+        """Append buffered events, off the event loop; each flush adds a gzip member to the file"""
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        async with self._lock:
+            await asyncio.to_thread(self._write, events)
+
+    def _write(self, events: List[Dict[str, Any]]) -> None:
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+
+class RecordingClient:
+    """Wraps a model client and records every response"""
+
+    def __init__(self, client, recorder: TraceRecorder):
+        self._client = client
+        self._recorder = recorder
+
+    async def create_message(self, **params: Any) -> Dict[str, Any]:
+        start = time.perf_counter()
+        response = await self._client.create_message(**params)
+        self._recorder.record_model(response, time.perf_counter() - start)
+        return response
+
+
+class RecordingToolCollection(ToolCollection):
+    """A ToolCollection that records every tool result"""
+
+    def __init__(self, *tools, recorder: TraceRecorder, definitions: Optional[ToolDefinitions] = None):
+        super().__init__(*tools, definitions=definitions)
+        self.recorder = recorder
+
+    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+        start = time.perf_counter()
+        result = await super().run(name=name, tool_input=tool_input)
+        self.recorder.record_tool(name, tool_input, result, time.perf_counter() - start)
+        return result
+
+
+@dataclass
+class Trace:
+    """A parsed trace file"""
+
+    path: Path
+    header: Dict[str, Any]
+    user_messages: List[str] = field(default_factory=list)
+    model_events: List[Dict[str, Any]] = field(default_factory=list)
+    tool_events: List[Dict[str, Any]] = field(default_factory=list)
+    images: Dict[str, str] = field(default_factory=dict)
+
+
+def load_trace(path: Path) -> Trace:
+    """Read a trace file written by TraceRecorder"""
+    trace = Trace(path=path, header={})
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            kind = event["kind"]
+            if kind == "header":
+                trace.header = event
+            elif kind == "user":
+                trace.user_messages.append(event["text"])
+            elif kind == "model":
+                trace.model_events.append(event)
+            elif kind == "image":
+                trace.images[event["id"]] = event["data"]
+            elif kind == "tool":
+                trace.tool_events.append(event)
+    return trace
+
+
+def find_traces(trace_dir: Path) -> List[Path]:
+    return sorted(trace_dir.glob(f"*{TRACE_SUFFIX}"))
+
+
+def first_user_message(path: Path) -> Optional[str]:
+    """The first user message of a trace, reading no further than it"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event["kind"] == "user":
+                return event["text"]
+    return None
+
+
+class TraceReplayer:
+    """Serves the recorded events of one trace in order"""
+
+    def __init__(self, trace: Trace, speed: float = 1.0):
+        self.trace = trace
+        # 1.0 replays the original timings, 0.1 ten times faster, 0 without delays
+        self.speed = speed
+        self._model_events = iter(trace.model_events)
+        self._tool_events = iter(trace.tool_events)
+
+    async def _wait(self, elapsed: float) -> None:
+        if self.speed > 0 and elapsed > 0:
+            await asyncio.sleep(elapsed * self.speed)
+
+    async def next_model_response(self) -> Dict[str, Any]:
+        event = next(self._model_events, None)
+        if event is None:
+            return EXHAUSTED_RESPONSE
+        await self._wait(event["elapsed"])
+        return event["response"]
+
+    async def next_tool_result(self, name: str) -> ToolResult:
+        event = next(self._tool_events, None)
+        if event is None:
+            return ToolFailure(error=f"Replay trace has no more results for tool {name}")
+        await self._wait(event["elapsed"])
+        if event["name"] != name:
+            return ToolFailure(
+                error=f"Replay trace expected tool {event['name']}, got {name}"
+            )
+        recorded = event["result"]
+        result_class = ToolFailure if recorded.get("failure") else ToolResult
+        encoded = self.trace.images.get(recorded.get("image") or "")
+        return result_class(
+            output=recorded.get("output"),
+            error=recorded.get("error"),
+            system=recorded.get("system"),
+            image=ToolImage.from_base64(encoded) if encoded else None,
+        )
+
+
+class ReplayClient:
+    """Stands in for the model client, answering with recorded responses"""
+
+    def __init__(self, replayer: TraceReplayer):
+        self._replayer = replayer
+
+    async def create_message(self, **params: Any) -> Dict[str, Any]:
+        return await self._replayer.next_model_response()
+
+
+class ReplayToolCollection(ToolCollection):
+    """Stands in for the session's tools, answering with recorded results"""
+
+    def __init__(self, replayer: TraceReplayer):
+        super().__init__(
+            definitions=ToolDefinitions.from_params(replayer.trace.header.get("tools", []))
+        )
+        self._replayer = replayer
+
+    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+        return await self._replayer.next_tool_result(name)
+
+
+class TraceLibrary:
+    """
+    Traces available for replay, matched to sessions by their first user message.
+
+    Only the first user message of each trace is read up front; a trace is
+    loaded when a session replays it, and the most recently used ones are kept.
+    Both do blocking file I/O.
+    """
+
+    def __init__(self, trace_dir: Path, speed: float = 1.0, cached_traces: int = 8):
+        self.speed = speed
+        self._by_first_message: Dict[str, List[Path]] = {}
+        paths = find_traces(trace_dir)
+        for path in paths:
+            first_message = first_user_message(path)
+            if first_message is not None:
+                self._by_first_message.setdefault(first_message, []).append(path)
+        self._round_robin = itertools.cycle(paths) if paths else None
+        self._counters: Dict[str, itertools.count] = {}
+        self._load = functools.lru_cache(maxsize=cached_traces)(load_trace)
+
+    def replayer_for(self, first_message: str) -> Optional[TraceReplayer]:
+        candidates = self._by_first_message.get(first_message)
+        if candidates:
+            counter = self._counters.setdefault(first_message, itertools.count())
+            path = candidates[next(counter) % len(candidates)]
+        elif self._round_robin is not None:
+            path = next(self._round_robin)
+        else:
+            return None
+        return TraceReplayer(self._load(path), speed=self.speed)
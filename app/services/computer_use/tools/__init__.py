@@ -1,6 +1,6 @@
-from .base import CLIResult, ToolResult
+from .base import CLIResult, ToolImage, ToolResult
 from .bash import BashTool20241022, BashTool20250124
-from .collection import ToolCollection
+from .collection import ToolCollection, ToolDefinitions
 from .computer import ComputerTool20241022, ComputerTool20250124
 from .edit import EditTool20241022, EditTool20250124, EditTool20250429
 from .groups import TOOL_GROUPS_BY_VERSION, ToolVersion
@@ -15,6 +15,8 @@ __ALL__ = [
     EditTool20250124,
     EditTool20250429,
     ToolCollection,
+    ToolDefinitions,
+    ToolImage,
     ToolResult,
     ToolVersion,
     TOOL_GROUPS_BY_VERSION,
@@ -0,0 +1,73 @@
+"""Crash-safe file replacement for the editor tool."""
+
+import os
+from pathlib import Path
+from typing import Literal
+from uuid import uuid4
+
+from app.core.config import settings
+
+FsyncPolicy = Literal["never", "on_close", "always"]
+
+
+def _create_temp(target: Path, mode: int) -> tuple[int, str]:
+    """
+    Create a temporary file next to `target`; like `open`, the process umask
+    applies to `mode`, which saves reading the umask, a process-wide setting.
+    """
+    while True:
+        tmp_name = str(target.parent / f".{target.name}.{uuid4().hex[:8]}.tmp")
+        try:
+            return os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode), tmp_name
+        except FileExistsError:
+            continue
+
+
+def atomic_write_text(path: Path, text: str, fsync: FsyncPolicy | None = None) -> None:
+    """
+    Replace the content of `path` so readers and crashes see the old or the new
+    file, never a partial one.
+
+    The text goes to a temporary file in the same directory, which takes the
+    original's permissions (and owner, where allowed) and is renamed over it.
+    With `fsync` "on_close" the data is flushed to disk before the rename, with
+    "always" the directory entry is flushed after it as well; by default
+    EDIT_FSYNC_POLICY applies.
+    """
+    fsync = fsync or settings.EDIT_FSYNC_POLICY
+    # write through symlinks instead of replacing them
+    target = Path(os.path.realpath(path))
+    try:
+        st = os.stat(target)
+    except FileNotFoundError:
+        st = None
+
+    # a new file gets the mode `open` would give it, an existing one keeps its own
+    fd, tmp_name = _create_temp(target, 0o666 if st is None else 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            if fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        if st is not None:
+            os.chmod(tmp_name, st.st_mode & 0o7777)
+            if (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+                try:
+                    os.chown(tmp_name, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+        os.replace(tmp_name, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+    if fsync == "always":
+        dir_fd = os.open(target.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
@@ -1,3 +1,4 @@
+import base64
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass, fields, replace
 from typing import Any
@@ -20,15 +21,67 @@ class BaseAnthropicTool(metaclass=ABCMeta):
         raise NotImplementedError
 
 
-@dataclass(kw_only=True, frozen=True)
+class ToolImage:
+    """
+    An image returned by a tool, kept in a single representation.
+
+    Screenshots start out as the raw bytes read from disk; the base64 text the
+    API needs is produced on first use and then replaces them, so results that
+    are copied, combined or never sent don't carry an encoded copy around.
+    """
+
+    __slots__ = ("_data", "_base64", "media_type")
+
+    def __init__(self, data: bytes, media_type: str = "image/png"):
+        self._data: bytes | None = data
+        self._base64: str | None = None
+        self.media_type = media_type
+
+    @classmethod
+    def from_base64(cls, encoded: str, media_type: str = "image/png") -> "ToolImage":
+        image = cls(b"", media_type)
+        image._data = None
+        image._base64 = encoded
+        return image
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            encoded = base64.b64encode(self._data)
+            # let the raw bytes go before the text copy is made
+            self._data = None
+            self._base64 = encoded.decode("ascii")
+        return self._base64
+
+    @property
+    def data(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        return base64.b64decode(self._base64)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the image content"""
+        return len(self._data) if self._data is not None else len(self._base64)
+
+    def __repr__(self) -> str:
+        encoded = "base64" if self._data is None else "raw"
+        return f"ToolImage({self.media_type}, {self.nbytes} bytes {encoded})"
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
 class ToolResult:
     """Represents the result of a tool execution."""
 
     output: str | None = None
     error: str | None = None
-    base64_image: str | None = None
+    image: ToolImage | None = None
     system: str | None = None
 
+    @property
+    def base64_image(self) -> str | None:
+        return self.image.base64 if self.image else None
+
     def __bool__(self):
         return any(getattr(self, field.name) for field in fields(self))
 
@@ -45,7 +98,7 @@ class ToolResult:
         return ToolResult(
             output=combine_fields(self.output, other.output),
             error=combine_fields(self.error, other.error),
-            base64_image=combine_fields(self.base64_image, other.base64_image, False),
+            image=combine_fields(self.image, other.image, False),
             system=combine_fields(self.system, other.system),
         )
 
@@ -57,10 +110,14 @@ class ToolResult:
 class CLIResult(ToolResult):
     """A ToolResult that can be rendered as a CLI output."""
 
+    __slots__ = ()
+
 
 class ToolFailure(ToolResult):
     """A ToolResult that represents a failure."""
 
+    __slots__ = ()
+
 
 class ToolError(Exception):
     """Raised when a tool encounters an error."""
@@ -1,8 +1,33 @@
 import asyncio
 import os
+import re
+import shlex
 from typing import Any, Literal
 
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .supervisor import supervisor
+
+# variables bash maintains itself
+SHELL_MANAGED = frozenset({"PWD", "OLDPWD", "SHLVL", "_"})
+# never written to a checkpoint
+SECRET_NAME = re.compile(r"KEY|SECRET|TOKEN|PASSW|CREDENTIAL|AUTH|DATABASE_URL|DSN", re.IGNORECASE)
+VARIABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _checkpointable(name: str) -> bool:
+    return (
+        name not in SHELL_MANAGED
+        and VARIABLE_NAME.match(name) is not None
+        and not SECRET_NAME.search(name)
+    )
+
+
+def _restore_script(state: dict[str, Any]) -> str:
+    """Commands bringing a new shell to a checkpointed state, silently"""
+    commands = [f"cd -- {shlex.quote(state['cwd'])}"] if state.get("cwd") else []
+    commands += [f"export {name}={shlex.quote(value)}" for name, value in state.get("env", {}).items()]
+    commands += [f"unset {name}" for name in state.get("unset", [])]
+    return "{ " + "; ".join(commands) + "; } >/dev/null 2>&1\n" if commands else ""
 
 
 class _BashSession:
@@ -16,33 +41,60 @@ class _BashSession:
     _timeout: float = 120.0  # seconds
     _sentinel: str = "<<exit>>"
 
-    def __init__(self):
+    def __init__(self, restore: dict[str, Any] | None = None):
         self._started = False
         self._timed_out = False
+        self._restore = restore
+        # what the shell starts with, to tell the variables the agent changed
+        self._environ = dict(os.environ)
 
     async def start(self):
         if self._started:
             return
 
-        self._process = await asyncio.create_subprocess_shell(
+        # bash leads its own process group, which stop() terminates whole
+        self._process = await supervisor.spawn_exec(
             self.command,
-            preexec_fn=os.setsid,
-            shell=True,
             bufsize=0,
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            env=self._environ,
         )
+        if self._restore and (script := _restore_script(self._restore)):
+            # runs ahead of the first command
+            self._process.stdin.write(script.encode())
 
         self._started = True
 
-    def stop(self):
-        """Terminate the bash shell."""
+    async def state(self) -> dict[str, Any] | None:
+        """
+        Working directory and the variables changed since the shell started,
+        secrets left out; the restored state while the shell can't be asked.
+        """
+        if not self._started or self._timed_out or self._process.returncode is not None:
+            return self._restore
+        try:
+            result = await self.run('printf "%s\\0" "$PWD"; env -0')
+        except ToolError:
+            return self._restore
+        cwd, *entries = (result.output or "").split("\0")
+        env = dict(entry.split("=", 1) for entry in entries if "=" in entry)
+        return {
+            "cwd": cwd,
+            "env": {
+                name: value
+                for name, value in env.items()
+                if self._environ.get(name) != value and _checkpointable(name)
+            },
+            "unset": [name for name in self._environ if name not in env and _checkpointable(name)],
+        }
+
+    async def stop(self):
+        """Terminate the bash shell and whatever it left running."""
         if not self._started:
             raise ToolError("Session has not started.")
-        if self._process.returncode is not None:
-            return
-        self._process.terminate()
+        await supervisor.terminate(self._process)
 
     async def run(self, command: str):
         """Execute a command in the bash shell."""
@@ -63,29 +115,33 @@ class _BashSession:
         assert self._process.stdout
         assert self._process.stderr
 
-        # send command to the process
-        self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
-        )
-        await self._process.stdin.drain()
-
-        # read output from the process, until the sentinel is found
-        try:
-            async with asyncio.timeout(self._timeout):
-                while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = self._process.stdout._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
-                        break
-        except asyncio.TimeoutError:
-            self._timed_out = True
-            raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
-            ) from None
+        # commands count against the same limits as the other tools' processes
+        async with supervisor.slot():
+            # send command to the process
+            self._process.stdin.write(
+                command.encode() + f"; echo '{self._sentinel}'\n".encode()
+            )
+            await self._process.stdin.drain()
+
+            # read output from the process, until the sentinel is found
+            try:
+                async with asyncio.timeout(self._timeout):
+                    while True:
+                        await asyncio.sleep(self._output_delay)
+                        # if we read directly from stdout/stderr, it will wait forever for
+                        # EOF. use the StreamReader buffer directly instead.
+                        output = self._process.stdout._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
+                        if self._sentinel in output:
+                            # strip the sentinel and break
+                            output = output[: output.index(self._sentinel)]
+                            break
+            except asyncio.TimeoutError:
+                self._timed_out = True
+                # the shell has to be restarted, don't leave the command running
+                await supervisor.terminate(self._process)
+                raise ToolError(
+                    f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
+                ) from None
 
         if output.endswith("\n"):
             output = output[:-1]
@@ -114,8 +170,19 @@ class BashTool20250124(BaseAnthropicTool):
 
     def __init__(self):
         self._session = None
+        self._restore: dict[str, Any] | None = None
         super().__init__()
 
+    async def checkpoint_state(self) -> dict[str, Any] | None:
+        """State of the shell to start the next one from, if it was used"""
+        if self._session is None:
+            return self._restore
+        return await self._session.state()
+
+    def restore_state(self, state: dict[str, Any]) -> None:
+        """Start the next shell where the checkpointed one left off"""
+        self._restore = state
+
     def to_params(self) -> Any:
         return {
             "type": self.api_type,
@@ -127,14 +194,15 @@ class BashTool20250124(BaseAnthropicTool):
     ):
         if restart:
             if self._session:
-                self._session.stop()
+                await self._session.stop()
             self._session = _BashSession()
             await self._session.start()
 
             return ToolResult(system="tool has been restarted.")
 
         if self._session is None:
-            self._session = _BashSession()
+            self._session = _BashSession(restore=self._restore)
+            self._restore = None
             await self._session.start()
 
         if command is not None:
@@ -1,9 +1,15 @@
 """Collection classes for managing multiple tools."""
 
+import hashlib
+import json
+import time
+from dataclasses import dataclass
 from typing import Any
 
 from anthropic.types.beta import BetaToolUnionParam
 
+from app.core.metrics import TOOL_CALLS, TOOL_ERRORS, TOOL_LATENCY, tool_action
+
 from .base import (
     BaseAnthropicTool,
     ToolError,
@@ -12,23 +18,71 @@ from .base import (
 )
 
 
+@dataclass(frozen=True)
+class ToolDefinitions:
+    """
+    The params of a set of tools with their canonical JSON and its digest,
+    which changes exactly when the tool definitions sent to the model do.
+    The params are shared and must not be modified.
+    """
+
+    params: list[BetaToolUnionParam]
+    serialized: str
+    digest: str
+
+    @classmethod
+    def from_params(cls, params: list[BetaToolUnionParam]) -> "ToolDefinitions":
+        serialized = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        return cls(params, serialized, hashlib.sha256(serialized.encode()).hexdigest()[:16])
+
+
 class ToolCollection:
     """A collection of anthropic-defined tools."""
 
-    def __init__(self, *tools: BaseAnthropicTool):
+    def __init__(self, *tools: BaseAnthropicTool, definitions: ToolDefinitions | None = None):
         self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
+        self.definitions = definitions or ToolDefinitions.from_params(
+            [tool.to_params() for tool in tools]
+        )
+        self.tool_map = {
+            params["name"]: tool for params, tool in zip(self.definitions.params, tools)
+        }
 
     def to_params(
         self,
     ) -> list[BetaToolUnionParam]:
-        return [tool.to_params() for tool in self.tools]
+        return self.definitions.params
+
+    async def checkpoint_state(self) -> dict[str, Any]:
+        """State of the tools that can be checkpointed, by tool name"""
+        states = {}
+        for name, tool in self.tool_map.items():
+            if hasattr(tool, "checkpoint_state") and (state := await tool.checkpoint_state()):
+                states[name] = state
+        return states
+
+    def restore_state(self, states: dict[str, Any]) -> None:
+        for name, state in states.items():
+            tool = self.tool_map.get(name)
+            if tool is not None and hasattr(tool, "restore_state"):
+                tool.restore_state(state)
 
     async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
         tool = self.tool_map.get(name)
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
+        labels = (name, tool_action(tool_input))
+        TOOL_CALLS.labels(*labels).inc()
+        start = time.perf_counter()
         try:
-            return await tool(**tool_input)
+            result = await tool(**tool_input)
         except ToolError as e:
-            return ToolFailure(error=e.message)
+            result = ToolFailure(error=e.message)
+        except Exception:
+            TOOL_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            TOOL_LATENCY.labels(*labels).observe(time.perf_counter() - start)
+        if result.error:
+            TOOL_ERRORS.labels(*labels).inc()
+        return result
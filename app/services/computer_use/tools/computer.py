@@ -1,21 +1,28 @@
 import asyncio
-import base64
 import os
 import shlex
 import shutil
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from enum import StrEnum
+from functools import lru_cache
 from pathlib import Path
 from typing import Literal, TypedDict, cast, get_args
 from uuid import uuid4
 
 from anthropic.types.beta import BetaToolComputerUse20241022Param, BetaToolUnionParam
 
-from .base import BaseAnthropicTool, ToolError, ToolResult
+from app.core.config import settings
+from app.core.metrics import SCREENSHOT_CAPTURE, SCREENSHOT_READ
+from app.core.tracing import span
+from app.services.computer_use.imaging import MEDIA_TYPES, image_pool
+
+from .base import BaseAnthropicTool, ToolError, ToolImage, ToolResult
+from .context import report_progress, tool_context
 from .run import run
 
 OUTPUT_DIR = "/tmp/outputs"
 
-TYPING_DELAY_MS = 12
 TYPING_GROUP_SIZE = 50
 
 Action_20241022 = Literal[
@@ -73,16 +80,88 @@ class ScalingSource(StrEnum):
     API = "api"
 
 
+@dataclass(frozen=True)
+class ScalingTransform:
+    """
+    Mapping between the screen's resolution and the one the model sees,
+    resolved once per display configuration.
+    """
+
+    width: int
+    height: int
+    # resolution shown to the model, the screen's own if it isn't scaled
+    target_width: int
+    target_height: int
+    # target / screen, at most 1
+    x_factor: float = 1.0
+    y_factor: float = 1.0
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def for_display(width: int, height: int, enabled: bool = True) -> "ScalingTransform":
+        """The shared transform of a display, scaled to the first target with its aspect ratio"""
+        if enabled:
+            ratio = width / height
+            for dimension in MAX_SCALING_TARGETS.values():
+                # allow some error in the aspect ratio - not ratios are exactly 16:9
+                if abs(dimension["width"] / dimension["height"] - ratio) < 0.02:
+                    if dimension["width"] < width:
+                        return ScalingTransform(
+                            width,
+                            height,
+                            dimension["width"],
+                            dimension["height"],
+                            dimension["width"] / width,
+                            dimension["height"] / height,
+                        )
+                    break
+        return ScalingTransform(width, height, width, height)
+
+    @property
+    def is_identity(self) -> bool:
+        return (self.width, self.height) == (self.target_width, self.target_height)
+
+    def scale(self, source: ScalingSource, x: int, y: int) -> tuple[int, int]:
+        """Scale a point from the screen to the model (COMPUTER) or back (API)."""
+        if self.is_identity:
+            return x, y
+        if source == ScalingSource.API:
+            if x > self.width or y > self.height:
+                raise ToolError(f"Coordinates {x}, {y} are out of bounds")
+            # scale up
+            return round(x / self.x_factor), round(y / self.y_factor)
+        # scale down
+        return round(x * self.x_factor), round(y * self.y_factor)
+
+
 class ComputerToolOptions(TypedDict):
     display_height_px: int
     display_width_px: int
     display_number: int | None
 
 
+def display_config() -> tuple[int, int, int | None]:
+    """WIDTH, HEIGHT and DISPLAY_NUM of the display the computer tool drives"""
+    display_num = os.getenv("DISPLAY_NUM")
+    return (
+        int(os.getenv("WIDTH") or 0),
+        int(os.getenv("HEIGHT") or 0),
+        int(display_num) if display_num is not None else None,
+    )
+
+
 def chunks(s: str, chunk_size: int) -> list[str]:
     return [s[i : i + chunk_size] for i in range(0, len(s), chunk_size)]
 
 
+def _program_name(command: str) -> str:
+    """Executable of a shell command, skipping `VAR=value` prefixes"""
+    for word in command.split():
+        if "=" not in word:
+            return os.path.basename(word)
+    return "shell"
+
+
 class BaseComputerTool:
     """
     A tool that allows the agent to interact with the screen, keyboard, and mouse of the current computer.
@@ -97,31 +176,43 @@ class BaseComputerTool:
     _screenshot_delay = 2.0
     _scaling_enabled = True
 
+    @property
+    def transform(self) -> ScalingTransform:
+        return ScalingTransform.for_display(self.width, self.height, self._scaling_enabled)
+
     @property
     def options(self) -> ComputerToolOptions:
-        width, height = self.scale_coordinates(
-            ScalingSource.COMPUTER, self.width, self.height
-        )
+        transform = self.transform
         return {
-            "display_width_px": width,
-            "display_height_px": height,
+            "display_width_px": transform.target_width,
+            "display_height_px": transform.target_height,
             "display_number": self.display_num,
         }
 
+    def _cached_params(self, api_type: str) -> BetaToolUnionParam:
+        """
+        Tool params, built once per display configuration. The dict is shared
+        between calls and must not be modified.
+        """
+        key = (self.transform, self.display_num)
+        cached = self._params_cache
+        if cached is None or cached[0] != key:
+            params = {"name": self.name, "type": api_type, **self.options}
+            self._params_cache = cached = (key, params)
+        return cast(BetaToolUnionParam, cached[1])
+
     def __init__(self):
         super().__init__()
 
-        self.width = int(os.getenv("WIDTH") or 0)
-        self.height = int(os.getenv("HEIGHT") or 0)
+        self.width, self.height, self.display_num = display_config()
         assert self.width and self.height, "WIDTH, HEIGHT must be set"
-        if (display_num := os.getenv("DISPLAY_NUM")) is not None:
-            self.display_num = int(display_num)
+        if self.display_num is not None:
             self._display_prefix = f"DISPLAY=:{self.display_num} "
         else:
-            self.display_num = None
             self._display_prefix = ""
 
         self.xdotool = f"{self._display_prefix}xdotool"
+        self._params_cache = None
 
     async def __call__(
         self,
@@ -161,21 +252,14 @@ class BaseComputerTool:
                 command_parts = [self.xdotool, f"key -- {text}"]
                 return await self.shell(" ".join(command_parts))
             elif action == "type":
-                results: list[ToolResult] = []
-                for chunk in chunks(text, TYPING_GROUP_SIZE):
-                    command_parts = [
-                        self.xdotool,
-                        f"type --delay {TYPING_DELAY_MS} -- {shlex.quote(chunk)}",
-                    ]
-                    results.append(
-                        await self.shell(" ".join(command_parts), take_screenshot=False)
-                    )
-                screenshot_base64 = (await self.screenshot()).base64_image
-                return ToolResult(
-                    output="".join(result.output or "" for result in results),
-                    error="".join(result.error or "" for result in results),
-                    base64_image=screenshot_base64,
-                )
+                if (
+                    tool_context().paste_long_text
+                    and len(text) > settings.TYPING_PASTE_THRESHOLD
+                ):
+                    result = await self.paste(text)
+                    if result is not None:
+                        return result
+                return await self.type_keys(text)
 
         if action in (
             "left_click",
@@ -211,6 +295,58 @@ class BaseComputerTool:
 
         raise ToolError(f"Invalid action: {action}")
 
+    async def type_keys(self, text: str) -> ToolResult:
+        """Type text in chunks of keystrokes at the session's speed, then take a screenshot."""
+        delay = tool_context().typing_delay_ms
+        if delay is None:
+            delay = settings.TYPING_DELAY_MS
+        results: list[ToolResult] = []
+        typed = 0
+        for chunk in chunks(text, TYPING_GROUP_SIZE):
+            command_parts = [
+                self.xdotool,
+                f"type --delay {delay} -- {shlex.quote(chunk)}",
+            ]
+            results.append(
+                await self.shell(" ".join(command_parts), take_screenshot=False)
+            )
+            typed += len(chunk)
+            await report_progress(self.name, action="type", done=typed, total=len(text))
+        screenshot = (await self.screenshot()).image
+        return ToolResult(
+            output="".join(result.output or "" for result in results),
+            error="".join(result.error or "" for result in results),
+            image=screenshot,
+        )
+
+    async def paste(self, text: str) -> ToolResult | None:
+        """
+        Enter text with a single paste from the clipboard, then take a
+        screenshot. Returns None if the text can't be pasted, e.g. without
+        xclip or when the display didn't change, for the caller to type it.
+        """
+        if not shutil.which("xclip"):
+            return None
+        # terminals paste the primary selection, other applications the
+        # clipboard; xclip stays in the background to serve each, it mustn't
+        # hold on to our pipes
+        for selection in ("primary", "clipboard"):
+            code, _, _ = await run(
+                f"{self._display_prefix}xclip -selection {selection} -i >/dev/null 2>&1",
+                input=text.encode(),
+            )
+            if code:
+                return None
+        before = (await self.screenshot()).image
+        result = await self.shell(
+            f"{self.xdotool} key --clearmodifiers {settings.TYPING_PASTE_KEY}"
+        )
+        # nothing to show for it, e.g. the application ignores the paste key
+        if result.image is None or before is None or result.image.data == before.data:
+            return None
+        await report_progress(self.name, action="type", done=len(text), total=len(text))
+        return result
+
     def validate_and_get_coordinates(self, coordinate: tuple[int, int] | None = None):
         if not isinstance(coordinate, list) or len(coordinate) != 2:
             raise ToolError(f"{coordinate} must be a tuple of length 2")
@@ -225,81 +361,71 @@ class BaseComputerTool:
         output_dir.mkdir(parents=True, exist_ok=True)
         path = output_dir / f"screenshot_{uuid4().hex}.png"
 
+        with SCREENSHOT_CAPTURE.time():
+            with span("screenshot.capture"):
+                result = await self.capture(path)
+            transform = self.transform
+            image_format = settings.SCREENSHOT_FORMAT
+            if path.exists() and (not transform.is_identity or image_format != "png"):
+                # the image pool reads the capture itself, it never goes through this process
+                with span("screenshot.resize"):
+                    try:
+                        data = await image_pool.encode(
+                            path, transform.target_width, transform.target_height, image_format
+                        )
+                    except (OSError, BrokenProcessPool) as exc:
+                        raise ToolError(f"Failed to process screenshot: {exc}") from exc
+                return result.replace(image=ToolImage(data, MEDIA_TYPES[image_format]))
+
+        if path.exists():
+            # encoded to base64 only when the result is sent to the model; a
+            # thread keeps a slow disk from stalling the other sessions
+            with SCREENSHOT_READ.time(), span("screenshot.read"):
+                image = ToolImage(await asyncio.to_thread(path.read_bytes))
+            return result.replace(image=image)
+        raise ToolError(f"Failed to take screenshot: {result.error}")
+
+    async def capture(self, path: Path) -> ToolResult:
+        """Write a PNG of the display, in its own resolution, to `path`"""
         # Try gnome-screenshot first
         if shutil.which("gnome-screenshot"):
             screenshot_cmd = f"{self._display_prefix}gnome-screenshot -f {path} -p"
         else:
             # Fall back to scrot if gnome-screenshot isn't available
             screenshot_cmd = f"{self._display_prefix}scrot -p {path}"
-
-        result = await self.shell(screenshot_cmd, take_screenshot=False)
-        if self._scaling_enabled:
-            x, y = self.scale_coordinates(
-                ScalingSource.COMPUTER, self.width, self.height
-            )
-            await self.shell(
-                f"convert {path} -resize {x}x{y}! {path}", take_screenshot=False
-            )
-
-        if path.exists():
-            return result.replace(
-                base64_image=base64.b64encode(path.read_bytes()).decode()
-            )
-        raise ToolError(f"Failed to take screenshot: {result.error}")
+        return await self.shell(screenshot_cmd, take_screenshot=False)
 
     async def shell(self, command: str, take_screenshot=True) -> ToolResult:
         """Run a shell command and return the output, error, and optionally a screenshot."""
-        _, stdout, stderr = await run(command)
-        base64_image = None
+        with span(f"exec.{_program_name(command)}"):
+            _, stdout, stderr = await run(command)
+        image = None
 
         if take_screenshot:
             # delay to let things settle before taking a screenshot
-            await asyncio.sleep(self._screenshot_delay)
-            base64_image = (await self.screenshot()).base64_image
+            with span("settle_wait"):
+                await asyncio.sleep(self._screenshot_delay)
+            image = (await self.screenshot()).image
 
-        return ToolResult(output=stdout, error=stderr, base64_image=base64_image)
+        return ToolResult(output=stdout, error=stderr, image=image)
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int):
         """Scale coordinates to a target maximum resolution."""
-        if not self._scaling_enabled:
-            return x, y
-        ratio = self.width / self.height
-        target_dimension = None
-        for dimension in MAX_SCALING_TARGETS.values():
-            # allow some error in the aspect ratio - not ratios are exactly 16:9
-            if abs(dimension["width"] / dimension["height"] - ratio) < 0.02:
-                if dimension["width"] < self.width:
-                    target_dimension = dimension
-                break
-        if target_dimension is None:
-            return x, y
-        # should be less than 1
-        x_scaling_factor = target_dimension["width"] / self.width
-        y_scaling_factor = target_dimension["height"] / self.height
-        if source == ScalingSource.API:
-            if x > self.width or y > self.height:
-                raise ToolError(f"Coordinates {x}, {y} are out of bounds")
-            # scale up
-            return round(x / x_scaling_factor), round(y / y_scaling_factor)
-        # scale down
-        return round(x * x_scaling_factor), round(y * y_scaling_factor)
+        return self.transform.scale(source, x, y)
 
 
 class ComputerTool20241022(BaseComputerTool, BaseAnthropicTool):
     api_type: Literal["computer_20241022"] = "computer_20241022"
 
     def to_params(self) -> BetaToolComputerUse20241022Param:
-        return {"name": self.name, "type": self.api_type, **self.options}
+        return cast(BetaToolComputerUse20241022Param, self._cached_params(self.api_type))
 
 
 class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
     api_type: Literal["computer_20250124"] = "computer_20250124"
 
     def to_params(self):
-        return cast(
-            BetaToolUnionParam,
-            {"name": self.name, "type": self.api_type, **self.options},
-        )
+        return self._cached_params(self.api_type)
 
     async def __call__(
         self,
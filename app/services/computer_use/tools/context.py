@@ -0,0 +1,41 @@
+"""The session a tool call runs for, its input preferences and where progress goes."""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator
+
+
+@dataclass(frozen=True)
+class ToolContext:
+    session_id: str | None = None
+    # milliseconds between typed keystrokes, None for the tool's default
+    typing_delay_ms: int | None = None
+    # long text is pasted from the clipboard rather than typed
+    paste_long_text: bool = False
+    # receives `tool_progress` messages, e.g. the session's WebSocket
+    progress: Callable[[Dict[str, Any]], Awaitable[None]] | None = None
+
+
+_context: ContextVar[ToolContext] = ContextVar("tool_context", default=ToolContext())
+
+
+def tool_context() -> ToolContext:
+    return _context.get()
+
+
+@contextmanager
+def use_context(context: ToolContext) -> Iterator[None]:
+    """Run the tool calls of this block in `context`"""
+    token = _context.set(context)
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+async def report_progress(tool_name: str, **data: Any) -> None:
+    """Tell the client how far a long running tool call has got"""
+    progress = _context.get().progress
+    if progress is not None:
+        await progress({"type": "tool_progress", "data": {"tool_name": tool_name, **data}})
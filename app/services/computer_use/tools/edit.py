@@ -1,9 +1,16 @@
-from collections import defaultdict
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Any, Literal, get_args
+from typing import Any, Callable, Literal, TypeVar, get_args
+from weakref import WeakValueDictionary
 
+from .atomic import atomic_write_text
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
-from .run import maybe_truncate, run
+from .line_index import get_line_index, read_head
+from .listing import LIST_MAX_ENTRIES, list_directory
+from .run import MAX_RESPONSE_LEN, maybe_truncate
+from .undo import UndoHistory
 
 Command_20250124 = Literal[
     "view",
@@ -20,21 +27,128 @@ Command_20250429 = Literal[
     "insert",
 ]
 SNIPPET_LINES: int = 4
+FILE_IO_WORKERS: int = 4
+RANGE_VIEW_MIN_BYTES: int = 4 * 1024 * 1024
+# enough bytes for any MAX_RESPONSE_LEN characters, plus one to trigger truncation
+MAX_VIEW_BYTES: int = 4 * (MAX_RESPONSE_LEN + 1)
 
+T = TypeVar("T")
 
-class EditTool20250124(BaseAnthropicTool):
+_file_executor: ThreadPoolExecutor | None = None
+_path_locks: "WeakValueDictionary[Path, asyncio.Lock]" = WeakValueDictionary()
+
+
+async def run_in_file_executor(func: Callable[..., T], *args) -> T:
+    """Run blocking file I/O or string processing in the editor's bounded thread pool."""
+    global _file_executor
+    if _file_executor is None:
+        _file_executor = ThreadPoolExecutor(
+            max_workers=FILE_IO_WORKERS, thread_name_prefix="edit-tool"
+        )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_file_executor, partial(func, *args))
+
+
+def path_lock(path: Path) -> asyncio.Lock:
+    """Lock serializing operations on `path` across every editor tool instance."""
+    lock = _path_locks.get(path)
+    if lock is None:
+        lock = _path_locks[path] = asyncio.Lock()
+    return lock
+
+
+def replace_once(
+    file_content: str, old_str: str, new_str: str, path: Path
+) -> tuple[str, int, str]:
+    """
+    Replace the only occurrence of old_str in file_content with one scan for
+    matches; return the new content and the first line number (0-based) and
+    text of a snippet around the edit.
+    """
+    # Check if old_str is unique in the file
+    offset = file_content.find(old_str)
+    if offset == -1:
+        raise ToolError(
+            f"No replacement was performed, old_str `{old_str}` did not appear verbatim in {path}."
+        )
+    elif file_content.find(old_str, offset + max(len(old_str), 1)) != -1:
+        lines = _lines_containing(file_content, old_str)
+        raise ToolError(
+            f"No replacement was performed. Multiple occurrences of old_str `{old_str}` in lines {lines}. Please ensure it is unique"
+        )
+
+    # Replace old_str with new_str
+    new_file_content = (
+        file_content[:offset] + new_str + file_content[offset + len(old_str) :]
+    )
+
+    # Create a snippet of the edited section from offsets
+    replacement_line = file_content.count("\n", 0, offset)
+    start_line = max(0, replacement_line - SNIPPET_LINES)
+    snippet = new_file_content[
+        _line_start(new_file_content, offset, replacement_line - start_line) : _line_end(
+            new_file_content, offset + len(new_str), SNIPPET_LINES
+        )
+    ]
+    return new_file_content, start_line, snippet
+
+
+def _lines_containing(content: str, old_str: str) -> list[int]:
+    """Numbers of the lines containing `old_str`, found with one scan of `content`"""
+    if not old_str:
+        return list(range(1, content.count("\n") + 2))
+    if "\n" in old_str:
+        # no single line can contain it
+        return []
+    lines = []
+    line, counted_to = 0, 0
+    offset = content.find(old_str)
+    while offset != -1:
+        line += content.count("\n", counted_to, offset)
+        counted_to = offset
+        if not lines or lines[-1] != line + 1:
+            lines.append(line + 1)
+        offset = content.find(old_str, offset + len(old_str))
+    return lines
+
+
+def _line_start(content: str, offset: int, lines_before: int) -> int:
+    """Offset of the start of the line `lines_before` lines above the one at `offset`"""
+    for _ in range(lines_before + 1):
+        offset = content.rfind("\n", 0, offset)
+        if offset == -1:
+            return 0
+    return offset + 1
+
+
+def _line_end(content: str, offset: int, lines_after: int) -> int:
+    """Offset of the end of the line `lines_after` lines below the one at `offset`"""
+    end = offset - 1
+    for _ in range(lines_after + 1):
+        end = content.find("\n", end + 1)
+        if end == -1:
+            return len(content)
+    return end
+
+
+class BaseEditTool:
     """
     An filesystem editor tool that allows the agent to view, create, and edit files.
     The tool parameters are defined by Anthropic and are not editable.
+
+    File access and the string processing on file contents run in a bounded
+    thread pool, and operations on the same path are serialized.
     """
 
-    api_type: Literal["text_editor_20250124"] = "text_editor_20250124"
-    name: Literal["str_replace_editor"] = "str_replace_editor"
+    name: str
+    api_type: str
+    commands: tuple[str, ...]
 
-    _file_history: dict[Path, list[str]]
+    _file_history: UndoHistory | None
 
     def __init__(self):
-        self._file_history = defaultdict(list)
+        # versions without undo_edit have no use for the history
+        self._file_history = UndoHistory() if "undo_edit" in self.commands else None
         super().__init__()
 
     def to_params(self) -> Any:
@@ -46,7 +160,7 @@ class EditTool20250124(BaseAnthropicTool):
     async def __call__(
         self,
         *,
-        command: Command_20250124,
+        command: str,
         path: str,
         file_text: str | None = None,
         view_range: list[int] | None = None,
@@ -56,33 +170,33 @@ class EditTool20250124(BaseAnthropicTool):
         **kwargs,
     ):
         _path = Path(path)
-        self.validate_path(command, _path)
-        if command == "view":
-            return await self.view(_path, view_range)
-        elif command == "create":
-            if file_text is None:
-                raise ToolError("Parameter `file_text` is required for command: create")
-            self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
-            return ToolResult(output=f"File created successfully at: {_path}")
-        elif command == "str_replace":
-            if old_str is None:
-                raise ToolError(
-                    "Parameter `old_str` is required for command: str_replace"
-                )
-            return self.str_replace(_path, old_str, new_str)
-        elif command == "insert":
-            if insert_line is None:
-                raise ToolError(
-                    "Parameter `insert_line` is required for command: insert"
-                )
-            if new_str is None:
-                raise ToolError("Parameter `new_str` is required for command: insert")
-            return self.insert(_path, insert_line, new_str)
-        elif command == "undo_edit":
-            return self.undo_edit(_path)
+        async with path_lock(_path):
+            await run_in_file_executor(self.validate_path, command, _path)
+            if command == "view":
+                return await self.view(_path, view_range)
+            elif command == "create":
+                if file_text is None:
+                    raise ToolError("Parameter `file_text` is required for command: create")
+                await run_in_file_executor(self.create, _path, file_text)
+                return ToolResult(output=f"File created successfully at: {_path}")
+            elif command == "str_replace":
+                if old_str is None:
+                    raise ToolError(
+                        "Parameter `old_str` is required for command: str_replace"
+                    )
+                return await run_in_file_executor(self.str_replace, _path, old_str, new_str)
+            elif command == "insert":
+                if insert_line is None:
+                    raise ToolError(
+                        "Parameter `insert_line` is required for command: insert"
+                    )
+                if new_str is None:
+                    raise ToolError("Parameter `new_str` is required for command: insert")
+                return await run_in_file_executor(self.insert, _path, insert_line, new_str)
+            elif command == "undo_edit" and command in self.commands:
+                return await run_in_file_executor(self.undo_edit, _path)
         raise ToolError(
-            f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(get_args(Command_20250124))}'
+            f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(self.commands)}'
         )
 
     def validate_path(self, command: str, path: Path):
@@ -113,28 +227,41 @@ class EditTool20250124(BaseAnthropicTool):
 
     async def view(self, path: Path, view_range: list[int] | None = None):
         """Implement the view command"""
-        if path.is_dir():
+        if await run_in_file_executor(path.is_dir):
             if view_range:
                 raise ToolError(
                     "The `view_range` parameter is not allowed when `path` points to a directory."
                 )
 
-            _, stdout, stderr = await run(
-                rf"find {path} -maxdepth 2 -not -path '*/\.*'"
-            )
+            listing = await run_in_file_executor(list_directory, str(path))
+            stdout = maybe_truncate("".join(f"{line}\n" for line in listing.lines))
+            if listing.truncated:
+                stdout += f"<NOTE>Only the first {LIST_MAX_ENTRIES} entries are shown.</NOTE>\n"
+            stderr = "\n".join(listing.errors)
             if not stderr:
                 stdout = f"Here's the files and directories up to 2 levels deep in {path}, excluding hidden items:\n{stdout}\n"
             return CLIResult(output=stdout, error=stderr)
 
-        file_content = self.read_file(path)
+        return await run_in_file_executor(self.view_file, path, view_range)
+
+    def view_file(self, path: Path, view_range: list[int] | None = None):
+        """Read and number the lines of a file, or of `view_range` within it"""
+        stat = self._stat(path)
+        # large files are read through a cached newline index, and only as far
+        # as the output can show before being truncated
+        large = stat.st_size >= RANGE_VIEW_MIN_BYTES
         init_line = 1
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
                 raise ToolError(
                     "Invalid `view_range`. It should be a list of two integers."
                 )
-            file_lines = file_content.split("\n")
-            n_lines_file = len(file_lines)
+            if large:
+                index = self._read_large(path, get_line_index, path, stat)
+                n_lines_file = index.line_count
+            else:
+                file_lines = self.read_file(path).split("\n")
+                n_lines_file = len(file_lines)
             init_line, final_line = view_range
             if init_line < 1 or init_line > n_lines_file:
                 raise ToolError(
@@ -149,15 +276,28 @@ class EditTool20250124(BaseAnthropicTool):
                     f"Invalid `view_range`: {view_range}. Its second element `{final_line}` should be larger or equal than its first `{init_line}`"
                 )
 
-            if final_line == -1:
+            if large:
+                file_content = self._read_large(
+                    path, index.read_lines, init_line, final_line, MAX_VIEW_BYTES
+                )
+            elif final_line == -1:
                 file_content = "\n".join(file_lines[init_line - 1 :])
             else:
                 file_content = "\n".join(file_lines[init_line - 1 : final_line])
+        elif large:
+            file_content = self._read_large(path, read_head, path, MAX_VIEW_BYTES)
+        else:
+            file_content = self.read_file(path)
 
         return CLIResult(
             output=self._make_output(file_content, str(path), init_line=init_line)
         )
 
+    def create(self, path: Path, file_text: str):
+        """Implement the create command"""
+        self.write_file(path, file_text)
+        self._remember(path, file_text, file_text)
+
     def str_replace(self, path: Path, old_str: str, new_str: str | None):
         """Implement the str_replace command, which replaces old_str with new_str in the file content"""
         # Read the file content
@@ -165,37 +305,15 @@ class EditTool20250124(BaseAnthropicTool):
         old_str = old_str.expandtabs()
         new_str = new_str.expandtabs() if new_str is not None else ""
 
-        # Check if old_str is unique in the file
-        occurrences = file_content.count(old_str)
-        if occurrences == 0:
-            raise ToolError(
-                f"No replacement was performed, old_str `{old_str}` did not appear verbatim in {path}."
-            )
-        elif occurrences > 1:
-            file_content_lines = file_content.split("\n")
-            lines = [
-                idx + 1
-                for idx, line in enumerate(file_content_lines)
-                if old_str in line
-            ]
-            raise ToolError(
-                f"No replacement was performed. Multiple occurrences of old_str `{old_str}` in lines {lines}. Please ensure it is unique"
-            )
-
-        # Replace old_str with new_str
-        new_file_content = file_content.replace(old_str, new_str)
+        new_file_content, start_line, snippet = replace_once(
+            file_content, old_str, new_str, path
+        )
 
         # Write the new content to the file
         self.write_file(path, new_file_content)
 
         # Save the content to history
-        self._file_history[path].append(file_content)
-
-        # Create a snippet of the edited section
-        replacement_line = file_content.split(old_str)[0].count("\n")
-        start_line = max(0, replacement_line - SNIPPET_LINES)
-        end_line = replacement_line + SNIPPET_LINES + new_str.count("\n")
-        snippet = "\n".join(new_file_content.split("\n")[start_line : end_line + 1])
+        self._remember(path, file_content, new_file_content)
 
         # Prepare the success message
         success_msg = f"The file {path} has been edited. "
@@ -206,276 +324,40 @@ class EditTool20250124(BaseAnthropicTool):
 
         return CLIResult(output=success_msg)
 
-    def insert(self, path: Path, insert_line: int, new_str: str):
-        """Implement the insert command, which inserts new_str at the specified line in the file content."""
-        file_text = self.read_file(path).expandtabs()
-        new_str = new_str.expandtabs()
-        file_text_lines = file_text.split("\n")
-        n_lines_file = len(file_text_lines)
-
-        if insert_line < 0 or insert_line > n_lines_file:
-            raise ToolError(
-                f"Invalid `insert_line` parameter: {insert_line}. It should be within the range of lines of the file: {[0, n_lines_file]}"
-            )
-
-        new_str_lines = new_str.split("\n")
-        new_file_text_lines = (
-            file_text_lines[:insert_line]
-            + new_str_lines
-            + file_text_lines[insert_line:]
-        )
-        snippet_lines = (
-            file_text_lines[max(0, insert_line - SNIPPET_LINES) : insert_line]
-            + new_str_lines
-            + file_text_lines[insert_line : insert_line + SNIPPET_LINES]
-        )
-
-        new_file_text = "\n".join(new_file_text_lines)
-        snippet = "\n".join(snippet_lines)
-
-        self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
-
-        success_msg = f"The file {path} has been edited. "
-        success_msg += self._make_output(
-            snippet,
-            "a snippet of the edited file",
-            max(1, insert_line - SNIPPET_LINES + 1),
-        )
-        success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
-        return CLIResult(output=success_msg)
-
-    def undo_edit(self, path: Path):
-        """Implement the undo_edit command."""
-        if not self._file_history[path]:
-            raise ToolError(f"No edit history found for {path}.")
-
-        old_text = self._file_history[path].pop()
-        self.write_file(path, old_text)
-
-        return CLIResult(
-            output=f"Last edit to {path} undone successfully. {self._make_output(old_text, str(path))}"
-        )
-
-    def read_file(self, path: Path):
-        """Read the content of a file from a given path; raise a ToolError if an error occurs."""
-        try:
-            return path.read_text()
-        except Exception as e:
-            raise ToolError(f"Ran into {e} while trying to read {path}") from None
-
-    def write_file(self, path: Path, file: str):
-        """Write the content of a file to a given path; raise a ToolError if an error occurs."""
-        try:
-            path.write_text(file)
-        except Exception as e:
-            raise ToolError(f"Ran into {e} while trying to write to {path}") from None
-
-    def _make_output(
-        self,
-        file_content: str,
-        file_descriptor: str,
-        init_line: int = 1,
-        expand_tabs: bool = True,
-    ):
-        """Generate output for the CLI based on the content of a file."""
-        file_content = maybe_truncate(file_content)
-        if expand_tabs:
-            file_content = file_content.expandtabs()
-        file_content = "\n".join(
-            [
-                f"{i + init_line:6}\t{line}"
-                for i, line in enumerate(file_content.split("\n"))
-            ]
-        )
-        return (
-            f"Here's the result of running `cat -n` on {file_descriptor}:\n"
-            + file_content
-            + "\n"
-        )
-
-
-class EditTool20250429(BaseAnthropicTool):
-    """
-    An filesystem editor tool that allows the agent to view, create, and edit files.
-    The tool parameters are defined by Anthropic and are not editable.
-    """
-
-    api_type: Literal["str_replace_based_edit_tool"] = "str_replace_based_edit_tool"
-    name: Literal["str_replace_based_edit_tool"] = "str_replace_based_edit_tool"
-
-    _file_history: dict[Path, list[str]]
-
-    def __init__(self):
-        self._file_history = defaultdict(list)
-        super().__init__()
-
-    def to_params(self) -> Any:
-        return {
-            "name": self.name,
-            "type": self.api_type,
-        }
-
-    async def __call__(
-        self,
-        *,
-        command: Command_20250429,
-        path: str,
-        file_text: str | None = None,
-        view_range: list[int] | None = None,
-        old_str: str | None = None,
-        new_str: str | None = None,
-        insert_line: int | None = None,
-        **kwargs,
-    ):
-        _path = Path(path)
-        self.validate_path(command, _path)
-        if command == "view":
-            return await self.view(_path, view_range)
-        elif command == "create":
-            if file_text is None:
-                raise ToolError("Parameter `file_text` is required for command: create")
-            self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
-            return ToolResult(output=f"File created successfully at: {_path}")
-        elif command == "str_replace":
-            if old_str is None:
-                raise ToolError(
-                    "Parameter `old_str` is required for command: str_replace"
-                )
-            return self.str_replace(_path, old_str, new_str)
-        elif command == "insert":
-            if insert_line is None:
-                raise ToolError(
-                    "Parameter `insert_line` is required for command: insert"
-                )
-            if new_str is None:
-                raise ToolError("Parameter `new_str` is required for command: insert")
-            return self.insert(_path, insert_line, new_str)
-        # Note: undo_edit command was removed in this version
-        raise ToolError(
-            f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(get_args(Command_20250429))}'
-        )
-
-    def validate_path(self, command: str, path: Path):
+    async def str_replace_transaction(
+        self, path: str, edits: list[tuple[str, str | None]]
+    ) -> CLIResult:
         """
-        Check that the path/command combination is valid.
+        Apply several str_replace edits to one file as a unit: the file is
+        written once, with a single rename, or not at all if any edit fails.
+        One undo_edit reverts the whole transaction.
         """
-        # Check if its an absolute path
-        if not path.is_absolute():
-            suggested_path = Path("") / path
-            raise ToolError(
-                f"The path {path} is not an absolute path, it should start with `/`. Maybe you meant {suggested_path}?"
-            )
-        # Check if path exists
-        if not path.exists() and command != "create":
-            raise ToolError(
-                f"The path {path} does not exist. Please provide a valid path."
-            )
-        if path.exists() and command == "create":
-            raise ToolError(
-                f"File already exists at: {path}. Cannot overwrite files using command `create`."
-            )
-        # Check if the path points to a directory
-        if path.is_dir():
-            if command != "view":
-                raise ToolError(
-                    f"The path {path} is a directory and only the `view` command can be used on directories"
-                )
-
-    async def view(self, path: Path, view_range: list[int] | None = None):
-        """Implement the view command"""
-        if path.is_dir():
-            if view_range:
-                raise ToolError(
-                    "The `view_range` parameter is not allowed when `path` points to a directory."
-                )
-
-            _, stdout, stderr = await run(
-                rf"find {path} -maxdepth 2 -not -path '*/\.*'"
-            )
-            if not stderr:
-                stdout = f"Here's the files and directories up to 2 levels deep in {path}, excluding hidden items:\n{stdout}\n"
-            return CLIResult(output=stdout, error=stderr)
-
-        file_content = self.read_file(path)
-        init_line = 1
-        if view_range:
-            if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
-                raise ToolError(
-                    "Invalid `view_range`. It should be a list of two integers."
-                )
-            file_lines = file_content.split("\n")
-            n_lines_file = len(file_lines)
-            init_line, final_line = view_range
-            if init_line < 1 or init_line > n_lines_file:
-                raise ToolError(
-                    f"Invalid `view_range`: {view_range}. Its first element `{init_line}` should be within the range of lines of the file: {[1, n_lines_file]}"
-                )
-            if final_line > n_lines_file:
-                raise ToolError(
-                    f"Invalid `view_range`: {view_range}. Its second element `{final_line}` should be smaller than the number of lines in the file: `{n_lines_file}`"
-                )
-            if final_line != -1 and final_line < init_line:
-                raise ToolError(
-                    f"Invalid `view_range`: {view_range}. Its second element `{final_line}` should be larger or equal than its first `{init_line}`"
-                )
-
-            if final_line == -1:
-                file_content = "\n".join(file_lines[init_line - 1 :])
-            else:
-                file_content = "\n".join(file_lines[init_line - 1 : final_line])
-
-        return CLIResult(
-            output=self._make_output(file_content, str(path), init_line=init_line)
-        )
+        _path = Path(path)
+        async with path_lock(_path):
+            await run_in_file_executor(self.validate_path, "str_replace", _path)
+            return await run_in_file_executor(self.str_replace_many, _path, edits)
 
-    def str_replace(self, path: Path, old_str: str, new_str: str | None):
-        """Implement the str_replace command, which replaces old_str with new_str in the file content"""
-        # Read the file content
+    def str_replace_many(self, path: Path, edits: list[tuple[str, str | None]]):
+        """Implement a str_replace transaction"""
         file_content = self.read_file(path).expandtabs()
-        old_str = old_str.expandtabs()
-        new_str = new_str.expandtabs() if new_str is not None else ""
-
-        # Check if old_str is unique in the file
-        occurrences = file_content.count(old_str)
-        if occurrences == 0:
-            raise ToolError(
-                f"No replacement was performed, old_str `{old_str}` did not appear verbatim in {path}."
+        new_file_content = file_content
+        outputs = []
+        for old_str, new_str in edits:
+            old_str = old_str.expandtabs()
+            new_str = new_str.expandtabs() if new_str is not None else ""
+            new_file_content, start_line, snippet = replace_once(
+                new_file_content, old_str, new_str, path
             )
-        elif occurrences > 1:
-            file_content_lines = file_content.split("\n")
-            lines = [
-                idx + 1
-                for idx, line in enumerate(file_content_lines)
-                if old_str in line
-            ]
-            raise ToolError(
-                f"No replacement was performed. Multiple occurrences of old_str `{old_str}` in lines {lines}. Please ensure it is unique"
+            outputs.append(
+                self._make_output(snippet, f"a snippet of {path}", start_line + 1)
             )
 
-        # Replace old_str with new_str
-        new_file_content = file_content.replace(old_str, new_str)
-
-        # Write the new content to the file
         self.write_file(path, new_file_content)
+        self._remember(path, file_content, new_file_content)
 
-        # Save the content to history
-        self._file_history[path].append(file_content)
-
-        # Create a snippet of the edited section
-        replacement_line = file_content.split(old_str)[0].count("\n")
-        start_line = max(0, replacement_line - SNIPPET_LINES)
-        end_line = replacement_line + SNIPPET_LINES + new_str.count("\n")
-        snippet = "\n".join(new_file_content.split("\n")[start_line : end_line + 1])
-
-        # Prepare the success message
-        success_msg = f"The file {path} has been edited. "
-        success_msg += self._make_output(
-            snippet, f"a snippet of {path}", start_line + 1
-        )
+        success_msg = f"The file {path} has been edited with {len(edits)} replacements. "
+        success_msg += "".join(outputs)
         success_msg += "Review the changes and make sure they are as expected. Edit the file again if necessary."
-
         return CLIResult(output=success_msg)
 
     def insert(self, path: Path, insert_line: int, new_str: str):
@@ -506,7 +388,7 @@ class EditTool20250429(BaseAnthropicTool):
         snippet = "\n".join(snippet_lines)
 
         self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
+        self._remember(path, file_text, new_file_text)
 
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
@@ -517,7 +399,10 @@ class EditTool20250429(BaseAnthropicTool):
         success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
         return CLIResult(output=success_msg)
 
-    # Note: undo_edit method is not implemented in this version as it was removed
+    def _remember(self, path: Path, text: str, written: str):
+        """Record `text` as what undoing the edit that wrote `written` restores"""
+        if self._file_history is not None:
+            self._file_history.push(path, text, written)
 
     def read_file(self, path: Path):
         """Read the content of a file from a given path; raise a ToolError if an error occurs."""
@@ -526,10 +411,23 @@ class EditTool20250429(BaseAnthropicTool):
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to read {path}") from None
 
+    def _stat(self, path: Path):
+        try:
+            return path.stat()
+        except Exception as e:
+            raise ToolError(f"Ran into {e} while trying to read {path}") from None
+
+    def _read_large(self, path: Path, read: Callable[..., T], *args) -> T:
+        """Call a line index reader, raising a ToolError like `read_file` does"""
+        try:
+            return read(*args)
+        except (OSError, UnicodeDecodeError) as e:
+            raise ToolError(f"Ran into {e} while trying to read {path}") from None
+
     def write_file(self, path: Path, file: str):
         """Write the content of a file to a given path; raise a ToolError if an error occurs."""
         try:
-            path.write_text(file)
+            atomic_write_text(path, file)
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to write to {path}") from None
 
@@ -557,5 +455,30 @@ class EditTool20250429(BaseAnthropicTool):
         )
 
 
+class EditTool20250124(BaseEditTool, BaseAnthropicTool):
+    api_type: Literal["text_editor_20250124"] = "text_editor_20250124"
+    name: Literal["str_replace_editor"] = "str_replace_editor"
+    commands = get_args(Command_20250124)
+
+    def undo_edit(self, path: Path):
+        """Implement the undo_edit command."""
+        old_text = self._file_history.pop(path)
+        if old_text is None:
+            raise ToolError(f"No edit history found for {path}.")
+
+        self.write_file(path, old_text)
+
+        return CLIResult(
+            output=f"Last edit to {path} undone successfully. {self._make_output(old_text, str(path))}"
+        )
+
+
+class EditTool20250429(BaseEditTool, BaseAnthropicTool):
+    api_type: Literal["str_replace_based_edit_tool"] = "str_replace_based_edit_tool"
+    name: Literal["str_replace_based_edit_tool"] = "str_replace_based_edit_tool"
+    # undo_edit was removed in this version
+    commands = get_args(Command_20250429)
+
+
 class EditTool20241022(EditTool20250124):
     api_type: Literal["text_editor_20250429"] = "text_editor_20250429"  # pyright: ignore[reportIncompatibleVariableOverride]
@@ -1,9 +1,11 @@
 from dataclasses import dataclass
-from typing import Literal
+from functools import lru_cache
+from typing import Any, Literal
 
 from .base import BaseAnthropicTool
 from .bash import BashTool20241022, BashTool20250124
-from .computer import ComputerTool20241022, ComputerTool20250124
+from .collection import ToolCollection, ToolDefinitions
+from .computer import ComputerTool20241022, ComputerTool20250124, display_config
 from .edit import EditTool20241022, EditTool20250124, EditTool20250429
 
 ToolVersion = Literal[
@@ -20,6 +22,20 @@ class ToolGroup:
     tools: list[type[BaseAnthropicTool]]
     beta_flag: BetaFlag | None = None
 
+    def create_tools(self) -> list[BaseAnthropicTool]:
+        """New instances of the group's tools, for one session"""
+        return [tool() for tool in self.tools]
+
+    def definitions(self) -> ToolDefinitions:
+        """The group's tool params for the current display, built once"""
+        return _definitions(self.version, display_config())
+
+    def collection(
+        self, collection_class: type[ToolCollection] = ToolCollection, **kwargs: Any
+    ) -> ToolCollection:
+        """A collection of new tools sharing the group's cached definitions"""
+        return collection_class(*self.create_tools(), definitions=self.definitions(), **kwargs)
+
 
 TOOL_GROUPS: list[ToolGroup] = [
     ToolGroup(
@@ -40,3 +56,10 @@ TOOL_GROUPS: list[ToolGroup] = [
 ]
 
 TOOL_GROUPS_BY_VERSION = {tool_group.version: tool_group for tool_group in TOOL_GROUPS}
+
+
+@lru_cache(maxsize=None)
+def _definitions(version: ToolVersion, display: tuple[int, int, int | None]) -> ToolDefinitions:
+    # the display is part of the key, the computer tool reads it when created
+    tools = TOOL_GROUPS_BY_VERSION[version].create_tools()
+    return ToolDefinitions.from_params([tool.to_params() for tool in tools])
@@ -0,0 +1,106 @@
+"""Newline index for viewing line ranges of large files without reading them whole."""
+
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from pathlib import Path
+
+INDEX_BLOCK_SIZE: int = 1024 * 1024
+LINE_INDEX_CACHE_SIZE: int = 16
+
+
+class LineIndex:
+    """
+    Number of newlines before each fixed-size block of a file.
+
+    Counting newlines per block is a single fast pass over the file and keeps
+    the index tiny (one integer per block); the exact offset of a line is then
+    found by scanning a single block.
+    """
+
+    def __init__(self, path: Path, size: int, newlines_before: array, newlines: int):
+        self.path = path
+        self.size = size
+        self.newlines_before = newlines_before
+        self.newlines = newlines
+
+    @classmethod
+    def build(cls, path: Path) -> "LineIndex":
+        newlines_before = array("Q")
+        newlines = 0
+        size = 0
+        with open(path, "rb") as f:
+            while block := f.read(INDEX_BLOCK_SIZE):
+                newlines_before.append(newlines)
+                newlines += block.count(b"\n")
+                size += len(block)
+        return cls(path, size, newlines_before, newlines)
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines as counted by `str.split("\\n")`"""
+        return self.newlines + 1
+
+    def newline_offset(self, f, k: int) -> int:
+        """Byte offset of the k-th (1-based) newline of the open file `f`"""
+        block_index = bisect_left(self.newlines_before, k) - 1
+        f.seek(block_index * INDEX_BLOCK_SIZE)
+        block = f.read(INDEX_BLOCK_SIZE)
+        position = -1
+        for _ in range(k - self.newlines_before[block_index]):
+            position = block.find(b"\n", position + 1)
+        return block_index * INDEX_BLOCK_SIZE + position
+
+    def read_lines(self, init_line: int, final_line: int, max_bytes: int | None = None) -> str:
+        """
+        Lines `init_line` to `final_line` (1-based, inclusive, -1 for the end),
+        joined by newlines; at most `max_bytes` are read.
+        """
+        with open(self.path, "rb") as f:
+            start = 0 if init_line == 1 else self.newline_offset(f, init_line - 1) + 1
+            if final_line == -1 or final_line == self.line_count:
+                end = self.size
+            else:
+                end = self.newline_offset(f, final_line)
+            return read_span(f, start, end, max_bytes)
+
+
+def read_span(f, start: int, end: int, max_bytes: int | None = None) -> str:
+    """Decode bytes `start` to `end` of `f`, cutting at `max_bytes`"""
+    clipped = max_bytes is not None and end - start > max_bytes
+    f.seek(start)
+    data = f.read(max_bytes if clipped else end - start)
+    # a clipped read may end inside a multi-byte character
+    text = data.decode("utf-8", errors="ignore" if clipped else "strict")
+    # match the newline translation of `Path.read_text` for CRLF files
+    return text.replace("\r\n", "\n")
+
+
+def read_head(path: Path, max_bytes: int | None = None) -> str:
+    """Decode the start of a file, at most `max_bytes` of it"""
+    with open(path, "rb") as f:
+        return read_span(f, 0, os.fstat(f.fileno()).st_size, max_bytes)
+
+
+_cache: "OrderedDict[tuple[str, int, int], LineIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_line_index(path: Path, stat: os.stat_result) -> LineIndex:
+    """Line index of `path`, cached while its mtime and size are unchanged"""
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+    index = LineIndex.build(path)
+    with _cache_lock:
+        for stale in [k for k in _cache if k[0] == key[0]]:
+            del _cache[stale]
+        _cache[key] = index
+        while len(_cache) > LINE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
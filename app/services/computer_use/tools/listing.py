@@ -0,0 +1,103 @@
+"""Directory listing for the editor tool's view command, without spawning `find`."""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+LIST_MAX_DEPTH: int = 2
+LIST_MAX_ENTRIES: int = 1000
+LIST_CACHE_TTL: float = 2.0
+LIST_CACHE_SIZE: int = 64
+
+
+@dataclass(frozen=True)
+class Listing:
+    lines: list[str]
+    errors: list[str]
+    truncated: bool
+    # (directory, mtime_ns) of every directory that was read
+    directories: tuple[tuple[str, int], ...]
+
+
+def _scan(root: str, max_depth: int, max_entries: int, details: bool) -> Listing:
+    """Depth-first walk in name order, skipping hidden entries like `-not -path '*/.*'`"""
+    lines = [root]
+    errors: list[str] = []
+    directories: list[tuple[str, int]] = []
+    truncated = False
+
+    def walk(directory: str, depth: int) -> None:
+        nonlocal truncated
+        try:
+            directories.append((directory, os.stat(directory).st_mtime_ns))
+            with os.scandir(directory) as it:
+                entries = sorted((e for e in it if not e.name.startswith(".")), key=lambda e: e.name)
+        except OSError as e:
+            errors.append(f"{directory}: {e.strerror}")
+            return
+        for entry in entries:
+            if len(lines) > max_entries:
+                truncated = True
+                return
+            line = entry.path
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if details:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    mtime = datetime.fromtimestamp(st.st_mtime, timezone.utc).strftime("%Y-%m-%d %H:%M")
+                    line = f"{line}\t{'-' if is_dir else st.st_size}\t{mtime}"
+                except OSError:
+                    pass
+            lines.append(line)
+            if is_dir and depth < max_depth:
+                walk(entry.path, depth + 1)
+                if truncated:
+                    return
+
+    walk(root, 1)
+    return Listing(lines, errors, truncated, tuple(directories))
+
+
+_cache: "OrderedDict[tuple, tuple[float, Listing]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _unchanged(listing: Listing) -> bool:
+    try:
+        return all(os.stat(d).st_mtime_ns == mtime for d, mtime in listing.directories)
+    except OSError:
+        return False
+
+
+def list_directory(
+    path: str,
+    max_depth: int = LIST_MAX_DEPTH,
+    max_entries: int = LIST_MAX_ENTRIES,
+    details: bool = False,
+    ttl: float = LIST_CACHE_TTL,
+) -> Listing:
+    """
+    Entries of `path` up to `max_depth` levels deep, at most `max_entries` of
+    them, optionally with sizes and modification times.
+
+    Listings are cached for `ttl` seconds, as long as the mtime of every
+    directory read is unchanged.
+    """
+    root = os.path.normpath(path)
+    key = (root, max_depth, max_entries, details)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached and cached[0] > now and _unchanged(cached[1]):
+        return cached[1]
+
+    listing = _scan(root, max_depth, max_entries, details)
+    with _cache_lock:
+        _cache[key] = (now + ttl, listing)
+        _cache.move_to_end(key)
+        while len(_cache) > LIST_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return listing
@@ -1,9 +1,89 @@
 """Utility to run shell commands asynchronously with a timeout."""
 
 import asyncio
+import os
+import re
+import shlex
+import shutil
+from dataclasses import dataclass
+
+from app.core.config import settings
+
+from .supervisor import supervisor
 
 TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
 MAX_RESPONSE_LEN: int = 16000
+READ_CHUNK_SIZE: int = 64 * 1024
+# UTF-8 needs at most this many bytes per character
+MAX_CHAR_BYTES: int = 4
+
+# anything the shell would interpret beyond word splitting and quoting
+SHELL_SYNTAX = re.compile(r"[|&;<>()$`\\*?\[\]{}~#\n]")
+ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+# words that mean something else, or nothing at all, outside of a shell
+SHELL_BUILTINS = frozenset(
+    """
+    ! . : [ [[ ]] { } alias bg bind break builtin caller case cd command compgen complete
+    continue declare dirs disown do done echo elif else enable esac eval exec exit export
+    false fc fg fi for function getopts hash help history if in jobs kill let local logout
+    popd printf pushd pwd read readonly return select set shift shopt source suspend test
+    then time times trap true type typeset ulimit umask unalias unset until wait while
+    """.split()
+)
+PRLIMIT: str | None = shutil.which("prlimit")
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """
+    Per-command rlimits; None leaves a limit unchanged.
+
+    The limits are set by the command line itself, with prlimit or the shell's
+    ulimit, rather than between fork and exec: a preexec_fn can deadlock the
+    child of a process running threads.
+    """
+
+    cpu_seconds: int | None = None
+    memory_bytes: int | None = None
+    file_size_bytes: int | None = None
+
+    def exec_argv(self, argv: list[str]) -> list[str] | None:
+        """`argv` run under the limits by prlimit, or None if prlimit is missing"""
+        options = [
+            f"--{name}={value}"
+            for name, value in (
+                ("cpu", self.cpu_seconds),
+                ("as", self.memory_bytes),
+                ("fsize", self.file_size_bytes),
+            )
+            if value is not None
+        ]
+        if not options:
+            return argv
+        if PRLIMIT is None:
+            return None
+        return [PRLIMIT, *options, "--", *argv]
+
+    def shell_command(self, cmd: str) -> str:
+        """`cmd` preceded by the ulimit commands setting the limits"""
+        ulimits = [
+            f"ulimit {option} {value} 2>/dev/null"
+            for option, value in (
+                ("-t", self.cpu_seconds),
+                # kilobytes and 512 byte blocks
+                ("-v", self.memory_bytes and self.memory_bytes // 1024),
+                ("-f", self.file_size_bytes and self.file_size_bytes // 512),
+            )
+            if value is not None
+        ]
+        return "; ".join(ulimits) + "\n" + cmd if ulimits else cmd
+
+
+DEFAULT_LIMITS = ResourceLimits(
+    cpu_seconds=settings.RUN_CPU_SECONDS or None,
+    memory_bytes=settings.RUN_MEMORY_BYTES or None,
+    file_size_bytes=settings.RUN_FILE_SIZE_BYTES or None,
+)
 
 
 def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
@@ -15,28 +95,147 @@ def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
     )
 
 
+def _join_head_tail(head: str, tail: str, truncate_after: int) -> str:
+    """Head and tail of an output too long to keep whole, a quarter of it tail"""
+    tail_len = truncate_after // 4
+    return (
+        head[: truncate_after - tail_len]
+        + TRUNCATED_MESSAGE
+        + (tail[-tail_len:] if tail_len else "")
+    )
+
+
+class _HeadTailBuffer:
+    """Keeps the first and last bytes of a stream, enough for `truncate_after` characters"""
+
+    def __init__(self, truncate_after: int | None):
+        self.truncate_after = truncate_after
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = False
+        if truncate_after:
+            self.head_cap = truncate_after * MAX_CHAR_BYTES
+            self.tail_cap = (truncate_after // 4) * MAX_CHAR_BYTES
+
+    def feed(self, data: bytes) -> None:
+        if not self.truncate_after:
+            self.head += data
+            return
+        room = self.head_cap - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_cap:
+                del self.tail[: len(self.tail) - self.tail_cap]
+                self.dropped = True
+
+    def text(self) -> str:
+        if not self.dropped:
+            text = (self.head + self.tail).decode(errors="replace")
+            if not self.truncate_after or len(text) <= self.truncate_after:
+                return text
+            return _join_head_tail(text, text, self.truncate_after)
+        # the cuts may fall inside multi-byte characters
+        return _join_head_tail(
+            self.head.decode(errors="ignore"),
+            self.tail.decode(errors="ignore"),
+            self.truncate_after,
+        )
+
+
+async def _write_stream(stream: asyncio.StreamWriter, data: bytes) -> None:
+    try:
+        stream.write(data)
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # the command exited without reading all of it
+        pass
+    finally:
+        stream.close()
+
+
+async def _read_stream(stream: asyncio.StreamReader, truncate_after: int | None) -> str:
+    buffer = _HeadTailBuffer(truncate_after)
+    while chunk := await stream.read(READ_CHUNK_SIZE):
+        buffer.feed(chunk)
+    return buffer.text()
+
+
+def _executable(program: str) -> bool:
+    return program not in SHELL_BUILTINS and shutil.which(program) is not None
+
+
+def parse_exec(cmd: str) -> tuple[list[str], dict[str, str]] | None:
+    """
+    Split a command that needs no shell into arguments and leading `VAR=value`
+    assignments, or return None if it uses shell syntax.
+    """
+    if SHELL_SYNTAX.search(cmd):
+        return None
+    try:
+        words = shlex.split(cmd)
+    except ValueError:
+        return None
+    env = {}
+    while words and ASSIGNMENT.match(words[0]):
+        name, _, value = words.pop(0).partition("=")
+        env[name] = value
+    if not words:
+        return None
+    return words, env
+
+
 async def run(
     cmd: str,
     timeout: float | None = 120.0,  # seconds
     truncate_after: int | None = MAX_RESPONSE_LEN,
+    limits: ResourceLimits | None = DEFAULT_LIMITS,
+    input: bytes | None = None,
 ):
-    """Run a shell command asynchronously with a timeout."""
-    process = await asyncio.create_subprocess_shell(
-        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    """
+    Run a command asynchronously with a timeout.
+
+    Commands wait for a slot of the shared supervisor, and those without
+    shell syntax running a program rather than a shell builtin are executed
+    directly instead of through /bin/sh. Output is
+    read as it arrives and only its head and tail are kept, so a command
+    printing gigabytes costs a bounded amount of memory. `input` is written to
+    the command's stdin.
+    """
+    options = dict(
+        stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
     )
+    limits = limits or ResourceLimits()
+    parsed = parse_exec(cmd)
+    argv = None
+    if parsed and _executable(parsed[0][0]):
+        argv, env = parsed
+        argv = limits.exec_argv(argv)
+    async with supervisor.slot():
+        if argv:
+            process = await supervisor.spawn_exec(
+                *argv, env={**os.environ, **env} if env else None, **options
+            )
+        else:
+            process = await supervisor.spawn_shell(limits.shell_command(cmd), **options)
 
-    try:
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-        return (
-            process.returncode or 0,
-            maybe_truncate(stdout.decode(), truncate_after=truncate_after),
-            maybe_truncate(stderr.decode(), truncate_after=truncate_after),
-        )
-    except asyncio.TimeoutError as exc:
+        io = [
+            _read_stream(process.stdout, truncate_after),
+            _read_stream(process.stderr, truncate_after),
+            process.wait(),
+        ]
+        if input is not None:
+            io.append(_write_stream(process.stdin, input))
         try:
-            process.kill()
-        except ProcessLookupError:
-            pass
-        raise TimeoutError(
-            f"Command '{cmd}' timed out after {timeout} seconds"
-        ) from exc
+            stdout, stderr, *_ = await asyncio.wait_for(asyncio.gather(*io), timeout=timeout)
+            return process.returncode or 0, stdout, stderr
+        except asyncio.TimeoutError as exc:
+            # the command's own children too, it runs in a session of its own
+            await supervisor.kill(process)
+            raise TimeoutError(
+                f"Command '{cmd}' timed out after {timeout} seconds"
+            ) from exc
@@ -0,0 +1,180 @@
+"""Spawning and tracking of tool subprocesses, shared by every session."""
+
+import asyncio
+import os
+import signal
+import time
+from collections import defaultdict, deque
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from dataclasses import replace
+from typing import Any, AsyncIterator, Iterator
+
+from app.core.config import settings
+from app.core.metrics import SUBPROCESS_SPAWN, SUBPROCESS_WAIT, SUBPROCESSES, gauge_function
+
+from .context import tool_context, use_context
+
+@contextmanager
+def session_scope(session_id: str | None) -> Iterator[None]:
+    """Attribute the subprocesses spawned in this block to a session"""
+    with use_context(replace(tool_context(), session_id=session_id)):
+        yield
+
+
+def current_session() -> str | None:
+    return tool_context().session_id
+
+
+def _signal_group(process: asyncio.subprocess.Process, sig: int) -> None:
+    # every child leads a process group of its own, see `_spawn`
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+class ProcessSupervisor:
+    """
+    Owns the subprocesses of all tools.
+
+    Commands run in a slot, bounded globally and per session, so a burst of
+    sessions queues instead of forking hundreds of processes at once. Every
+    child is tracked under the session that spawned it and its whole process
+    group is terminated when the session closes.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int | None = None,
+        max_per_session: int | None = None,
+        kill_grace: float | None = None,
+    ):
+        self.max_concurrent = max_concurrent or settings.SUBPROCESS_MAX_CONCURRENT
+        self.max_per_session = max_per_session or settings.SUBPROCESS_MAX_PER_SESSION
+        self.kill_grace = settings.SUBPROCESS_KILL_GRACE if kill_grace is None else kill_grace
+        self._processes: dict[str | None, set[asyncio.subprocess.Process]] = defaultdict(set)
+        self._session_slots: dict[str, asyncio.Semaphore] = {}
+        # commands holding or waiting for each session's slots
+        self._session_users: dict[str, int] = defaultdict(int)
+        self._slots: asyncio.Semaphore | None = None
+        self._slots_loop: asyncio.AbstractEventLoop | None = None
+        self._spawn_ms: deque[float] = deque(maxlen=256)
+        self.spawned = 0
+
+    def _global_slots(self) -> asyncio.Semaphore:
+        # semaphores belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._slots_loop = loop
+        return self._slots
+
+    @asynccontextmanager
+    async def slot(self, session_id: str | None = None) -> AsyncIterator[None]:
+        """Wait for a free global slot, and a free slot of the session"""
+        session_id = session_id or current_session()
+        start = time.perf_counter()
+        async with AsyncExitStack() as stack:
+            # the session's own limit first, so a busy session queues without
+            # holding global slots
+            if session_id is not None:
+                session_slots = self._session_slots.setdefault(
+                    session_id, asyncio.Semaphore(self.max_per_session)
+                )
+                self._session_users[session_id] += 1
+                stack.callback(self._leave, session_id)
+                await stack.enter_async_context(session_slots)
+            await stack.enter_async_context(self._global_slots())
+            SUBPROCESS_WAIT.observe(time.perf_counter() - start)
+            yield
+
+    def _leave(self, session_id: str) -> None:
+        """A command of the session released its slot, or stopped waiting for one"""
+        self._session_users[session_id] -= 1
+        if not self._session_users[session_id]:
+            # nothing holds the session's slots, a later command starts a new semaphore
+            del self._session_users[session_id]
+            self._session_slots.pop(session_id, None)
+            self._prune(session_id)
+
+    def _prune(self, session_id: str | None) -> None:
+        """Forget the session's children that exited, and the session once none are left"""
+        processes = self._processes.get(session_id)
+        if processes is None:
+            return
+        # exited children have their returncode set by the child watcher
+        processes.difference_update([p for p in processes if p.returncode is not None])
+        if not processes:
+            del self._processes[session_id]
+
+    async def spawn_exec(self, program: str, *args: str, **kwargs: Any) -> asyncio.subprocess.Process:
+        return await self._spawn(asyncio.create_subprocess_exec, program, *args, **kwargs)
+
+    async def spawn_shell(self, cmd: str, **kwargs: Any) -> asyncio.subprocess.Process:
+        return await self._spawn(asyncio.create_subprocess_shell, cmd, **kwargs)
+
+    async def _spawn(self, create, *args: Any, session_id: str | None = None, **kwargs: Any):
+        session_id = session_id or current_session()
+        kwargs.setdefault("start_new_session", True)
+        start = time.perf_counter()
+        process = await create(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        SUBPROCESS_SPAWN.observe(elapsed)
+        self._spawn_ms.append(elapsed * 1000)
+        self.spawned += 1
+
+        self._prune(session_id)
+        self._processes[session_id].add(process)
+        return process
+
+    async def terminate(self, process: asyncio.subprocess.Process, grace: float | None = None) -> None:
+        """SIGTERM the process group, then SIGKILL it after `grace` seconds"""
+        if process.returncode is None:
+            _signal_group(process, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), self.kill_grace if grace is None else grace)
+            except asyncio.TimeoutError:
+                pass
+        # also what the leader left running in the background, even once it exited
+        await self.kill(process)
+
+    async def kill(self, process: asyncio.subprocess.Process) -> None:
+        """SIGKILL the process group and reap the process"""
+        _signal_group(process, signal.SIGKILL)
+        await process.wait()
+
+    async def terminate_session(self, session_id: str | None) -> int:
+        """Terminate every child of a session and its group; returns how many were live"""
+        processes = self._processes.pop(session_id, set())
+        # the slots go with the last command still holding or waiting for them,
+        # dropping them now would let new commands of the session run beside those
+        live = sum(p.returncode is None for p in processes)
+        await asyncio.gather(*(self.terminate(p) for p in processes))
+        return live
+
+    async def terminate_all(self) -> int:
+        counts = await asyncio.gather(*(self.terminate_session(s) for s in list(self._processes)))
+        return sum(counts)
+
+    def live(self, session_id: str | None = None) -> int:
+        if session_id is not None:
+            return sum(p.returncode is None for p in self._processes.get(session_id, ()))
+        return sum(p.returncode is None for ps in self._processes.values() for p in ps)
+
+    def stats(self) -> dict[str, Any]:
+        """Live children per session and recent spawn latency"""
+        by_session = {s: self.live(s) for s in self._processes if s is not None}
+        spawn_ms = sorted(self._spawn_ms)
+        return {
+            "live": self.live(),
+            "by_session": {s: n for s, n in by_session.items() if n},
+            "spawned": self.spawned,
+            "spawn_ms": {
+                "p50": spawn_ms[len(spawn_ms) // 2] if spawn_ms else None,
+                "max": spawn_ms[-1] if spawn_ms else None,
+            },
+        }
+
+
+supervisor = ProcessSupervisor()
+gauge_function(SUBPROCESSES, supervisor.live)
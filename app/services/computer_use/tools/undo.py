@@ -0,0 +1,215 @@
+"""Bounded undo history for the editor tool, stored as compressed reverse diffs."""
+
+import hashlib
+import pickle
+import shutil
+import tempfile
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.core.config import settings
+
+
+COMPARE_CHUNK: int = 4096
+COMPRESSION_LEVEL: int = 1
+
+
+def _common_prefix(a: str, b: str, limit: int) -> int:
+    """Length of the common prefix of `a` and `b`, at most `limit`"""
+    n = 0
+    while n < limit:
+        step = min(COMPARE_CHUNK, limit - n)
+        if a[n : n + step] != b[n : n + step]:
+            while a[n] == b[n]:
+                n += 1
+            return n
+        n += step
+    return n
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix of `a` and `b`, at most `limit`"""
+    n = 0
+    len_a, len_b = len(a), len(b)
+    while n < limit:
+        step = min(COMPARE_CHUNK, limit - n)
+        if a[len_a - n - step : len_a - n] != b[len_b - n - step : len_b - n]:
+            while a[len_a - n - 1] == b[len_b - n - 1]:
+                n += 1
+            return n
+        n += step
+    return n
+
+
+@dataclass(frozen=True)
+class ReverseDiff:
+    """Turns `base` back into an older text: base[:prefix] + middle + base[len - suffix:]"""
+
+    prefix: int
+    suffix: int
+    middle: bytes  # zlib compressed UTF-8
+
+    @classmethod
+    def between(cls, base: str, target: str) -> "ReverseDiff":
+        prefix = _common_prefix(base, target, min(len(base), len(target)))
+        suffix = _common_suffix(base, target, min(len(base), len(target)) - prefix)
+        middle = target[prefix : len(target) - suffix]
+        return cls(prefix, suffix, _compress(middle))
+
+    def apply(self, base: str) -> str:
+        return base[: self.prefix] + _decompress(self.middle) + base[len(base) - self.suffix :]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.middle) + 64
+
+
+@dataclass(frozen=True)
+class UndoEntry:
+    # text to restore, from the content written by the edit
+    restore: ReverseDiff
+    # content written by the previous edit, from the restored text; None when
+    # they are equal, i.e. the file was not changed outside the editor in between
+    relink: ReverseDiff | None
+
+    @property
+    def nbytes(self) -> int:
+        return self.restore.nbytes + (self.relink.nbytes if self.relink else 0)
+
+
+@dataclass
+class PathHistory:
+    head: bytes | None = None  # compressed content written by the latest edit
+    entries: list[UndoEntry] = field(default_factory=list)
+    spill_file: Path | None = None
+
+    @property
+    def nbytes(self) -> int:
+        if self.spill_file:
+            return 0
+        return len(self.head or b"") + sum(entry.nbytes for entry in self.entries)
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8", "surrogatepass"), COMPRESSION_LEVEL)
+
+
+def _decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8", "surrogatepass")
+
+
+class UndoHistory:
+    """
+    Per-path stacks of texts to restore, for one editor tool (i.e. one session).
+
+    Only the content written by the latest edit of a path is kept whole, and
+    compressed; each older text is a compressed reverse diff against the text
+    above it. Paths keep at most `max_depth` entries, and when the history
+    grows over `byte_budget` the least recently used paths lose their oldest
+    entries, or are written to `spill_dir` if one is given.
+    """
+
+    def __init__(
+        self,
+        max_depth: int | None = None,
+        byte_budget: int | None = None,
+        spill_dir: str | Path | None = None,
+    ):
+        self.max_depth = max_depth or settings.EDIT_UNDO_MAX_DEPTH
+        self.byte_budget = byte_budget or settings.EDIT_UNDO_BYTE_BUDGET
+        spill_dir = spill_dir or settings.EDIT_UNDO_SPILL_DIR
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self._spill_root: Path | None = None
+        self._paths: OrderedDict[Path, PathHistory] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def push(self, path: Path, text: str, written: str) -> None:
+        """Remember `text` to be restored by the next undo of an edit that wrote `written`"""
+        with self._lock:
+            history = self._load(path)
+            self._nbytes -= history.nbytes
+            relink = None
+            if history.head is not None:
+                previous = _decompress(history.head)
+                if previous != text:
+                    relink = ReverseDiff.between(text, previous)
+            history.entries.append(UndoEntry(ReverseDiff.between(written, text), relink))
+            history.head = _compress(written)
+            del history.entries[: -self.max_depth]
+            self._nbytes += history.nbytes
+            self._paths.move_to_end(path)
+            self._enforce_budget()
+
+    def pop(self, path: Path) -> str | None:
+        """The text to restore for the latest edit of `path`, or None without history"""
+        with self._lock:
+            if path not in self._paths:
+                return None
+            history = self._load(path)
+            if not history.entries:
+                return None
+            self._nbytes -= history.nbytes
+            entry = history.entries.pop()
+            text = entry.restore.apply(_decompress(history.head))
+            if history.entries:
+                history.head = _compress(entry.relink.apply(text) if entry.relink else text)
+                self._nbytes += history.nbytes
+            else:
+                del self._paths[path]
+            return text
+
+    def clear(self) -> None:
+        with self._lock:
+            self._paths.clear()
+            self._nbytes = 0
+            if self._spill_root:
+                shutil.rmtree(self._spill_root, ignore_errors=True)
+                self._spill_root = None
+
+    def _load(self, path: Path) -> PathHistory:
+        history = self._paths.setdefault(path, PathHistory())
+        if history.spill_file:
+            with history.spill_file.open("rb") as f:
+                history.head, history.entries = pickle.load(f)
+            history.spill_file.unlink(missing_ok=True)
+            history.spill_file = None
+            self._nbytes += history.nbytes
+        self._paths.move_to_end(path)
+        return history
+
+    def _enforce_budget(self) -> None:
+        for path, history in list(self._paths.items()):
+            if self._nbytes <= self.byte_budget:
+                return
+            if history.spill_file:
+                continue
+            self._nbytes -= history.nbytes
+            if self.spill_dir:
+                self._spill(path, history)
+                continue
+            # drop the oldest entries first, the whole path once nothing is left
+            while history.entries and self._nbytes + history.nbytes > self.byte_budget:
+                history.entries.pop(0)
+            if history.entries:
+                self._nbytes += history.nbytes
+            else:
+                del self._paths[path]
+
+    def _spill(self, path: Path, history: PathHistory) -> None:
+        if self._spill_root is None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._spill_root = Path(tempfile.mkdtemp(prefix="undo-", dir=self.spill_dir))
+            weakref.finalize(self, shutil.rmtree, self._spill_root, True)
+        spill_file = self._spill_root / f"{hashlib.sha1(str(path).encode()).hexdigest()}.pickle"
+        with spill_file.open("wb") as f:
+            pickle.dump((history.head, history.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        history.head, history.entries, history.spill_file = None, [], spill_file
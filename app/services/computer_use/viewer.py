@@ -0,0 +1,155 @@
+"""
+Live view of a session's display, streamed over its WebSocket instead of VNC.
+
+Frames are captured by the session's computer tool, like its screenshots,
+and compared with the previous frame in the image pool; only the rectangles
+that changed are sent, in one binary message per frame (little-endian):
+
+    uint8   FRAME_MESSAGE
+    uint32  sequence number, acknowledged by the viewer once it is drawn
+    uint16  width, uint16 height of the display as streamed
+    uint16  number of rectangles, then for each of them
+            uint16 x, y, width, height, uint32 length and `length` bytes of WebP
+
+At most VIEWER_MAX_UNACKED frames are sent ahead of the acknowledgements,
+so the frame rate follows what the viewer's connection takes, up to
+VIEWER_MAX_FPS. While the display doesn't change, captures slow down to one
+every VIEWER_IDLE_INTERVAL.
+"""
+
+import asyncio
+import struct
+import tempfile
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.metrics import VIEWER_BYTES, VIEWER_FRAMES
+from app.services.computer_use.imaging import image_pool
+
+FRAME_MESSAGE = 1
+FRAME_HEADER = struct.Struct("<BIHH")
+
+
+class CaptureError(RuntimeError):
+    """The display could not be captured"""
+
+
+async def session_display(session_id: str) -> Any | None:
+    """
+    The computer tool of a session, or one on the same display when the
+    agent hasn't started using it yet or the session is held by another
+    worker; None if there is no such session.
+    """
+    from sqlalchemy import select
+
+    from app.core.database import AsyncSessionLocal
+    from app.models.session import Session
+    from app.services.computer_use.agent_service import agent_service
+    from app.services.computer_use.tools.computer import BaseComputerTool
+
+    session_info = agent_service.active_sessions.get(session_id)
+    if session_info is None:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Session.id).where(Session.session_id == session_id))
+            if result.scalar_one_or_none() is None:
+                return None
+        return BaseComputerTool()
+    computer = getattr(session_info.get("tools"), "tool_map", {}).get("computer")
+    if isinstance(computer, BaseComputerTool):
+        return computer
+    return BaseComputerTool()
+
+
+class FrameStream:
+    """Frames of a display for one viewer, which has its own copy of the screen"""
+
+    def __init__(
+        self,
+        display: Any,
+        send: Callable[[bytes], Awaitable[None]],
+        max_fps: float | None = None,
+    ):
+        self.display = display
+        self.send = send
+        self.min_interval = 1 / (max_fps or settings.VIEWER_MAX_FPS)
+        self.sent = 0
+        self.acked = 0
+        self._window = asyncio.Event()
+        self._window.set()
+        self._keyframe = True
+        # the last frame sent, as raw RGB of `_size`
+        self._previous: SharedMemory | None = None
+        self._size = (0, 0)
+        self._path = Path(tempfile.gettempdir()) / f"viewer_{uuid4().hex}.png"
+
+    def ack(self, sequence: int) -> None:
+        """The viewer drew the frames up to `sequence`"""
+        self.acked = max(self.acked, min(sequence, self.sent))
+        if self.sent - self.acked < settings.VIEWER_MAX_UNACKED:
+            self._window.set()
+
+    def keyframe(self) -> None:
+        """Send the whole display next, e.g. when the viewer lost what it drew"""
+        self._keyframe = True
+
+    async def update(self) -> bytes | None:
+        """The rectangles that changed since the last frame, None if none did"""
+        transform = self.display.transform
+        # the resolution the model sees, which is all the agent works with
+        size = (transform.target_width, transform.target_height)
+        if size != self._size:
+            self._release()
+            self._previous = SharedMemory(create=True, size=size[0] * size[1] * 3)
+            self._size = size
+            self._keyframe = True
+        keyframe, self._keyframe = self._keyframe, False
+        try:
+            result = await self.display.capture(self._path)
+            if not self._path.exists():
+                raise CaptureError(f"Failed to capture the display: {result.error}")
+            update = await image_pool.frame_update(
+                self._path, self._previous, keyframe, *size, settings.VIEWER_QUALITY
+            )
+        except BaseException:
+            # the previous frame may be half replaced
+            self._keyframe = True
+            raise
+        finally:
+            self._path.unlink(missing_ok=True)
+        if not struct.unpack_from("<H", update)[0]:
+            return None
+        return update
+
+    async def run(self) -> None:
+        """Stream frames until cancelled"""
+        loop = asyncio.get_running_loop()
+        interval = self.min_interval
+        try:
+            while True:
+                await self._window.wait()
+                started = loop.time()
+                update = await self.update()
+                if update is None:
+                    interval = min(interval * 2, settings.VIEWER_IDLE_INTERVAL)
+                else:
+                    interval = self.min_interval
+                    self.sent += 1
+                    if self.sent - self.acked >= settings.VIEWER_MAX_UNACKED:
+                        self._window.clear()
+                    message = FRAME_HEADER.pack(FRAME_MESSAGE, self.sent, *self._size) + update
+                    await self.send(message)
+                    VIEWER_FRAMES.inc()
+                    VIEWER_BYTES.inc(len(message))
+                await asyncio.sleep(max(0.0, started + interval - loop.time()))
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        if self._previous is not None:
+            self._previous.close()
+            self._previous.unlink()
+            self._previous = None
+            self._size = (0, 0)
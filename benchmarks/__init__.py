@@ -0,0 +1,3 @@
+"""
+Benchmarks and load generators for the Energetic Backend
+"""
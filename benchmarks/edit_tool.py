@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Latency of other sessions while the editor tool works on a large file
+
+One "heavy" session repeatedly views and edits a large file while a number of
+"light" sessions make small edits to their own files. The light sessions'
+latency is measured with the heavy work done inline on the event loop (the
+old behaviour) and through the editor tool's thread pool:
+
+    python -m benchmarks.edit_tool --size-mb 50 --light-sessions 20
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.services.computer_use.tools.edit import EditTool20250124
+from benchmarks.stats import format_summary, summarize
+
+MODES = ("inline", "executor")
+
+
+def make_large_file(path: Path, size_mb: float) -> None:
+    line = "2024-01-01T00:00:00Z INFO request handled in 12ms path=/api/v1/sessions status=200\n"
+    repeats = int(size_mb * 1024 * 1024 / len(line))
+    path.write_text(line * repeats + "MARKER 0\n")
+
+
+async def heavy_session(tool: EditTool20250124, path: Path, mode: str, stop: asyncio.Event) -> int:
+    """Alternate full views and single edits of the large file"""
+    operations = 0
+    while not stop.is_set():
+        old, new = f"MARKER {operations}", f"MARKER {operations + 1}"
+        if mode == "inline":
+            tool.view_file(path)
+            tool.str_replace(path, old, new)
+            await asyncio.sleep(0)
+        else:
+            await tool(command="view", path=str(path))
+            await tool(command="str_replace", path=str(path), old_str=old, new_str=new)
+        operations += 1
+    return operations
+
+
+async def light_session(path: Path, iterations: int, latencies: List[float]) -> None:
+    """Small edits to a small file, timing each one"""
+    tool = EditTool20250124()
+    path.write_text("counter 0\n")
+    for i in range(iterations):
+        start = time.perf_counter()
+        await tool(command="str_replace", path=str(path), old_str=f"counter {i}", new_str=f"counter {i + 1}")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run_mode(mode: str, workdir: Path, args: argparse.Namespace) -> Dict:
+    large = workdir / f"large-{mode}.log"
+    make_large_file(large, args.size_mb)
+    latencies: List[float] = []
+    stop = asyncio.Event()
+
+    start = time.perf_counter()
+    heavy = asyncio.create_task(heavy_session(EditTool20250124(), large, mode, stop))
+    await asyncio.gather(*(
+        light_session(workdir / f"light-{mode}-{i}.txt", args.iterations, latencies)
+        for i in range(args.light_sessions)
+    ))
+    stop.set()
+    heavy_operations = await heavy
+    wall = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "wall_s": wall,
+        "heavy_operations": heavy_operations,
+        "light_edit_ms": summarize(latencies),
+    }
+
+
+async def main(args: argparse.Namespace) -> List[Dict]:
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            report = await run_mode(mode, Path(tmp), args)
+            reports.append(report)
+            print(f"{mode}: {report['heavy_operations']} heavy view+edit rounds in {report['wall_s']:.1f}s")
+            print("  " + format_summary("light session edit", report["light_edit_ms"]))
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+    return reports
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=50.0, help="size of the large file")
+    parser.add_argument("--light-sessions", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=50, help="edits per light session")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--json", help="write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
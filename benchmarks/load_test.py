@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+End-to-end load generator for the Energetic Backend
+
+Where demo.py walks through one session sequentially, this opens many concurrent
+sessions with a configurable arrival rate, message mix and duration. For every
+chat message it measures:
+- time-to-ack: message sent -> `ack`
+- time-to-first-chunk: message sent -> first agent chunk after the ack
+- time-to-complete: message sent -> `complete`
+and the latency of the REST calls made along the way. Results are printed as
+percentile summaries, written as HdrHistogram `.hgrm` files and as a JSON report
+that CI can diff against a baseline.
+
+Run it against a server with the stubbed (demo) agent, on SQLite or a local Postgres:
+
+    python -m benchmarks.load_test --spawn-server --duration 60 --arrival-rate 5
+    python -m benchmarks.load_test --base-url http://localhost:8000 --json report.json \\
+        --baseline baseline.json --max-regression 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from benchmarks.stats import HdrHistogram, format_summary
+
+DEFAULT_MESSAGE_MIX = (
+    "Search the weather in Dubai=0.4,"
+    "Search the weather in San Francisco=0.4,"
+    "Hello, what can you do?=0.2"
+)
+METRICS = (
+    "ws_time_to_ack",
+    "ws_time_to_first_chunk",
+    "ws_time_to_complete",
+    "rest_create_session",
+    "rest_list_sessions",
+    "rest_get_session",
+    "rest_session_status",
+    "rest_close_session",
+)
+US_PER_MS = 1000.0
+
+
+@dataclass
+class LoadResults:
+    histograms: Dict[str, HdrHistogram] = field(
+        default_factory=lambda: {name: HdrHistogram() for name in METRICS}
+    )
+    sessions_started: int = 0
+    sessions_completed: int = 0
+    messages_completed: int = 0
+    errors: List[str] = field(default_factory=list)
+    # non-2xx REST responses by metric and status code
+    rest_errors: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def record(self, metric: str, start: float) -> None:
+        self.histograms[metric].record((time.perf_counter() - start) * 1_000_000)
+
+
+def parse_message_mix(spec: str) -> Tuple[List[str], List[float]]:
+    """Parse `message=weight,message=weight` into messages and weights"""
+    messages, weights = [], []
+    for item in spec.split(","):
+        message, _, weight = item.rpartition("=")
+        if not message:
+            message, weight = weight, "1"
+        messages.append(message.strip())
+        weights.append(float(weight))
+    return messages, weights
+
+
+async def timed_request(results: LoadResults, metric: str, request) -> httpx.Response:
+    """Await a REST call, recording its latency and any non-2xx status"""
+    start = time.perf_counter()
+    response = await request
+    results.record(metric, start)
+    if response.is_error:
+        by_status = results.rest_errors.setdefault(metric, {})
+        by_status[str(response.status_code)] = by_status.get(str(response.status_code), 0) + 1
+    return response
+
+
+async def run_session(
+    http: httpx.AsyncClient,
+    ws_url: str,
+    args: argparse.Namespace,
+    mix: Tuple[List[str], List[float]],
+    results: LoadResults,
+) -> None:
+    results.sessions_started += 1
+    response = await timed_request(
+        results, "rest_create_session",
+        http.post("/api/v1/sessions/", json={"title": "load test"}),
+    )
+    response.raise_for_status()
+    session_id = response.json()["session_id"]
+
+    async with websockets.connect(f"{ws_url}/ws/chat/{session_id}", max_size=None) as ws:
+        await asyncio.wait_for(ws.recv(), timeout=args.timeout)  # connection confirmation
+        for _ in range(args.messages_per_session):
+            message = random.choices(*mix)[0]
+            start = time.perf_counter()
+            await ws.send(json.dumps({"type": "chat", "data": {"message": message}}))
+            acked = first_chunk = False
+            while True:
+                chunk = json.loads(await asyncio.wait_for(ws.recv(), timeout=args.timeout))
+                if chunk["type"] == "ack" and not acked:
+                    acked = True
+                    results.record("ws_time_to_ack", start)
+                    continue
+                if not first_chunk:
+                    first_chunk = True
+                    results.record("ws_time_to_first_chunk", start)
+                if chunk["type"] == "error":
+                    raise RuntimeError(chunk["data"].get("error"))
+                if chunk["type"] == "complete":
+                    results.record("ws_time_to_complete", start)
+                    results.messages_completed += 1
+                    break
+            if args.think_time:
+                await asyncio.sleep(random.expovariate(1 / args.think_time))
+
+    await timed_request(results, "rest_session_status", http.get(f"/api/v1/sessions/{session_id}/status"))
+    await timed_request(results, "rest_get_session", http.get(f"/api/v1/sessions/{session_id}"))
+    await timed_request(results, "rest_list_sessions", http.get("/api/v1/sessions/", params={"size": 10}))
+    await timed_request(results, "rest_close_session", http.delete(f"/api/v1/sessions/{session_id}"))
+    results.sessions_completed += 1
+
+
+async def generate_load(args: argparse.Namespace) -> Tuple[LoadResults, float]:
+    """Start sessions as a Poisson process until the duration or session count is reached"""
+    results = LoadResults()
+    mix = parse_message_mix(args.message_mix)
+    ws_url = args.base_url.replace("http", "ws", 1)
+    concurrency = asyncio.Semaphore(args.max_concurrent)
+    limits = httpx.Limits(max_connections=args.max_concurrent, max_keepalive_connections=args.max_concurrent)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as http:
+        async def session_task():
+            async with concurrency:
+                try:
+                    await run_session(http, ws_url, args, mix, results)
+                except Exception as e:
+                    results.errors.append(repr(e))
+
+        tasks = []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        while time.perf_counter() < deadline and (not args.sessions or len(tasks) < args.sessions):
+            tasks.append(asyncio.create_task(session_task()))
+            await asyncio.sleep(random.expovariate(args.arrival_rate))
+        await asyncio.gather(*tasks)
+        return results, time.perf_counter() - start
+
+
+def build_report(args: argparse.Namespace, results: LoadResults, wall: float) -> Dict:
+    return {
+        "config": {
+            key: getattr(args, key)
+            for key in ("arrival_rate", "duration", "sessions", "max_concurrent",
+                        "messages_per_session", "message_mix", "think_time")
+        },
+        "wall_s": wall,
+        "sessions_started": results.sessions_started,
+        "sessions_completed": results.sessions_completed,
+        "messages_completed": results.messages_completed,
+        "messages_per_s": results.messages_completed / wall if wall else 0.0,
+        "error_count": len(results.errors),
+        "error_samples": results.errors[:20],
+        "rest_errors": results.rest_errors,
+        "metrics": {
+            name: {
+                "unit": "ms",
+                "summary": histogram.summary(scale=US_PER_MS),
+                "histogram_us": histogram.to_dict(),
+            }
+            for name, histogram in results.histograms.items()
+        },
+    }
+
+
+def compare_reports(report: Dict, baseline: Dict, max_regression: Optional[float]) -> bool:
+    """Print p50/p99 deltas against a baseline report; False if a p99 regressed too much"""
+    ok = True
+    print("\nComparison with baseline (p50 / p99, ms):")
+    for name, metric in report["metrics"].items():
+        current = metric["summary"]
+        previous = baseline.get("metrics", {}).get(name, {}).get("summary", {})
+        if not current.get("count") or not previous.get("count"):
+            continue
+        deltas = []
+        for key in ("p50", "p99"):
+            change = (current[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+            deltas.append(f"{previous[key]:.1f} -> {current[key]:.1f} ({change:+.1f}%)")
+            if key == "p99" and max_regression is not None and change > max_regression:
+                ok = False
+        print(f"  {name}: " + " / ".join(deltas))
+    return ok
+
+
+def spawn_server(args: argparse.Namespace) -> subprocess.Popen:
+    """Migrate the database and start a local server with the demo agent"""
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "AGENT_MODE": "demo",
+        "DEMO_STEP_DELAY": str(args.demo_step_delay),
+        "DEBUG": "false",
+        "HOST": httpx.URL(args.base_url).host,
+        "PORT": str(httpx.URL(args.base_url).port or 8000),
+        "WORKERS": str(args.workers),
+        "LOG_LEVEL": "warning",
+    }
+    env.setdefault("ANTHROPIC_API_KEY", "load-test")
+    if args.workers > 1:
+        # sessions whose REST calls and WebSocket land on different workers
+        env.setdefault("CHECKPOINT_DIR", args.checkpoint_dir)
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, check=True)
+    process = subprocess.Popen([sys.executable, "-m", "app.server"], env=env)
+    for _ in range(100):
+        try:
+            if httpx.get(f"{args.base_url}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("Server did not become healthy")
+
+
+async def main(args: argparse.Namespace) -> int:
+    results, wall = await generate_load(args)
+    report = build_report(args, results, wall)
+
+    print(
+        f"{results.sessions_completed}/{results.sessions_started} sessions, "
+        f"{results.messages_completed} messages in {wall:.1f}s "
+        f"({report['messages_per_s']:.2f} messages/s), {len(results.errors)} errors"
+    )
+    for name, metric in report["metrics"].items():
+        print("  " + format_summary(name, metric["summary"]))
+    for error in results.errors[:5]:
+        print(f"  error: {error}")
+    for name, by_status in results.rest_errors.items():
+        print(f"  {name} non-2xx responses: {by_status}")
+
+    if args.hdr_dir:
+        hdr_dir = Path(args.hdr_dir)
+        hdr_dir.mkdir(parents=True, exist_ok=True)
+        for name, histogram in results.histograms.items():
+            (hdr_dir / f"{name}.hgrm").write_text(histogram.percentile_distribution(scale=US_PER_MS))
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+    ok = True
+    if args.baseline:
+        ok = compare_reports(report, json.loads(Path(args.baseline).read_text()), args.max_regression)
+    return 0 if ok and not results.errors else 1
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end load generator")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to keep starting sessions")
+    parser.add_argument("--arrival-rate", type=float, default=2.0, help="new sessions per second")
+    parser.add_argument("--sessions", type=int, default=0, help="stop after this many sessions (0: no limit)")
+    parser.add_argument("--max-concurrent", type=int, default=100, help="sessions open at once")
+    parser.add_argument("--messages-per-session", type=int, default=1)
+    parser.add_argument("--message-mix", default=DEFAULT_MESSAGE_MIX, help="message=weight,...")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between messages")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="write the JSON report here")
+    parser.add_argument("--hdr-dir", help="write one .hgrm percentile distribution per metric here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, help="fail if a p99 grows by more than this %%")
+    parser.add_argument("--spawn-server", action="store_true", help="start a local demo server first")
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./loadtest.db")
+    parser.add_argument("--demo-step-delay", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the spawned server")
+    parser.add_argument("--checkpoint-dir", default="./loadtest-checkpoints")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    server = spawn_server(arguments) if arguments.spawn_server else None
+    try:
+        exit_code = asyncio.run(main(arguments))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    sys.exit(exit_code)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Replay recorded agent traces concurrently against a running server
+
+Start the server in replay mode so recorded model responses and tool results are
+served instead of calling the model and the desktop:
+
+    AGENT_MODE=replay AGENT_TRACE_DIR=traces REPLAY_SPEED=0.1 uvicorn app.main:app
+
+then replay the same traces from the client side:
+
+    python -m benchmarks.replay_sessions --traces traces --sessions 50 --concurrency 10
+
+Each session creates a server session, opens the chat WebSocket and sends the
+trace's user messages one after the other, waiting for `complete` each time.
+"""
+
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import websockets
+
+from benchmarks.stats import format_summary, summarize
+
+TRACE_SUFFIX = ".trace.jsonl.gz"
+
+
+def read_user_messages(path: Path) -> List[str]:
+    """User messages of a trace, in order"""
+    messages = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event["kind"] == "user":
+                messages.append(event["text"])
+    return messages
+
+
+async def replay_session(
+    http: httpx.AsyncClient,
+    ws_url: str,
+    trace_name: str,
+    user_messages: List[str],
+    results: Dict[str, List[float]],
+    timeout: float,
+) -> None:
+    start = time.perf_counter()
+    response = await http.post("/api/v1/sessions/", json={"title": f"replay {trace_name}"})
+    response.raise_for_status()
+    session_id = response.json()["session_id"]
+    results["create_ms"].append((time.perf_counter() - start) * 1000)
+
+    async with websockets.connect(f"{ws_url}/ws/chat/{session_id}") as ws:
+        await ws.recv()  # connection confirmation
+        for message in user_messages:
+            turn_start = time.perf_counter()
+            await ws.send(json.dumps({"type": "chat", "data": {"message": message}}))
+            while True:
+                chunk = json.loads(await asyncio.wait_for(ws.recv(), timeout=timeout))
+                if chunk["type"] == "error":
+                    raise RuntimeError(chunk["data"].get("error"))
+                if chunk["type"] == "complete":
+                    break
+            results["turn_ms"].append((time.perf_counter() - turn_start) * 1000)
+    results["session_ms"].append((time.perf_counter() - start) * 1000)
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    trace_paths = sorted(Path(args.traces).glob(f"*{TRACE_SUFFIX}"))
+    if not trace_paths:
+        raise SystemExit(f"No traces found in {args.traces}")
+    traces = [(path.name, read_user_messages(path)) for path in trace_paths]
+    ws_url = args.base_url.replace("http", "ws", 1)
+
+    results: Dict[str, List[float]] = {"create_ms": [], "turn_ms": [], "session_ms": []}
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as http:
+        async def run_one(trace):
+            async with semaphore:
+                try:
+                    await replay_session(http, ws_url, *trace, results, args.timeout)
+                except Exception as e:
+                    errors.append(f"{trace[0]}: {e!r}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_one(trace)
+            for trace in itertools.islice(itertools.cycle(traces), args.sessions)
+        ))
+        wall = time.perf_counter() - start
+
+    report = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "wall_s": wall,
+        "sessions_per_s": len(results["session_ms"]) / wall,
+        "turns_per_s": len(results["turn_ms"]) / wall,
+        "errors": errors,
+        **{name: summarize(values) for name, values in results.items()},
+    }
+
+    print(f"{len(results['session_ms'])}/{args.sessions} sessions in {wall:.2f}s "
+          f"({report['sessions_per_s']:.2f} sessions/s, {report['turns_per_s']:.2f} turns/s), "
+          f"{len(errors)} errors")
+    for name in results:
+        print("  " + format_summary(name, report[name]))
+    for error in errors[:10]:
+        print(f"  error: {error}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--traces", default="traces", help="directory of *.trace.jsonl.gz files")
+    parser.add_argument("--sessions", type=int, default=10, help="total sessions to replay")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions replayed at once")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait per chunk")
+    parser.add_argument("--json", help="write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
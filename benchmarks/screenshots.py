@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Screenshots resized and encoded per second, on the event loop and in the image pool
+
+A synthetic desktop frame is written to disk like a capture, then resized to
+the model's resolution and encoded, first inline on the event loop as a
+baseline, then by image pools of each size with all screenshots submitted at
+once. Throughput should grow with the pool up to the number of CPUs, while
+the event loop stays responsive:
+
+    python -m benchmarks.screenshots --counts 1,2,4,8 --screenshots 64 --json screenshots.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Dict, List
+
+from PIL import Image, ImageDraw
+
+from app.core.config import settings
+from app.services.computer_use.imaging import OUTPUT_HEADROOM, ImagePool, _encode
+from benchmarks.stats import summarize
+
+LAG_PROBE_INTERVAL = 0.005
+
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> bytes:
+    """PNG of a desktop: windows with title bars and lines of text over a gradient"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(8):
+        x, y = rng.randrange(width - 400), rng.randrange(height - 300)
+        w, h = rng.randrange(400, width - x + 1), rng.randrange(300, height - y + 1)
+        draw.rectangle((x, y, x + w, y + h), fill=(250, 250, 250), outline=(90, 90, 90))
+        draw.rectangle((x, y, x + w, y + 28), fill=tuple(rng.randrange(256) for _ in range(3)))
+        for line_y in range(y + 40, y + h - 16, 18):
+            draw.text((x + 10, line_y), "".join(rng.choice("abcdefgh ij") for _ in range(w // 7)),
+                      fill=(20, 20, 20))
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+class LagProbe:
+    """Largest delay of the event loop in running a scheduled wakeup"""
+
+    def __init__(self):
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - LAG_PROBE_INTERVAL)
+
+    def __enter__(self) -> "LagProbe":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._task.cancel()
+
+
+def report(latencies: List[float], wall: float, probe: LagProbe) -> Dict:
+    return {
+        "screenshots_per_s": len(latencies) / wall,
+        "latency_ms": summarize(latencies),
+        "max_loop_lag_ms": probe.max_lag * 1000,
+    }
+
+
+async def inline(path: Path, width: int, height: int, screenshots: int) -> Dict:
+    """The work done on the event loop, as a single process would"""
+    shm = SharedMemory(create=True, size=width * height * 4 + OUTPUT_HEADROOM)
+    latencies = []
+    try:
+        with LagProbe() as probe:
+            start = time.perf_counter()
+            for _ in range(screenshots):
+                began = time.perf_counter()
+                _encode(shm.name, 0, str(path), width, height, "png", settings.PNG_COMPRESS_LEVEL)
+                latencies.append((time.perf_counter() - began) * 1000)
+                # let the probe see the loop between screenshots
+                await asyncio.sleep(0)
+            wall = time.perf_counter() - start
+    finally:
+        shm.close()
+        shm.unlink()
+    return report(latencies, wall, probe)
+
+
+async def pooled(path: Path, width: int, height: int, screenshots: int, workers: int) -> Dict:
+    pool = ImagePool(workers=workers, queue=workers)
+    latencies = []
+
+    async def screenshot() -> None:
+        began = time.perf_counter()
+        await pool.encode(path, width, height, "png")
+        latencies.append((time.perf_counter() - began) * 1000)
+
+    try:
+        # start the worker processes outside the measurement
+        await asyncio.gather(*(pool.encode(path, width, height, "png") for _ in range(workers)))
+        with LagProbe() as probe:
+            start = time.perf_counter()
+            await asyncio.gather(*(screenshot() for _ in range(screenshots)))
+            wall = time.perf_counter() - start
+    finally:
+        pool.close()
+    return report(latencies, wall, probe)
+
+
+def table(reports: Dict[str, Dict]) -> List[str]:
+    """Markdown table of throughput, speedup over one pool process and loop lag"""
+    rows = [
+        "| image pool | screenshots/s | speedup | latency p50 / p99 (ms) | max loop lag (ms) |",
+        "|---|---:|---:|---:|---:|",
+    ]
+    baseline = reports.get("1", next(iter(reports.values())))["screenshots_per_s"]
+    for name, result in reports.items():
+        latency = result["latency_ms"]
+        rows.append(
+            f"| {name} | {result['screenshots_per_s']:.1f}"
+            f" | {result['screenshots_per_s'] / baseline:.2f}x"
+            f" | {latency['p50']:.1f} / {latency['p99']:.1f}"
+            f" | {result['max_loop_lag_ms']:.1f} |"
+        )
+    return rows
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict]:
+    width, height = (int(side) for side in args.size.split("x"))
+    target_width, target_height = (int(side) for side in args.target.split("x"))
+    reports: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "screenshot.png"
+        path.write_bytes(synthetic_frame(width, height))
+        print(f"inline on the event loop ({os.cpu_count()} CPUs)...")
+        reports["inline"] = await inline(path, target_width, target_height, args.screenshots)
+        for workers in (int(count) for count in args.counts.split(",")):
+            print(f"{workers} pool processes...")
+            reports[str(workers)] = await pooled(
+                path, target_width, target_height, args.screenshots, workers
+            )
+    return reports
+
+
+def main(args: argparse.Namespace) -> Dict[str, Dict]:
+    reports = asyncio.run(run(args))
+    print("\n".join(table(reports)))
+    if args.json:
+        Path(args.json).write_text(json.dumps(
+            {"cpu_count": os.cpu_count(), "reports": reports}, indent=2
+        ))
+    return reports
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--counts", default="1,2,4,8", help="image pool sizes to run")
+    parser.add_argument("--screenshots", type=int, default=64, help="screenshots per run")
+    parser.add_argument("--size", default="2560x1440", help="resolution of the captured frame")
+    parser.add_argument("--target", default="1366x768", help="resolution the model sees")
+    parser.add_argument("--json", help="write the reports to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Cold start of a worker: import time of the app and time-to-first-request
+
+Import time comes from `python -X importtime`, listing the modules that cost
+the most. Time-to-first-request starts a fresh uvicorn process on a migrated
+SQLite database and polls /health until it answers:
+
+    python -m benchmarks.startup --runs 10 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.stats import format_summary, summarize
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_times(module: str) -> List[Tuple[str, float, float]]:
+    """(module, self ms, cumulative ms) of every module importing `module` loads"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            times.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return times
+
+
+def time_to_first_request(env: Dict[str, str], port: int, timeout: float) -> float:
+    """ms from spawning a worker to its first successful /health"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise SystemExit(f"Server exited with {process.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return (time.perf_counter() - start) * 1000
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+        raise SystemExit("Server did not become healthy")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(args: argparse.Namespace) -> Dict:
+    times = import_times(args.module)
+    total_ms = next(cumulative for name, _, cumulative in reversed(times) if name == args.module)
+    report: Dict = {
+        "import_ms": total_ms,
+        "slowest_imports": [
+            {"module": name, "self_ms": self_ms, "cumulative_ms": cumulative_ms}
+            for name, self_ms, cumulative_ms in sorted(times, key=lambda t: t[1], reverse=True)[: args.top]
+        ],
+    }
+    print(f"import {args.module}: {total_ms:.1f}ms, slowest modules (self time):")
+    for entry in report["slowest_imports"]:
+        print(f"  {entry['module']}: {entry['self_ms']:.1f}ms ({entry['cumulative_ms']:.1f}ms cumulative)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{Path(tmp) / 'startup.db'}",
+            "DEBUG": "false",
+        }
+        env.setdefault("ANTHROPIC_API_KEY", "startup-benchmark")
+        # migrations run once per deploy, not per worker, so they are not timed
+        subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, check=True,
+                       capture_output=True)
+        samples = [time_to_first_request(env, args.port, args.timeout) for _ in range(args.runs)]
+    report["time_to_first_request_ms"] = summarize(samples)
+    print(format_summary("time to first request", report["time_to_first_request_ms"]))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--module", default="app.main", help="module whose import is profiled")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,162 @@
+"""
+Latency statistics helpers shared by the benchmarks
+"""
+
+import math
+from typing import Dict, List, Sequence
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of `values`"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Count, mean, min/max and the standard percentiles of `values`"""
+    if not values:
+        return {"count": 0}
+    summary = {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": min(values),
+        "max": max(values),
+    }
+    for p in PERCENTILES:
+        summary[f"p{p:g}"] = percentile(values, p)
+    return summary
+
+
+def format_summary(name: str, summary: Dict[str, float], unit: str = "ms") -> str:
+    if not summary.get("count"):
+        return f"{name}: no samples"
+    parts = [f"{name}: n={summary['count']}"]
+    for key in ("mean", *(f"p{p:g}" for p in PERCENTILES), "max"):
+        parts.append(f"{key}={summary[key]:.1f}{unit}")
+    return " ".join(parts)
+
+
+class HdrHistogram:
+    """
+    High dynamic range histogram (same bucketing as HdrHistogram)
+
+    Records integer values between `lowest` and `highest` with `significant_figures`
+    decimal digits of precision in a fixed amount of memory.
+    """
+
+    def __init__(self, lowest: int = 1, highest: int = 3_600_000_000, significant_figures: int = 3):
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_figures = significant_figures
+        largest_single_unit = 2 * 10 ** significant_figures
+        sub_bucket_count_magnitude = math.ceil(math.log2(largest_single_unit))
+        self.sub_bucket_half_count_magnitude = max(sub_bucket_count_magnitude, 1) - 1
+        self.unit_magnitude = int(math.floor(math.log2(lowest)))
+        self.sub_bucket_count = 2 ** (self.sub_bucket_half_count_magnitude + 1)
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.sub_bucket_mask = (self.sub_bucket_count - 1) << self.unit_magnitude
+        smallest_untrackable = self.sub_bucket_count << self.unit_magnitude
+        bucket_count = 1
+        while smallest_untrackable <= highest:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = [0] * ((bucket_count + 1) * self.sub_bucket_half_count)
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._sum = 0
+
+    def _counts_index(self, value: int) -> int:
+        bucket_index = (
+            (value | self.sub_bucket_mask).bit_length()
+            - self.unit_magnitude
+            - (self.sub_bucket_half_count_magnitude + 1)
+        )
+        sub_bucket_index = value >> (bucket_index + self.unit_magnitude)
+        bucket_base_index = (bucket_index + 1) << self.sub_bucket_half_count_magnitude
+        return bucket_base_index + sub_bucket_index - self.sub_bucket_half_count
+
+    def _value_range(self, index: int):
+        """Lowest value and width of the bucket at `index`"""
+        bucket_index = (index >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket_index < 0:
+            sub_bucket_index -= self.sub_bucket_half_count
+            bucket_index = 0
+        shift = bucket_index + self.unit_magnitude
+        return sub_bucket_index << shift, 1 << shift
+
+    def record(self, value: float) -> None:
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._counts_index(value)] += 1
+        self.total += 1
+        self._sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self) -> float:
+        return self._sum / self.total if self.total else float("nan")
+
+    def value_at_percentile(self, p: float) -> int:
+        """Highest value equivalent to the value at percentile `p`"""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(p / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                low, width = self._value_range(index)
+                return min(low + width - 1, self.max)
+        return self.max
+
+    def percentile_distribution(self, ticks_per_half_distance: int = 5, scale: float = 1.0) -> str:
+        """Text percentile distribution in the HdrHistogram `.hgrm` format"""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        if self.total:
+            percentile_points = [0.0]
+            reporting = 0.0
+            while reporting < 100.0 and len(percentile_points) < 200:
+                half_distance = 2 ** (int(math.log2(100.0 / (100.0 - reporting))) + 1)
+                reporting += 100.0 / (half_distance * ticks_per_half_distance)
+                percentile_points.append(min(reporting, 100.0))
+            for p in percentile_points:
+                value = self.value_at_percentile(p)
+                count = sum(
+                    c for index, c in enumerate(self.counts)
+                    if c and self._value_range(index)[0] <= value
+                )
+                inverse = "inf" if p >= 100.0 else f"{1 / (1 - p / 100):.2f}"
+                lines.append(f"{value / scale:12.3f} {p / 100:14.12f} {count:10d} {inverse:>14}")
+        lines.append(
+            f"#[Mean    = {self.mean() / scale:12.3f}, Max     = {(self.max or 0) / scale:12.3f}]"
+        )
+        lines.append(f"#[Total count    = {self.total:12d}]")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, scale: float = 1.0) -> Dict[str, float]:
+        if not self.total:
+            return {"count": 0}
+        summary = {
+            "count": self.total,
+            "mean": self.mean() / scale,
+            "min": self.min / scale,
+            "max": self.max / scale,
+        }
+        for p in PERCENTILES:
+            summary[f"p{p:g}"] = self.value_at_percentile(p) / scale
+        return summary
+
+    def to_dict(self) -> Dict:
+        """Sparse, JSON serializable form for reports"""
+        return {
+            "lowest": self.lowest,
+            "highest": self.highest,
+            "significant_figures": self.significant_figures,
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count},
+        }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the editor tool's str_replace on large files
+
+Compares the current single-scan implementation with the previous one, which
+made a separate pass over the file to count, replace, locate and snippet. File
+I/O and `expandtabs` are the same for both and left out:
+
+    python -m benchmarks.str_replace --size-mb 10 --repeat 20
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.services.computer_use.tools.base import ToolError
+from app.services.computer_use.tools.edit import SNIPPET_LINES, replace_once
+from benchmarks.stats import format_summary, summarize
+
+
+def legacy_str_replace(file_content: str, old_str: str, new_str: str):
+    """The previous algorithm, minus the file I/O"""
+    occurrences = file_content.count(old_str)
+    if occurrences == 0:
+        raise ToolError("not found")
+    elif occurrences > 1:
+        lines = [idx + 1 for idx, line in enumerate(file_content.split("\n")) if old_str in line]
+        raise ToolError(f"multiple occurrences in lines {lines}")
+    new_file_content = file_content.replace(old_str, new_str)
+    replacement_line = file_content.split(old_str)[0].count("\n")
+    start_line = max(0, replacement_line - SNIPPET_LINES)
+    end_line = replacement_line + SNIPPET_LINES + new_str.count("\n")
+    snippet = "\n".join(new_file_content.split("\n")[start_line : end_line + 1])
+    return new_file_content, start_line, snippet
+
+
+def make_content(size_mb: float) -> List[str]:
+    lines = int(size_mb * 1024 * 1024 / 48)
+    return [f"    value_{i:08d} = compute(value_{i - 1:08d}, {i % 97})" for i in range(lines)]
+
+
+def time_calls(func: Callable[[], object], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except ToolError:
+            pass
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(args: argparse.Namespace) -> Dict:
+    lines = make_content(args.size_mb)
+    content = "\n".join(lines)
+    cases = {
+        "unique_start": lines[10].strip(),
+        "unique_middle": lines[len(lines) // 2].strip(),
+        "unique_end": lines[-10].strip(),
+        "multiple": "compute(value_0000000",
+    }
+    report: Dict = {"size_mb": len(content) / 1024 / 1024, "cases": {}}
+    path = Path("large.py")
+
+    for name, old_str in cases.items():
+        new_str = old_str.replace("compute", "recompute")
+        legacy = time_calls(lambda: legacy_str_replace(content, old_str, new_str), args.repeat)
+        single_pass = time_calls(lambda: replace_once(content, old_str, new_str, path), args.repeat)
+        report["cases"][name] = {
+            "legacy_ms": summarize(legacy),
+            "single_pass_ms": summarize(single_pass),
+        }
+        print(name)
+        print("  " + format_summary("legacy", report["cases"][name]["legacy_ms"]))
+        print("  " + format_summary("single pass", report["cases"][name]["single_pass_ms"]))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
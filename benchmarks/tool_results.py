@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Memory used by screenshot tool results on their way to the model
+
+Runs simulated agent steps, each taking a screenshot, copying and combining the
+result like the computer tool does and converting it to the API payload, with
+the last few payloads kept as history. Compares results holding an eagerly
+encoded base64 string, as before, with the current lazily encoded ToolImage,
+by the memory a result holds until it is sent, the peak of a step and what
+the history retains:
+
+    python -m benchmarks.tool_results --steps 50 --image-kb 1500
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from app.services.computer_use.agent_service import _make_api_tool_result
+from app.services.computer_use.tools.base import ToolImage, ToolResult
+from benchmarks.stats import summarize
+
+
+@dataclass(kw_only=True, frozen=True)
+class LegacyToolResult:
+    """The previous ToolResult, with the image as a base64 string"""
+
+    output: str | None = None
+    error: str | None = None
+    base64_image: str | None = None
+    system: str | None = None
+
+    def __bool__(self):
+        return any(getattr(self, field.name) for field in fields(self))
+
+    def __add__(self, other: "LegacyToolResult"):
+        return LegacyToolResult(
+            output=(self.output or "") + (other.output or ""),
+            base64_image=self.base64_image or other.base64_image,
+        )
+
+
+def legacy_payload(result: LegacyToolResult, tool_use_id: str) -> Dict[str, Any]:
+    return {
+        "type": "tool_result",
+        "content": [
+            {"type": "text", "text": result.output},
+            {
+                "type": "image",
+                "source": {"type": "base64", "media_type": "image/png", "data": result.base64_image},
+            },
+        ],
+        "tool_use_id": tool_use_id,
+        "is_error": False,
+    }
+
+
+def legacy_capture(read_png: Callable[[], bytes]) -> LegacyToolResult:
+    screenshot = replace(LegacyToolResult(), base64_image=base64.b64encode(read_png()).decode())
+    return LegacyToolResult(output="clicked") + screenshot
+
+
+def image_capture(read_png: Callable[[], bytes]) -> ToolResult:
+    screenshot = ToolResult().replace(image=ToolImage(read_png()))
+    return ToolResult(output="clicked") + screenshot
+
+
+def measure(capture: Callable, payload: Callable, args: argparse.Namespace) -> Dict:
+    history: deque = deque(maxlen=args.keep_images)
+    held: List[float] = []
+    peaks: List[float] = []
+    tracemalloc.start()
+    for _ in range(args.steps):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        # like reading the screenshot file, the bytes are referenced only by the result
+        result = capture(lambda: os.urandom(args.image_kb * 1024))
+        held.append((tracemalloc.get_traced_memory()[0] - before) / 1024 / 1024)
+        history.append(payload(result, "toolu_1"))
+        del result
+        peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024 / 1024)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "result_held_mb": summarize(held),
+        "step_peak_mb": summarize(peaks),
+        "retained_mb": retained / 1024 / 1024,
+    }
+
+
+def main(args: argparse.Namespace) -> Dict:
+    report: Dict = {
+        "image_kb": args.image_kb,
+        "result_object_bytes": {
+            "legacy": sys.getsizeof(LegacyToolResult()) + sys.getsizeof(LegacyToolResult().__dict__),
+            "image": sys.getsizeof(ToolResult()),
+        },
+    }
+    for name, capture, payload in (
+        ("legacy", legacy_capture, legacy_payload),
+        ("image", image_capture, _make_api_tool_result),
+    ):
+        report[name] = measure(capture, payload, args)
+        print(
+            f"{name:>7}: result held until sent={report[name]['result_held_mb']['p50']:.2f}MB"
+            f"  step peak={report[name]['step_peak_mb']['p50']:.2f}MB"
+            f"  retained={report[name]['retained_mb']:.2f}MB"
+            f"  result object={report['result_object_bytes'][name]}B"
+        )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--image-kb", type=int, default=1500)
+    parser.add_argument("--keep-images", type=int, default=3, help="payloads kept as history")
+    parser.add_argument("--json", help="write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
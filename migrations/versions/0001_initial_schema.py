@@ -0,0 +1,87 @@
+"""
+Initial schema, as the first release created it with create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases from before migrations already have these tables; the
+    # offline SQL (--sql) is for an empty database
+    existing = set() if context.is_offline_mode() else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "sessions" not in existing:
+        op.create_table(
+            "sessions",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("session_id", sa.String(255), nullable=False),
+            sa.Column("title", sa.String(500), nullable=True),
+            sa.Column("status", sa.String(50), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("system_prompt", sa.Text, nullable=True),
+            sa.Column("model_name", sa.String(100), nullable=True),
+            sa.Column("tool_version", sa.String(100), nullable=True),
+        )
+        op.create_index("ix_sessions_id", "sessions", ["id"])
+        op.create_index("ix_sessions_session_id", "sessions", ["session_id"], unique=True)
+
+    if "messages" not in existing:
+        op.create_table(
+            "messages",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("session_id", sa.Integer, sa.ForeignKey("sessions.id"), nullable=False),
+            sa.Column("role", sa.String(50), nullable=False),
+            sa.Column("content", sa.Text, nullable=False),
+            sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("message_type", sa.String(50), nullable=True),
+            sa.Column("message_metadata", sa.JSON, nullable=True),
+        )
+        op.create_index("ix_messages_id", "messages", ["id"])
+
+    if "computer_use_events" not in existing:
+        op.create_table(
+            "computer_use_events",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("session_id", sa.Integer, sa.ForeignKey("sessions.id"), nullable=False),
+            sa.Column("event_type", sa.String(100), nullable=False),
+            sa.Column("tool_name", sa.String(100), nullable=True),
+            sa.Column("input_data", sa.JSON, nullable=True),
+            sa.Column("output_data", sa.JSON, nullable=True),
+            sa.Column("status", sa.String(50), nullable=True),
+            sa.Column("error_message", sa.Text, nullable=True),
+            sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("duration_ms", sa.Integer, nullable=True),
+        )
+        op.create_index("ix_computer_use_events_id", "computer_use_events", ["id"])
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("username", sa.String(100), nullable=False),
+            sa.Column("email", sa.String(255), nullable=True),
+            sa.Column("is_active", sa.Boolean, nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+
+def downgrade():
+    op.drop_table("users")
+    op.drop_table("computer_use_events")
+    op.drop_table("messages")
+    op.drop_table("sessions")
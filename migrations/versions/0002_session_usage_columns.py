@@ -0,0 +1,40 @@
+"""
+Token usage and typing delay of a session
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("typing_delay_ms", sa.Integer, nullable=True),
+    sa.Column("input_tokens", sa.Integer, nullable=True),
+    sa.Column("cache_creation_input_tokens", sa.Integer, nullable=True),
+    sa.Column("cache_read_input_tokens", sa.Integer, nullable=True),
+    sa.Column("output_tokens", sa.Integer, nullable=True),
+    sa.Column("turn_usage", sa.JSON, nullable=True),
+]
+
+
+def upgrade():
+    # workers before migrations added these at startup
+    existing = set()
+    if not context.is_offline_mode():
+        existing = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("sessions")}
+    for column in COLUMNS:
+        if column.name not in existing:
+            op.add_column("sessions", column)
+
+
+def downgrade():
+    with op.batch_alter_table("sessions") as batch:
+        for column in reversed(COLUMNS):
+            batch.drop_column(column.name)
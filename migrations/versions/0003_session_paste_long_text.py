@@ -0,0 +1,27 @@
+"""
+Whether a session's agent pastes long text instead of typing it
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "sessions",
+        sa.Column("paste_long_text", sa.Boolean, nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("sessions") as batch:
+        batch.drop_column("paste_long_text")
@@ -49,3 +49,10 @@ def test_frontend_accessible():
 
 if __name__ == "__main__":
     pytest.main([__file__])
+
+
+def test_metrics_endpoint():
+    """Test the Prometheus metrics endpoint"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "energetic_active_sessions" in response.text
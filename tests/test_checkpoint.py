@@ -0,0 +1,79 @@
+"""
+Tests for session checkpoints
+"""
+
+import asyncio
+import base64
+
+import pytest
+
+from app.services.computer_use.checkpoint import CheckpointStore, SessionCheckpoint
+from app.services.computer_use.history import ConversationHistory
+
+
+def _screenshot_turn(tool_use_id: str, data: bytes):
+    return {
+        "role": "user",
+        "content": [{
+            "type": "tool_result",
+            "tool_use_id": tool_use_id,
+            "content": [{
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/png",
+                    "data": base64.b64encode(data).decode(),
+                },
+            }],
+        }],
+    }
+
+
+def test_checkpoint_round_trip(tmp_path):
+    store = CheckpointStore(tmp_path)
+    history = ConversationHistory(images_to_keep=None)
+    history.append({"role": "user", "content": "search the weather"})
+    history.append(_screenshot_turn("toolu_1", b"first"))
+    history.append(_screenshot_turn("toolu_2", b"second"))
+    history.append(_screenshot_turn("toolu_3", b"first"))
+    history.last_input_tokens = 1234
+
+    store.save(SessionCheckpoint.of("s1", history, {"bash": {"cwd": "/tmp", "env": {}, "unset": []}}))
+    # the same image is stored once, and the live history keeps its data
+    assert len(list((tmp_path / "s1").glob("*.png"))) == 2
+    assert history.messages[1]["content"][0]["content"][0]["source"]["type"] == "base64"
+
+    restored = ConversationHistory(images_to_keep=None)
+    checkpoint = store.load("s1")
+    checkpoint.restore(restored)
+    assert restored.messages == history.messages
+    assert restored.last_input_tokens == 1234
+    assert checkpoint.tool_state == {"bash": {"cwd": "/tmp", "env": {}, "unset": []}}
+
+    # images that left the history are removed with the next checkpoint
+    del history.messages[2:]
+    store.save(SessionCheckpoint.of("s1", history, {}))
+    assert len(list((tmp_path / "s1").glob("*.png"))) == 1
+
+    store.delete("s1")
+    assert store.load("s1") is None
+
+
+@pytest.mark.asyncio
+async def test_bash_state_restored(monkeypatch):
+    pytest.importorskip("anthropic.types.beta")
+    from app.services.computer_use.tools.bash import BashTool20250124
+
+    monkeypatch.setenv("CHECKPOINT_TEST_API_KEY", "worker secret")
+    tool = BashTool20250124()
+    await tool(command="cd /tmp && export CHECKPOINT_TEST='a b' CHECKPOINT_TEST_API_KEY=changed")
+    state = await tool.checkpoint_state()
+    await asyncio.wait_for(tool._session.stop(), timeout=5)
+    # only what the agent changed, and no secrets
+    assert state == {"cwd": "/tmp", "env": {"CHECKPOINT_TEST": "a b"}, "unset": []}
+
+    resumed = BashTool20250124()
+    resumed.restore_state(state)
+    result = await resumed(command='pwd; echo "$CHECKPOINT_TEST"')
+    await asyncio.wait_for(resumed._session.stop(), timeout=5)
+    assert result.output.splitlines() == ["/tmp", "a b"]
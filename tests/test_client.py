@@ -0,0 +1,163 @@
+"""
+Tests for the shared Anthropic client against a fake Messages API
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.services.computer_use.client import (
+    AnthropicAPIError,
+    AnthropicClient,
+    RateLimiter,
+    TokenBucket,
+    parse_retry_after,
+)
+
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+RESPONSE = {
+    "content": [{"type": "text", "text": "hello"}],
+    "usage": {"input_tokens": 5, "output_tokens": 1},
+}
+
+
+def _fake_server(statuses):
+    """Serve the given status codes in order, then 200s"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        status = statuses.pop(0) if statuses else 200
+        if status == 200:
+            return httpx.Response(200, json=RESPONSE)
+        return httpx.Response(status, headers={"retry-after": "0"}, json={"error": {}})
+
+    return calls, httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_retries_on_overload_and_rate_limit():
+    """429 and 529 are retried, honoring retry-after"""
+    calls, transport = _fake_server([429, 529])
+    client = AnthropicClient(api_key="test", transport=transport, http2=False)
+    data = await client.create_message(model="m", max_tokens=10, messages=MESSAGES, betas=["b1"])
+    await client.aclose()
+
+    assert data == RESPONSE
+    assert len(calls) == 3
+    assert calls[0].headers["x-api-key"] == "test"
+    assert calls[0].headers["anthropic-beta"] == "b1"
+
+
+@pytest.mark.asyncio
+async def test_other_errors_are_not_retried():
+    """Client errors are raised immediately"""
+    calls, transport = _fake_server([400])
+    client = AnthropicClient(api_key="test", transport=transport, http2=False)
+    with pytest.raises(AnthropicAPIError) as exc_info:
+        await client.create_message(model="m", max_tokens=10, messages=MESSAGES)
+    await client.aclose()
+
+    assert exc_info.value.status_code == 400
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    """The last retryable error is raised once retries are exhausted"""
+    calls, transport = _fake_server([529, 529, 529])
+    client = AnthropicClient(api_key="test", transport=transport, http2=False, max_retries=2)
+    with pytest.raises(AnthropicAPIError):
+        await client.create_message(model="m", max_tokens=10, messages=MESSAGES)
+    await client.aclose()
+
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_and_server_quota():
+    """Buckets hand out capacity and follow the server's remaining quota"""
+    bucket = TokenBucket(capacity=600)
+    assert await bucket.acquire(100) == 0
+    assert bucket.level == pytest.approx(500, abs=1)
+
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+    limiter.observe(httpx.Headers({
+        "anthropic-ratelimit-requests-remaining": "3",
+        "anthropic-ratelimit-input-tokens-remaining": "200",
+    }))
+    assert limiter.requests.level == pytest.approx(3, abs=0.1)
+    assert limiter.tokens.level == pytest.approx(200, abs=1)
+
+
+def test_parse_retry_after():
+    """retry-after accepts seconds and HTTP dates"""
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    # malformed headers are ignored rather than failing the retry
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 99 Foo 2015 77:28:00 GMT") is None
+
+
+def test_retry_after_is_honored_in_full():
+    """retry-after beyond max_backoff still waits that long, plus some jitter"""
+    client = AnthropicClient(api_key="test", http2=False, max_backoff=30.0)
+    delays = [client._backoff(0, 90.0) for _ in range(20)]
+    assert all(90.0 <= delay <= 90.0 * 1.2 for delay in delays)
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_is_raised():
+    """Waits beyond max_retry_after are not retried"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(429, headers={"retry-after": "3600"}, json={"error": {}})
+
+    client = AnthropicClient(
+        api_key="test", transport=httpx.MockTransport(handler), http2=False, max_retry_after=60
+    )
+    with pytest.raises(AnthropicAPIError) as exc_info:
+        await client.create_message(model="m", max_tokens=10, messages=MESSAGES)
+    await client.aclose()
+
+    assert exc_info.value.status_code == 429
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_attempts_refund_tokens():
+    """Retried attempts do not drain the token budget twice"""
+    calls, transport = _fake_server([429, 529])
+    limiter = RateLimiter(tokens_per_minute=100000)
+    client = AnthropicClient(api_key="test", transport=transport, http2=False, rate_limiter=limiter)
+    await client.create_message(
+        model="claude-sonnet-4-20250514", max_tokens=128000, messages=MESSAGES, system="x" * 4000,
+    )
+    await client.aclose()
+
+    assert len(calls) == 3
+    # only the successful attempt is charged, at the usage the API reported
+    assert limiter.tokens.level == pytest.approx(100000 - 5, abs=5)
+    # the output limit of the model
+    assert json.loads(calls[0].content)["max_tokens"] == 64000
+
+
+@pytest.mark.asyncio
+async def test_read_timeouts_are_not_retried():
+    """The API may have processed a request whose response timed out"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    client = AnthropicClient(api_key="test", transport=httpx.MockTransport(handler), http2=False)
+    with pytest.raises(httpx.ReadTimeout):
+        await client.create_message(model="m", max_tokens=10, messages=MESSAGES)
+    await client.aclose()
+
+    assert len(calls) == 1
@@ -0,0 +1,171 @@
+"""
+Tests for the computer tool's text entry
+"""
+
+import pytest
+
+from app.core.config import settings
+
+pytest.importorskip("anthropic.types.beta")
+
+from app.services.computer_use.tools import ToolImage, ToolResult, computer  # noqa: E402
+from app.services.computer_use.tools.context import ToolContext, use_context  # noqa: E402
+
+
+class RecordingComputerTool(computer.ComputerTool20250124):
+    """Records xdotool commands instead of running them"""
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+        self.screen = b"png"
+        self.paste_changes_screen = True
+
+    async def shell(self, command, take_screenshot=True):
+        self.commands.append(command)
+        if "key --clearmodifiers" in command and self.paste_changes_screen:
+            self.screen += b" pasted"
+        image = (await self.screenshot()).image if take_screenshot else None
+        return ToolResult(output="", image=image)
+
+    async def screenshot(self):
+        self.commands.append("screenshot")
+        return ToolResult(image=ToolImage(self.screen))
+
+
+@pytest.fixture
+def tool(monkeypatch):
+    monkeypatch.setenv("WIDTH", "1024")
+    monkeypatch.setenv("HEIGHT", "768")
+    return RecordingComputerTool()
+
+
+@pytest.mark.asyncio
+async def test_type_reports_progress_at_session_speed(tool):
+    progress = []
+
+    async def on_progress(message):
+        progress.append(message["data"]["done"])
+
+    with use_context(ToolContext(typing_delay_ms=0, progress=on_progress)):
+        result = await tool(action="type", text="x" * 120)
+    assert [c.split(" --")[0] for c in tool.commands] == ["xdotool type"] * 3 + ["screenshot"]
+    assert all("--delay 0 " in c for c in tool.commands[:3])
+    assert progress == [50, 100, 120]
+    assert result.image is not None
+
+
+@pytest.mark.asyncio
+async def test_long_text_is_typed_without_xclip(tool, monkeypatch):
+    monkeypatch.setattr(computer.shutil, "which", lambda name: None)
+    with use_context(ToolContext(paste_long_text=True)):
+        await tool(action="type", text="y" * (settings.TYPING_PASTE_THRESHOLD + 1))
+    assert tool.commands[0].startswith(f"xdotool type --delay {settings.TYPING_DELAY_MS} ")
+    assert tool.commands[-1] == "screenshot"
+
+
+@pytest.fixture
+def selections(monkeypatch):
+    """xclip is installed, the selections it is asked to set are recorded"""
+    selections = {}
+
+    async def run(command, input=None, **kwargs):
+        selections[command.split("-selection ")[1].split()[0]] = input
+        return 0, "", ""
+
+    monkeypatch.setattr(computer.shutil, "which", lambda name: f"/usr/bin/{name}")
+    monkeypatch.setattr(computer, "run", run)
+    return selections
+
+
+@pytest.mark.asyncio
+async def test_long_text_is_pasted_only_when_the_session_opts_in(tool, selections):
+    text = "z" * (settings.TYPING_PASTE_THRESHOLD + 1)
+    await tool(action="type", text=text)
+    assert not selections
+    assert tool.commands[0].startswith("xdotool type ")
+
+    tool.commands.clear()
+    with use_context(ToolContext(paste_long_text=True)):
+        result = await tool(action="type", text=text)
+    # both selections, terminals paste the primary one
+    assert selections == {"primary": text.encode(), "clipboard": text.encode()}
+    assert tool.commands == [
+        "screenshot", f"xdotool key --clearmodifiers {settings.TYPING_PASTE_KEY}", "screenshot"
+    ]
+    assert result.image.data == b"png pasted"
+
+
+@pytest.mark.asyncio
+async def test_text_is_typed_when_the_paste_changes_nothing(tool, selections):
+    tool.paste_changes_screen = False
+    with use_context(ToolContext(typing_delay_ms=0, paste_long_text=True)):
+        await tool(action="type", text="w" * (settings.TYPING_PASTE_THRESHOLD + 1))
+    assert tool.commands[1].startswith("xdotool key --clearmodifiers ")
+    assert [c.split(" --")[0] for c in tool.commands[3:]] == ["xdotool type"] * 5 + ["screenshot"]
+
+
+@pytest.mark.asyncio
+async def test_identity_screenshot_is_read_off_the_event_loop(monkeypatch, tmp_path):
+    """Captures that need no resizing are sent as read, by a thread"""
+    import threading
+
+    monkeypatch.setenv("WIDTH", "1024")
+    monkeypatch.setenv("HEIGHT", "768")
+    monkeypatch.setattr(computer, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "SCREENSHOT_FORMAT", "png")
+    readers = []
+    read_bytes = computer.Path.read_bytes
+
+    def recording_read_bytes(path):
+        readers.append(threading.get_ident())
+        return read_bytes(path)
+
+    monkeypatch.setattr(computer.Path, "read_bytes", recording_read_bytes)
+
+    class CapturingTool(computer.ComputerTool20250124):
+        async def capture(self, path):
+            path.write_bytes(b"captured")
+            return ToolResult()
+
+    result = await CapturingTool().screenshot()
+    assert result.image.data == b"captured"
+    assert readers and threading.get_ident() not in readers
+
+
+def _reference_scale(width, height, source, x, y):
+    """The per-call computation the transform replaced"""
+    ratio = width / height
+    target = None
+    for dimension in computer.MAX_SCALING_TARGETS.values():
+        if abs(dimension["width"] / dimension["height"] - ratio) < 0.02:
+            if dimension["width"] < width:
+                target = dimension
+            break
+    if target is None:
+        return x, y
+    x_factor, y_factor = target["width"] / width, target["height"] / height
+    if source == computer.ScalingSource.API:
+        return round(x / x_factor), round(y / y_factor)
+    return round(x * x_factor), round(y * y_factor)
+
+
+@pytest.mark.parametrize("width,height", [(1920, 1080), (2560, 1600), (1600, 1200), (1024, 768), (1000, 1000)])
+def test_scaling_transform_matches_per_call_scaling(width, height):
+    transform = computer.ScalingTransform.for_display(width, height)
+    assert computer.ScalingTransform.for_display(width, height) is transform
+    points = [(x, y) for x in range(0, min(width, 1024), 37) for y in range(0, min(height, 768), 41)]
+    for source in computer.ScalingSource:
+        expected = [_reference_scale(width, height, source, x, y) for x, y in points]
+        assert [transform.scale(source, x, y) for x, y in points] == expected
+
+
+def test_tool_params_are_built_once(tool):
+    params = tool.to_params()
+    assert tool.to_params() is params
+    assert (params["display_width_px"], params["display_height_px"]) == (1024, 768)
+    assert tool.transform.is_identity
+    tool.width, tool.height = 1920, 1080
+    assert tool.to_params()["display_width_px"] == 1366
+    with pytest.raises(computer.ToolError):
+        tool.scale_coordinates(computer.ScalingSource.API, 1921, 10)
@@ -0,0 +1,91 @@
+"""
+Tests for the database migrations and the schema check at startup
+"""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, exc, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import database
+from app.core.database import SCHEMA_REVISION, SchemaVersionError, check_schema
+from app.core.metrics import DB_QUERY, instrument_engine
+
+ALEMBIC_INI = Path(__file__).resolve().parents[1] / "alembic.ini"
+
+
+def alembic_config(path: Path) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("sqlalchemy.url", f"sqlite+aiosqlite:///{path}")
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def test_schema_revision_is_the_migration_head():
+    """A new migration has to bump the revision workers check for"""
+    head = ScriptDirectory.from_config(alembic_config(Path("unused.db"))).get_current_head()
+    assert head == SCHEMA_REVISION
+
+
+def test_upgrade_database_created_before_migrations(tmp_path):
+    """Tables create_all made before a model gained columns are upgraded in place"""
+    path = tmp_path / "old.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        # the sessions table as the first release created it
+        conn.exec_driver_sql(
+            "CREATE TABLE sessions (id INTEGER PRIMARY KEY, session_id VARCHAR(255) NOT NULL,"
+            " title VARCHAR(500), status VARCHAR(50), created_at DATETIME DEFAULT CURRENT_TIMESTAMP,"
+            " updated_at DATETIME, completed_at DATETIME, system_prompt TEXT,"
+            " model_name VARCHAR(100), tool_version VARCHAR(100))"
+        )
+        conn.exec_driver_sql("INSERT INTO sessions (session_id) VALUES ('s1')")
+
+    command.upgrade(alembic_config(path), "head")
+
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        columns = {column["name"] for column in inspector.get_columns("sessions")}
+        assert {"input_tokens", "turn_usage", "typing_delay_ms"} <= columns
+        assert {"messages", "computer_use_events", "users"} <= set(inspector.get_table_names())
+        assert conn.exec_driver_sql("SELECT session_id, input_tokens FROM sessions").all() == [("s1", None)]
+        assert conn.exec_driver_sql("SELECT version_num FROM alembic_version").scalar() == SCHEMA_REVISION
+
+
+@pytest.mark.asyncio
+async def test_check_schema(tmp_path, monkeypatch):
+    """Workers refuse to start on a database that is not migrated"""
+    path = tmp_path / "app.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(database, "engine", engine)
+    try:
+        with pytest.raises(SchemaVersionError, match="alembic upgrade head"):
+            await check_schema()
+
+        # env.py runs its own event loop
+        await asyncio.to_thread(command.upgrade, alembic_config(path), "0001")
+        with pytest.raises(SchemaVersionError, match="revision 0001"):
+            await check_schema()
+
+        await asyncio.to_thread(command.upgrade, alembic_config(path), "head")
+        await check_schema()
+    finally:
+        await engine.dispose()
+
+
+def test_failed_statements_are_not_left_timing(tmp_path):
+    """A statement that fails leaves nothing behind on the connection"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    instrument_engine(engine)
+    observed = DB_QUERY._sum.get()
+    with engine.connect() as conn:
+        with pytest.raises(exc.OperationalError):
+            conn.exec_driver_sql("SELECT * FROM missing")
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+        assert "query_start" not in conn.info
+    assert DB_QUERY._sum.get() > observed
@@ -0,0 +1,116 @@
+"""
+Tests for draining a worker before it stops
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.drain import Drain, TurnInterrupted, drain
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_turns_then_cancels_the_rest():
+    """Turns finishing within the deadline complete, later ones are cancelled"""
+    state = Drain()
+
+    async def turn(session_id, duration):
+        with state.turn(session_id):
+            await asyncio.sleep(duration)
+
+    quick = asyncio.create_task(turn("quick", 0.05))
+    slow = asyncio.create_task(turn("slow", 30))
+    await asyncio.sleep(0)
+    assert state.in_flight() == 2
+
+    assert state.start()
+    assert not state.start()
+    assert await state.wait_for_turns(timeout=0.5) == {"slow"}
+    assert quick.done() and not quick.cancelled()
+    assert slow.cancelled()
+    assert state.in_flight() == 0
+    assert await state.wait_for_turns(timeout=0.5) == set()
+
+
+@pytest.mark.asyncio
+async def test_drain_cancels_the_turn_not_its_consumer():
+    """The connection streaming a cancelled turn is told so and keeps running"""
+    state = Drain()
+
+    async def steps():
+        for step in range(100):
+            yield step
+            await asyncio.sleep(0.05)
+
+    received = []
+
+    async def connection():
+        try:
+            async for chunk in state.stream_turn("s1", steps()):
+                received.append(chunk)
+        except TurnInterrupted:
+            return "interrupted"
+
+    task = asyncio.create_task(connection())
+    await asyncio.sleep(0.12)
+    assert state.in_flight() == 1
+    assert await state.wait_for_turns(timeout=0.01) == {"s1"}
+    assert await task == "interrupted"
+    assert 1 < len(received) < 100
+    assert state.in_flight() == 0
+
+    # a turn finishing on its own is streamed to the end
+    async def short():
+        yield "a"
+        yield "b"
+
+    assert [chunk async for chunk in state.stream_turn("s2", short())] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_abandoned_turn_is_not_counted():
+    """A consumer that stops reading ends the turn"""
+    state = Drain()
+    closed = asyncio.Event()
+
+    async def steps():
+        try:
+            while True:
+                yield "step"
+                await asyncio.sleep(0.01)
+        finally:
+            closed.set()
+
+    turn = state.stream_turn("s1", steps())
+    assert await turn.__anext__() == "step"
+    await turn.aclose()
+    assert closed.is_set()
+    assert state.in_flight() == 0
+
+    async def failing():
+        yield "step"
+        raise ValueError("model unavailable")
+
+    with pytest.raises(ValueError):
+        [chunk async for chunk in state.stream_turn("s2", failing())]
+    assert state.in_flight() == 0
+
+
+def test_readiness_and_reconnect_while_draining(monkeypatch):
+    """Readiness fails and new connections are told to reconnect"""
+    client = TestClient(app)
+    assert client.get("/ready").status_code == 200
+
+    monkeypatch.setattr(drain, "draining", True)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "draining"
+    # still alive
+    assert client.get("/health").status_code == 200
+
+    with client.websocket_connect("/ws/chat/s1") as websocket:
+        message = websocket.receive_json()
+    assert message["type"] == "reconnect"
+    assert message["data"]["retry_after"] > 0
@@ -0,0 +1,206 @@
+"""
+Tests for the file editor tools
+"""
+
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("anthropic.types.beta")
+
+from app.services.computer_use.tools.base import ToolError  # noqa: E402
+from app.services.computer_use.tools.edit import EditTool20250124, EditTool20250429  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_edit_commands(tmp_path):
+    """create, view, str_replace, insert and undo_edit keep their output"""
+    tool = EditTool20250124()
+    path = tmp_path / "notes.txt"
+
+    created = await tool(command="create", path=str(path), file_text="alpha\nbeta\n")
+    assert created.output == f"File created successfully at: {path}"
+
+    viewed = await tool(command="view", path=str(path), view_range=[2, 2])
+    assert viewed.output.endswith("     2\tbeta\n")
+
+    await tool(command="str_replace", path=str(path), old_str="beta", new_str="gamma")
+    await tool(command="insert", path=str(path), insert_line=0, new_str="start")
+    assert path.read_text() == "start\nalpha\ngamma\n"
+
+    await tool(command="undo_edit", path=str(path))
+    assert path.read_text() == "alpha\ngamma\n"
+
+    with pytest.raises(ToolError, match="Unrecognized command undo_edit"):
+        await EditTool20250429()(command="undo_edit", path=str(path))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_edits_to_one_path_are_serialized(tmp_path):
+    """Edits from different tool instances to the same file never lose an update"""
+    path = tmp_path / "counter.txt"
+    path.write_text("\n".join(f"line {i}" for i in range(50)))
+    tools = [EditTool20250124(), EditTool20250429()]
+
+    await asyncio.gather(*(
+        tools[i % 2](command="str_replace", path=str(path), old_str=f"line {i}\n", new_str=f"done {i}\n")
+        for i in range(49)
+    ))
+    assert path.read_text().count("done") == 49
+
+
+@pytest.mark.asyncio
+async def test_large_file_view_matches_full_read(tmp_path, monkeypatch):
+    """The indexed view of a large file gives the same output as reading it whole"""
+    from app.services.computer_use.tools import edit, line_index
+
+    path = tmp_path / "big.log"
+    path.write_text("".join(f"line {i} é\n" for i in range(5000)) + "last")
+    tool = EditTool20250124()
+    ranges = [None, [1, 3], [2, 2], [1234, 1240], [4999, -1], [5001, 5001], [3000, 5001]]
+    expected = [(await tool(command="view", path=str(path), view_range=r)).output for r in ranges]
+
+    monkeypatch.setattr(edit, "RANGE_VIEW_MIN_BYTES", 0)
+    monkeypatch.setattr(line_index, "INDEX_BLOCK_SIZE", 1000)
+    indexed = [(await tool(command="view", path=str(path), view_range=r)).output for r in ranges]
+    assert indexed == expected
+
+    with pytest.raises(ToolError, match="should be smaller than the number of lines"):
+        await tool(command="view", path=str(path), view_range=[1, 5002])
+
+
+def test_undo_history_restores_exact_content(tmp_path):
+    """Undo returns every earlier text, also after a change outside the editor"""
+    from app.services.computer_use.tools.undo import UndoHistory
+
+    path = tmp_path / "f.txt"
+    history = UndoHistory()
+    history.push(path, "v0", "v0")
+    history.push(path, "v0", "v1 " + "x" * 10000)
+    # the file was rewritten by another tool before the next edit
+    history.push(path, "external", "external edited")
+    assert history.pop(path) == "external"
+    assert history.pop(path) == "v0"
+    assert history.pop(path) == "v0"
+    assert history.pop(path) is None
+
+
+def test_undo_history_depth_budget_and_spill(tmp_path):
+    from app.services.computer_use.tools.undo import UndoHistory
+
+    capped = UndoHistory(max_depth=2)
+    for i in range(5):
+        capped.push(tmp_path / "a", f"v{i}", f"v{i + 1}")
+    assert [capped.pop(tmp_path / "a") for _ in range(3)] == ["v4", "v3", None]
+
+    texts = [os.urandom(4000 * (i + 1)).hex() for i in range(4)]
+    budget = UndoHistory(byte_budget=20000)
+    for i, text in enumerate(texts):
+        budget.push(tmp_path / f"p{i}", text, text + "!")
+    assert budget.nbytes <= 20000
+    assert budget.pop(tmp_path / "p0") is None
+    assert budget.pop(tmp_path / "p3") == texts[3]
+
+    spilling = UndoHistory(byte_budget=20000, spill_dir=tmp_path / "spill")
+    for i, text in enumerate(texts):
+        spilling.push(tmp_path / f"p{i}", text, text + "!")
+    assert spilling.nbytes <= 20000
+    assert [spilling.pop(tmp_path / f"p{i}") for i in range(4)] == texts
+
+
+def _reference_replace(content, old_str, new_str):
+    """The straightforward multi-pass algorithm replace_once must agree with"""
+    if content.count(old_str) > 1:
+        return [i + 1 for i, line in enumerate(content.split("\n")) if old_str in line]
+    new_content = content.replace(old_str, new_str)
+    replacement_line = content.split(old_str)[0].count("\n")
+    start_line = max(0, replacement_line - 4)
+    end_line = replacement_line + 4 + new_str.count("\n")
+    return new_content, start_line, "\n".join(new_content.split("\n")[start_line : end_line + 1])
+
+
+@pytest.mark.parametrize("old_str,new_str", [
+    ("line 0", "first"),
+    ("line 2\nline 3", "two\n\nthree"),
+    ("line 19", ""),
+    ("line 10\n", "x\ny\nz\n"),
+    ("line 1", "dup"),
+    ("\nline 1", "dup"),
+    ("", "empty"),
+])
+def test_replace_once_matches_reference(old_str, new_str):
+    from app.services.computer_use.tools.edit import replace_once
+
+    content = "\n".join(f"line {i}" for i in range(20))
+    expected = _reference_replace(content, old_str, new_str)
+    if isinstance(expected, list):
+        with pytest.raises(ToolError) as excinfo:
+            replace_once(content, old_str, new_str, "/f")
+        assert f"in lines {expected}." in excinfo.value.message
+    else:
+        assert replace_once(content, old_str, new_str, "/f") == expected
+
+
+def test_atomic_write_keeps_mode_and_symlinks(tmp_path):
+    from app.services.computer_use.tools.atomic import atomic_write_text
+
+    target = tmp_path / "script.sh"
+    target.write_text("old")
+    target.chmod(0o750)
+    link = tmp_path / "link.sh"
+    link.symlink_to(target)
+
+    atomic_write_text(link, "new", fsync="always")
+    assert link.is_symlink()
+    assert target.read_text() == "new"
+    assert target.stat().st_mode & 0o7777 == 0o750
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["link.sh", "script.sh"]
+
+    # new files get the mode open() gives them
+    umask = os.umask(0o027)
+    try:
+        atomic_write_text(tmp_path / "new.txt", "new")
+    finally:
+        os.umask(umask)
+    assert (tmp_path / "new.txt").stat().st_mode & 0o7777 == 0o640
+
+
+@pytest.mark.asyncio
+async def test_str_replace_transaction_is_all_or_nothing(tmp_path):
+    tool = EditTool20250124()
+    path = tmp_path / "config.py"
+    path.write_text("a = 1\nb = 2\nc = 3\n")
+
+    with pytest.raises(ToolError, match="did not appear verbatim"):
+        await tool.str_replace_transaction(str(path), [("a = 1", "a = 10"), ("missing", "x")])
+    assert path.read_text() == "a = 1\nb = 2\nc = 3\n"
+
+    result = await tool.str_replace_transaction(str(path), [("a = 1", "a = 10"), ("c = 3", "c = 30")])
+    assert "with 2 replacements" in result.output
+    assert path.read_text() == "a = 10\nb = 2\nc = 30\n"
+
+    await tool(command="undo_edit", path=str(path))
+    assert path.read_text() == "a = 1\nb = 2\nc = 3\n"
+
+
+def test_directory_listing_cache_and_limits(tmp_path):
+    from app.services.computer_use.tools.listing import list_directory
+
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / "src" / "pkg" / "deep.py").write_text("")
+    (tmp_path / "src" / ".cache").mkdir()
+    (tmp_path / "README.md").write_text("hello")
+
+    listing = list_directory(str(tmp_path))
+    assert listing.lines == [str(tmp_path), f"{tmp_path}/README.md", f"{tmp_path}/src", f"{tmp_path}/src/pkg"]
+    assert list_directory(str(tmp_path)) is listing
+
+    # a new entry changes the directory's mtime, which invalidates the cached listing
+    (tmp_path / "src" / "new.py").write_text("")
+    assert f"{tmp_path}/src/new.py" in list_directory(str(tmp_path)).lines
+
+    limited = list_directory(str(tmp_path), max_entries=2)
+    assert limited.truncated and len(limited.lines) == 3
+    detailed = list_directory(str(tmp_path), details=True)
+    assert detailed.lines[1].startswith(f"{tmp_path}/README.md\t5\t")
@@ -0,0 +1,156 @@
+"""
+Tests for agent conversation history management
+"""
+
+from app.services.computer_use.history import (
+    IMAGE_PLACEHOLDER,
+    TRIMMED_SUMMARY_PREFIX,
+    ConversationHistory,
+)
+
+
+def _screenshot_turn(tool_use_id: str):
+    return {
+        "role": "user",
+        "content": [{
+            "type": "tool_result",
+            "tool_use_id": tool_use_id,
+            "content": [{
+                "type": "image",
+                "source": {"type": "base64", "media_type": "image/png", "data": "AAAA"},
+            }],
+        }],
+    }
+
+
+def _tool_use_turn(tool_use_id: str):
+    return {
+        "role": "assistant",
+        "content": [{
+            "type": "tool_use",
+            "id": tool_use_id,
+            "name": "computer",
+            "input": {"action": "screenshot"},
+        }],
+    }
+
+
+def _image_count(history: ConversationHistory) -> int:
+    return sum(
+        1
+        for message in history.messages
+        for block in message["content"]
+        if block["type"] == "tool_result"
+        for item in block["content"]
+        if item["type"] == "image"
+    )
+
+
+def test_old_images_replaced_in_chunks():
+    """Only the most recent images are kept, removed a chunk at a time"""
+    history = ConversationHistory(images_to_keep=2, image_removal_threshold=2)
+    history.append_user_text("take screenshots")
+    for i in range(5):
+        history.append(_tool_use_turn(f"t{i}"))
+        history.append(_screenshot_turn(f"t{i}"))
+    # 5 images, keep 2 -> 3 to remove, rounded down to a chunk of 2
+    assert _image_count(history) == 3
+    first_result = history.messages[2]["content"][0]["content"][0]
+    assert first_result == {"type": "text", "text": IMAGE_PLACEHOLDER}
+
+
+def test_cache_breakpoints_on_recent_user_turns():
+    """Breakpoints go on the latest user turns without touching stored history"""
+    history = ConversationHistory(images_to_keep=None)
+    for i in range(5):
+        history.append_user_text(f"message {i}")
+        history.append_assistant_text(f"reply {i}")
+
+    messages = history.to_request_messages()
+    cached = [
+        message["content"][-1].get("text")
+        for message in messages
+        if "cache_control" in message["content"][-1]
+    ]
+    assert cached == ["message 2", "message 3", "message 4"]
+    assert all("cache_control" not in m["content"][-1] for m in history.messages)
+    assert history.system_blocks("prompt")[0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_trim_to_budget_keeps_tool_pairs():
+    """Trimming cuts before a plain user turn and adds a summary"""
+    history = ConversationHistory(images_to_keep=None)
+    history.append_user_text("first task " + "x" * 4000)
+    history.append(_tool_use_turn("a"))
+    history.append(_screenshot_turn("a"))
+    history.append_assistant_text("done")
+    history.append_user_text("second task")
+
+    removed = history.trim_to_budget(200)
+    assert removed == 4
+    assert history.messages[0]["content"][0]["text"].startswith(TRIMMED_SUMMARY_PREFIX)
+    assert "computer x1" in history.messages[0]["content"][0]["text"]
+    assert history.messages[-1]["content"][0]["text"] == "second task"
+
+
+def test_record_usage():
+    """Usage payloads are normalized and the prompt size remembered"""
+    history = ConversationHistory()
+    turn = history.record_usage({
+        "input_tokens": 10,
+        "cache_read_input_tokens": 900,
+        "output_tokens": 50,
+    })
+    assert turn == {
+        "input_tokens": 10,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 900,
+        "output_tokens": 50,
+    }
+    assert history.last_input_tokens == 910
+
+
+def test_trimming_twice_keeps_the_earlier_summary():
+    """A second trim carries the first summary over and counts every removed message"""
+    history = ConversationHistory(images_to_keep=None)
+    history.append_user_text("first task " + "x" * 4000)
+    history.append(_tool_use_turn("a"))
+    history.append(_screenshot_turn("a"))
+    history.append_assistant_text("done")
+    history.append_user_text("second task")
+    assert history.trim_to_budget(300) == 4
+    first_summary = history.messages[0]["content"][0]["text"]
+
+    history.append_assistant_text("ok")
+    history.append_user_text("third task " + "y" * 2000)
+    history.append_assistant_text("ok")
+    history.append_user_text("fourth task")
+    assert history.trim_to_budget(300) == 4
+
+    summary = history.messages[0]["content"][0]["text"]
+    assert summary.startswith(f"{TRIMMED_SUMMARY_PREFIX} 8 messages removed.")
+    assert first_summary.split("\n", 1)[1] in summary
+    assert "second task" in summary and "third task" in summary
+    assert [message["role"] for message in history.messages] == ["user", "assistant", "user"]
+
+
+def test_trim_counts_system_and_tools_and_skips_hopeless_cuts():
+    """The reported usage includes system and tools; a trim that can't fit isn't made"""
+    history = ConversationHistory(images_to_keep=None)
+    history.append_user_text("first task")
+    history.append_assistant_text("done")
+    history.append_user_text("second task")
+    history.overhead_tokens = 150
+    history.last_input_tokens = 160
+    assert history.trim_to_budget(200) == 0
+
+    history.last_input_tokens = 250
+    assert history.trim_to_budget(200) == 2
+
+    # the last message alone doesn't fit with the system prompt and tools
+    history.append_assistant_text("ok")
+    history.append_user_text("z" * 1000)
+    history.last_input_tokens = 500
+    messages = list(history.messages)
+    assert history.trim_to_budget(200) == 0
+    assert history.messages == messages
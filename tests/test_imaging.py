@@ -0,0 +1,67 @@
+"""
+Tests for resizing and encoding screenshots in the image pool
+"""
+
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app.services.computer_use.imaging import ImagePool
+
+
+def _frame(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.linear_gradient("L").resize((width, height)).convert("RGB").save(output, "PNG")
+    return output.getvalue()
+
+
+def _shared_memory_blocks() -> set:
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+@pytest.mark.asyncio
+async def test_encode_from_memory_and_file(tmp_path):
+    """Frames are resized and encoded in the workers, from memory or from a capture file"""
+    pool = ImagePool(workers=1, queue=0)
+    blocks = _shared_memory_blocks()
+    path = tmp_path / "screenshot.png"
+    path.write_bytes(_frame(1600, 1000))
+    try:
+        resized = Image.open(io.BytesIO(await pool.encode(_frame(1600, 1000), 1280, 800, "png")))
+        assert (resized.format, resized.size) == ("PNG", (1280, 800))
+
+        encoded = Image.open(io.BytesIO(await pool.encode(path, 1600, 1000, "webp")))
+        assert (encoded.format, encoded.size) == ("WEBP", (1600, 1000))
+
+        with pytest.raises(OSError):
+            await pool.encode(b"not an image", 10, 10)
+    finally:
+        pool.close()
+    assert _shared_memory_blocks() == blocks
+
+
+@pytest.mark.asyncio
+async def test_saturated_pool_applies_backpressure():
+    """Beyond one operation per worker plus the queue, callers wait for a slot"""
+    pool = ImagePool(workers=1, queue=1)
+    frame = _frame(800, 600)
+    most_in_flight = 0
+
+    async def watch():
+        nonlocal most_in_flight
+        while True:
+            most_in_flight = max(most_in_flight, pool.in_flight)
+            await asyncio.sleep(0.001)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        results = await asyncio.gather(*(pool.encode(frame, 400, 300) for _ in range(6)))
+    finally:
+        watcher.cancel()
+        pool.close()
+    assert most_in_flight == 2
+    assert pool.in_flight == 0
+    assert all(Image.open(io.BytesIO(result)).size == (400, 300) for result in results)
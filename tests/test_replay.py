@@ -0,0 +1,70 @@
+"""
+Tests for agent session record and replay
+"""
+
+import pytest
+
+pytest.importorskip("anthropic.types.beta")
+
+from app.services.computer_use.replay import (  # noqa: E402
+    TRACE_SUFFIX,
+    ReplayClient,
+    ReplayToolCollection,
+    TraceLibrary,
+    TraceRecorder,
+    load_trace,
+)
+from app.services.computer_use.tools import ToolResult  # noqa: E402
+from app.services.computer_use.tools.base import ToolFailure, ToolImage  # noqa: E402
+
+RESPONSE = {
+    "content": [{"type": "tool_use", "id": "t1", "name": "computer", "input": {"action": "screenshot"}}],
+    "usage": {"input_tokens": 10, "output_tokens": 2},
+}
+
+
+async def _record(tmp_path):
+    path = tmp_path / f"s1{TRACE_SUFFIX}"
+    recorder = TraceRecorder(path, session_id="s1", tool_version="v", tools=[{"name": "computer"}])
+    recorder.record_user("open firefox")
+    recorder.record_model(RESPONSE, elapsed=1.5)
+    screenshot = ToolResult(output="ok", image=ToolImage.from_base64("iVBORw0KGgo="))
+    recorder.record_tool("computer", {"action": "screenshot"}, screenshot, elapsed=0.5)
+    recorder.record_tool("computer", {"action": "screenshot"}, screenshot, elapsed=0.5)
+    await recorder.flush()
+    recorder.record_tool("bash", {"command": "false"}, ToolFailure(error="boom"), elapsed=0.1)
+    await recorder.flush()
+    return path
+
+
+@pytest.mark.asyncio
+async def test_trace_round_trip(tmp_path):
+    """Events survive a round trip and identical images are stored once"""
+    trace = load_trace(await _record(tmp_path))
+    assert trace.header["session_id"] == "s1"
+    assert trace.user_messages == ["open firefox"]
+    assert trace.model_events[0]["response"] == RESPONSE
+    assert len(trace.tool_events) == 3
+    assert len(trace.images) == 1
+
+
+@pytest.mark.asyncio
+async def test_replay_serves_recorded_results(tmp_path):
+    """Replay returns the recorded responses in order, without delays at speed 0"""
+    await _record(tmp_path)
+    replayer = TraceLibrary(tmp_path, speed=0).replayer_for("open firefox")
+    client = ReplayClient(replayer)
+    tools = ReplayToolCollection(replayer)
+
+    assert tools.to_params() == [{"name": "computer"}]
+    assert await client.create_message(messages=[]) == RESPONSE
+    first = await tools.run(name="computer", tool_input={})
+    assert first.output == "ok"
+    assert first.base64_image == "iVBORw0KGgo="
+    await tools.run(name="computer", tool_input={})
+    failure = await tools.run(name="bash", tool_input={})
+    assert isinstance(failure, ToolFailure)
+    assert failure.error == "boom"
+    # past the end of the trace the model stops asking for tools
+    exhausted = await client.create_message(messages=[])
+    assert exhausted["content"][0]["type"] == "text"
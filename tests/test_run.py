@@ -0,0 +1,161 @@
+"""
+Tests for running tool commands
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("anthropic.types.beta")
+
+from app.services.computer_use.tools.run import (  # noqa: E402
+    TRUNCATED_MESSAGE,
+    ResourceLimits,
+    parse_exec,
+    run,
+)
+
+
+def test_parse_exec_only_without_shell_syntax():
+    assert parse_exec("DISPLAY=:1 xdotool type --delay 12 -- 'hello world'") == (
+        ["xdotool", "type", "--delay", "12", "--", "hello world"],
+        {"DISPLAY": ":1"},
+    )
+    assert parse_exec("convert a.png -resize 1024x768! a.png")[0][0] == "convert"
+    assert parse_exec("echo $HOME") is None
+    assert parse_exec("ls | wc -l") is None
+    assert parse_exec("echo 'unterminated") is None
+
+
+@pytest.mark.asyncio
+async def test_run_exec_and_shell():
+    assert await run("echo 'a  b'") == (0, "a  b\n", "")
+    assert await run("echo out; echo err >&2; exit 3") == (3, "out\n", "err\n")
+    assert await run("cat", input=b"typed") == (0, "typed", "")
+    code, _, stderr = await run("definitely-not-a-command --flag")
+    assert code == 127 and "definitely-not-a-command" in stderr
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_head_and_tail_of_large_output():
+    _, stdout, _ = await run("seq 1 2000000", truncate_after=1000)
+    assert stdout.startswith("1\n2\n3\n")
+    assert stdout.endswith("1999999\n2000000\n")
+    assert TRUNCATED_MESSAGE in stdout
+    assert len(stdout) == 1000 + len(TRUNCATED_MESSAGE)
+
+
+@pytest.mark.asyncio
+async def test_run_applies_resource_limits(tmp_path):
+    target = tmp_path / "big"
+    code, _, _ = await run(
+        f"head -c 100000 /dev/zero > {target}", limits=ResourceLimits(file_size_bytes=4096)
+    )
+    assert code != 0
+    assert target.stat().st_size <= 4096
+
+    # executed directly, under prlimit
+    _, stdout, _ = await run("sh -c 'ulimit -t'", limits=ResourceLimits(cpu_seconds=7))
+    assert stdout.strip() == "7"
+
+
+@pytest.mark.asyncio
+async def test_run_timeout_kills_command():
+    with pytest.raises(TimeoutError):
+        await run("sleep 5", timeout=0.2)
+
+
+@pytest.mark.asyncio
+async def test_supervisor_limits_and_session_cleanup():
+    from app.services.computer_use.tools.supervisor import ProcessSupervisor, session_scope
+
+    supervisor = ProcessSupervisor(max_concurrent=4, max_per_session=1, kill_grace=0.5)
+    running = []
+
+    async def hold(session_id):
+        async with supervisor.slot(session_id):
+            running.append(session_id)
+            await asyncio.sleep(0.05)
+            running.remove(session_id)
+            return len(running)
+
+    # other sessions overlap, the same session never does
+    overlaps = await asyncio.gather(hold("a"), hold("a"), hold("b"))
+    assert overlaps[0] + overlaps[1] <= 1
+
+    with session_scope("a"):
+        # the shell's background child shares its process group
+        shell = await supervisor.spawn_shell("sleep 30 & exec sleep 30")
+    other = await supervisor.spawn_exec("sleep", "30", session_id="b")
+    assert supervisor.stats()["by_session"] == {"a": 1, "b": 1}
+
+    assert await supervisor.terminate_session("a") == 1
+    assert shell.returncode is not None
+    assert supervisor.live() == 1 and other.returncode is None
+    assert await supervisor.terminate_all() == 1
+    assert supervisor.live() == 0
+    # nothing is kept for sessions that are gone
+    assert not supervisor._processes and not supervisor._session_slots
+    assert not supervisor._session_users
+
+
+@pytest.mark.asyncio
+async def test_supervisor_forgets_idle_sessions():
+    """Sessions with no commands and no live children leave nothing behind"""
+    from app.services.computer_use.tools.supervisor import ProcessSupervisor
+
+    supervisor = ProcessSupervisor(max_concurrent=4, max_per_session=1)
+    for session_id in ("a", "b", "c"):
+        async with supervisor.slot(session_id):
+            process = await supervisor.spawn_exec("true", session_id=session_id)
+            await process.wait()
+    assert supervisor.stats()["spawned"] == 3
+    assert not supervisor._processes and not supervisor._session_slots
+
+    # a command still running when its session closed is forgotten once it's done
+    started = asyncio.Event()
+
+    async def command():
+        async with supervisor.slot("d"):
+            process = await supervisor.spawn_exec("sleep", "0.2", session_id="d")
+            started.set()
+            await process.wait()
+
+    task = asyncio.create_task(command())
+    await started.wait()
+    await supervisor.terminate_session("d")
+    await task
+    assert not supervisor._processes and not supervisor._session_slots
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # killed orphans stay zombies until init reaps them
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.asyncio
+async def test_bash_restart_stops_shell_and_background_jobs():
+    from app.services.computer_use.tools.bash import BashTool20250124
+
+    tool = BashTool20250124()
+    result = await tool(command="sleep 30 >/dev/null 2>&1 & echo $$ $!")
+    shell_pid, job_pid = map(int, result.output.split())
+
+    await tool(restart=True)
+    await asyncio.sleep(0.1)
+    assert not _alive(shell_pid) and not _alive(job_pid)
+    await asyncio.wait_for(tool._session.stop(), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_run_shell_builtins_and_missing_programs():
+    code, stdout, _ = await run("command -v ls")
+    assert code == 0 and stdout.strip().endswith("/ls")
+    code, stdout, _ = await run("cd /tmp")
+    assert code == 0
+    code, _, stderr = await run("no-such-program --version")
+    assert code == 127 and "not found" in stderr
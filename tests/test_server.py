@@ -0,0 +1,195 @@
+"""
+Tests for the multi-worker launcher and sessions moving between workers
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.models.schemas import SessionCreate
+from app.models.session import Base, Session
+from app.services.computer_use.agent_service import ComputerUseAgentService
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_workers_are_recycled_and_stopped_on_sigterm(tmp_path):
+    """Recycled workers are replaced without failing requests, SIGTERM stops them all"""
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path / 'app.db'}",
+        "ANTHROPIC_API_KEY": "test",
+        "HOST": "127.0.0.1",
+        "PORT": str(_free_port()),
+        "WORKERS": "2",
+        "MAX_REQUESTS": "5",
+        "DEBUG": "false",
+    }
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, cwd=ROOT,
+                   check=True, capture_output=True)
+    launcher = subprocess.Popen(
+        [sys.executable, "-m", "app.server"], env=env, cwd=ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    try:
+        url = f"http://127.0.0.1:{env['PORT']}/health"
+        for _ in range(300):
+            try:
+                httpx.get(url, timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        else:
+            pytest.fail("Server did not start")
+        statuses = []
+        for _ in range(30):
+            statuses.append(httpx.get(url, timeout=5).status_code)
+            time.sleep(0.02)
+        assert statuses == [200] * 30
+
+        launcher.send_signal(signal.SIGTERM)
+        assert launcher.wait(timeout=30) == 0
+    finally:
+        if launcher.poll() is None:
+            launcher.kill()
+    output = launcher.stdout.read()
+    assert "Recycling worker" in output
+    assert "Killing worker" not in output
+
+
+def test_metrics_cover_every_worker(tmp_path):
+    """With PROMETHEUS_MULTIPROC_DIR any worker reports all, the exited ones' gauges dropped"""
+    metrics_dir = tmp_path / "metrics"
+    metrics_dir.mkdir()
+    # left over from a previous run
+    (metrics_dir / "gauge_livesum_1.db").write_bytes(b"")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path / 'app.db'}",
+        "ANTHROPIC_API_KEY": "test",
+        "HOST": "127.0.0.1",
+        "PORT": str(_free_port()),
+        "WORKERS": "2",
+        "EVENT_LOOP_LAG_INTERVAL": "0.1",
+        "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir),
+        "DEBUG": "false",
+    }
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, cwd=ROOT,
+                   check=True, capture_output=True)
+    launcher = subprocess.Popen(
+        [sys.executable, "-m", "app.server"], env=env, cwd=ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    try:
+        url = f"http://127.0.0.1:{env['PORT']}/metrics"
+        for _ in range(300):
+            try:
+                response = httpx.get(url, timeout=1)
+                # both workers have written their gauges
+                if len(list(metrics_dir.glob("gauge_livesum_*.db"))) == 2:
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+        else:
+            pytest.fail("Workers did not start")
+        assert not (metrics_dir / "gauge_livesum_1.db").exists()
+        response = httpx.get(url, timeout=5)
+        assert "energetic_agent_turns_in_flight 0.0" in response.text
+        assert "energetic_websocket_connections{endpoint=\"chat\"} 0.0" in response.text
+        # histograms of both workers, summed
+        assert "energetic_event_loop_lag_seconds_count" in response.text
+
+        launcher.send_signal(signal.SIGTERM)
+        assert launcher.wait(timeout=30) == 0
+    finally:
+        if launcher.poll() is None:
+            launcher.kill()
+    assert not list(metrics_dir.glob("gauge_livesum_*.db"))
+    assert list(metrics_dir.glob("histogram_*.db"))
+
+
+@pytest.mark.asyncio
+async def test_session_moving_between_workers(tmp_path, monkeypatch):
+    """A worker holding an out of date copy of a session reloads it from the checkpoint"""
+    monkeypatch.setattr(settings, "DEMO_STEP_DELAY", 0)
+    monkeypatch.setattr(settings, "AGENT_MODE", "demo")
+    monkeypatch.setattr(settings, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    # two workers, sharing the database and the checkpoints
+    first, second = ComputerUseAgentService(), ComputerUseAgentService()
+
+    async def send(worker, session_id, text):
+        async with sessions() as db:
+            return [chunk async for chunk in worker.send_message(session_id, text, db)]
+
+    try:
+        async with sessions() as db:
+            session_id = (await first.create_session(SessionCreate(title="t"), db)).session_id
+        await send(first, session_id, "hello")
+        await send(second, session_id, "weather in Dubai")
+        await send(first, session_id, "and in San Francisco")
+
+        history = first.active_sessions[session_id]["history"].messages
+        assert [message["role"] for message in history] == ["user", "assistant"] * 3
+        assert "Dubai" in history[2]["content"][0]["text"]
+
+        # closed through the worker that doesn't hold it any more
+        async with sessions() as db:
+            assert await second.close_session(session_id, db)
+            assert (await db.get(Session, 1)).status == "cancelled"
+        async with sessions() as db:
+            assert not await second.close_session("missing", db)
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_complete_is_sent_before_the_checkpoint(tmp_path, monkeypatch):
+    """The client gets its answer without waiting for the checkpoint to be written"""
+    monkeypatch.setattr(settings, "DEMO_STEP_DELAY", 0)
+    monkeypatch.setattr(settings, "AGENT_MODE", "demo")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    worker = ComputerUseAgentService()
+    events = []
+    completed = asyncio.Event()
+
+    async def checkpoint(session_info, force=False):
+        if force:
+            # times out if complete only comes after the checkpoint
+            await asyncio.wait_for(completed.wait(), 5)
+            events.append("checkpoint")
+
+    monkeypatch.setattr(worker, "checkpoint", checkpoint)
+    try:
+        async with sessions() as db:
+            session_id = (await worker.create_session(SessionCreate(title="t"), db)).session_id
+            async for chunk in worker.send_message(session_id, "hello", db):
+                events.append(chunk["type"])
+                if chunk["type"] == "complete":
+                    completed.set()
+    finally:
+        await engine.dispose()
+    assert events[-2:] == ["complete", "checkpoint"]
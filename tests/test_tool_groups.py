@@ -0,0 +1,30 @@
+"""
+Tests for tool groups and their cached definitions
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("anthropic.types.beta")
+
+from app.services.computer_use.tools import TOOL_GROUPS_BY_VERSION, ToolCollection  # noqa: E402
+
+
+def test_collections_share_definitions_per_display(monkeypatch):
+    monkeypatch.setenv("WIDTH", "1920")
+    monkeypatch.setenv("HEIGHT", "1080")
+    group = TOOL_GROUPS_BY_VERSION["computer_use_20250124"]
+
+    first, second = group.collection(), group.collection()
+    assert first.tools[0] is not second.tools[0]
+    assert first.to_params() is second.to_params()
+    assert first.to_params() == ToolCollection(*group.create_tools()).to_params()
+    assert sorted(first.tool_map) == ["bash", "computer", "str_replace_editor"]
+    assert json.loads(first.definitions.serialized) == first.to_params()
+
+    monkeypatch.setenv("WIDTH", "1280")
+    monkeypatch.setenv("HEIGHT", "800")
+    other = group.collection()
+    assert other.definitions.digest != first.definitions.digest
+    assert other.to_params()[0]["display_width_px"] == 1280
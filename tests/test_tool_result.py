@@ -0,0 +1,36 @@
+"""
+Tests for tool results and their images
+"""
+
+import base64
+
+import pytest
+
+pytest.importorskip("anthropic.types.beta")
+
+from app.services.computer_use.tools import ToolImage, ToolResult  # noqa: E402
+from app.services.computer_use.tools.base import ToolFailure  # noqa: E402
+
+
+def test_image_is_encoded_once_and_shared():
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+    image = ToolImage(png)
+    assert image.nbytes == len(png)
+
+    result = ToolResult(output="a").replace(image=image) + ToolResult(output="b")
+    assert result.output == "ab" and result.image is image
+    assert result.base64_image == base64.b64encode(png).decode()
+    # the text replaces the raw bytes, and is the same object on every use
+    assert image.nbytes == len(result.base64_image)
+    assert image.base64 is result.base64_image
+    assert image.data == png
+
+    with pytest.raises(ValueError):
+        result + ToolResult(image=ToolImage(png))
+
+
+def test_results_have_no_instance_dict():
+    assert not hasattr(ToolResult(output="x"), "__dict__")
+    assert not hasattr(ToolFailure(error="x"), "__dict__")
+    assert not ToolResult()
+    assert ToolResult(image=ToolImage.from_base64("iVBORw0KGgo="))
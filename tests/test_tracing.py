@@ -0,0 +1,50 @@
+"""
+Tests for agent turn tracing
+"""
+
+import json
+
+import pytest
+
+from app.core.tracing import STATUS_ERROR, Span, SpanExporter, current_span, span
+
+
+def test_spans_nest_through_context():
+    """Spans opened inside another span become its children"""
+    root = Span.start("agent.turn")
+    with span("tool.call", parent=root) as tool_span:
+        with span("exec.xdotool"):
+            assert current_span().parent is tool_span
+        with span("settle_wait"):
+            pass
+    root.end()
+
+    assert current_span() is None
+    assert [s.name for s in root.walk()] == ["agent.turn", "tool.call", "exec.xdotool", "settle_wait"]
+    assert {s.trace_id for s in root.walk()} == {root.trace_id}
+    assert [entry["name"] for entry in tool_span.breakdown()] == ["exec.xdotool", "settle_wait"]
+    assert all(s.duration_ms is not None for s in root.walk())
+
+
+def test_exception_marks_span_failed():
+    with pytest.raises(RuntimeError):
+        with span("model.call") as failed:
+            raise RuntimeError("overloaded")
+    assert failed.status == STATUS_ERROR
+    assert failed.status_message == "overloaded"
+
+
+def test_export_writes_otlp_json(tmp_path):
+    root = Span.start("agent.turn", session_id="s1")
+    with span("model.call", parent=root, model="m"):
+        pass
+    root.end()
+
+    path = tmp_path / "spans.jsonl"
+    SpanExporter(path).export(root)
+    exported = json.loads(path.read_text().splitlines()[0])
+    spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["agent.turn", "model.call"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert spans[0]["attributes"] == [{"key": "session_id", "value": {"stringValue": "s1"}}]
+    assert int(spans[0]["endTimeUnixNano"]) >= int(spans[0]["startTimeUnixNano"])
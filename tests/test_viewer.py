@@ -0,0 +1,169 @@
+"""
+Tests for the built-in viewer's frame stream
+"""
+
+import asyncio
+import io
+import struct
+from types import SimpleNamespace
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.api.websocket.websocket import CLOSE_SESSION_NOT_FOUND
+from app.core import database
+from app.core.config import settings
+from app.main import app
+from app.models.session import Base
+from app.services.computer_use import viewer
+from app.services.computer_use.imaging import dirty_rects, image_pool
+from app.services.computer_use.viewer import FRAME_HEADER, FrameStream
+
+RECT = struct.Struct("<HHHHI")
+
+
+class FakeDisplay:
+    """Stands in for the computer tool, capturing an image it is given"""
+
+    def __init__(self, width: int, height: int):
+        self.transform = SimpleNamespace(target_width=width, target_height=height)
+        self.frame = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+
+    async def capture(self, path):
+        self.frame.save(path, "PNG")
+        return SimpleNamespace(error=None)
+
+
+def parse(message: bytes):
+    _, sequence, width, height = FRAME_HEADER.unpack_from(message)
+    offset = FRAME_HEADER.size
+    (count,) = struct.unpack_from("<H", message, offset)
+    offset += 2
+    rects = []
+    for _ in range(count):
+        x, y, w, h, length = RECT.unpack_from(message, offset)
+        offset += RECT.size
+        rects.append((x, y, Image.open(io.BytesIO(message[offset:offset + length]))))
+        offset += length
+    assert offset == len(message)
+    return sequence, (width, height), rects
+
+
+def test_dirty_rects():
+    """Separate changes get a rectangle each, an unchanged frame none"""
+    previous = Image.new("RGB", (640, 480), "white")
+    frame = previous.copy()
+    assert dirty_rects(previous, frame) == []
+
+    draw = ImageDraw.Draw(frame)
+    draw.rectangle((10, 20, 109, 119), fill="red")
+    draw.rectangle((400, 300, 409, 309), fill="blue")
+    assert dirty_rects(previous, frame) == [(10, 20, 100, 100), (400, 300, 10, 10)]
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_changes_within_the_ack_window(monkeypatch):
+    monkeypatch.setattr(settings, "VIEWER_IDLE_INTERVAL", 0.05)
+    monkeypatch.setattr(settings, "VIEWER_MAX_UNACKED", 2)
+    display = FakeDisplay(320, 200)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def wait_for(count):
+        for _ in range(500):
+            if len(messages) >= count:
+                return
+            await asyncio.sleep(0.02)
+        pytest.fail(f"{count} frames were not sent")
+
+    stream = FrameStream(display, send, max_fps=50)
+    task = asyncio.create_task(stream.run())
+    try:
+        await wait_for(1)
+        sequence, size, rects = parse(messages[0])
+        assert (sequence, size) == (1, (320, 200))
+        assert [(x, y, image.size) for x, y, image in rects] == [(0, 0, (320, 200))]
+        canvas = rects[0][2].convert("RGB")
+
+        # nothing changed, nothing is sent
+        await asyncio.sleep(0.3)
+        assert len(messages) == 1
+
+        ImageDraw.Draw(display.frame).rectangle((100, 50, 149, 99), fill="red")
+        await wait_for(2)
+        sequence, _, rects = parse(messages[1])
+        assert sequence == 2
+        assert sum(image.width * image.height for _, _, image in rects) < 320 * 200 / 4
+        for x, y, image in rects:
+            canvas.paste(image, (x, y))
+        assert max(ImageStat.Stat(ImageChops.difference(canvas, display.frame)).mean) < 4
+
+        # two frames are waiting for their acknowledgement
+        ImageDraw.Draw(display.frame).rectangle((0, 0, 9, 9), fill="blue")
+        await asyncio.sleep(0.3)
+        assert len(messages) == 2
+        stream.ack(2)
+        await wait_for(3)
+        assert parse(messages[2])[0] == 3
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        image_pool.close()
+    assert stream._previous is None
+
+
+def test_viewer_over_the_vnc_websocket(monkeypatch):
+    """Frames follow viewer_start, the next one once the last is acknowledged"""
+    display = FakeDisplay(160, 100)
+
+    async def session_display(session_id):
+        return display
+
+    monkeypatch.setattr(viewer, "session_display", session_display)
+    monkeypatch.setattr(settings, "VIEWER_MAX_UNACKED", 1)
+    client = TestClient(app)
+    try:
+        with client.websocket_connect("/ws/vnc/s1") as websocket:
+            assert websocket.receive_json()["data"]["viewer"]
+            websocket.send_json({"type": "viewer_start", "data": {"max_fps": 100}})
+            assert parse(websocket.receive_bytes())[:2] == (1, (160, 100))
+
+            # the display didn't change, but the viewer asks for all of it
+            websocket.send_json({"type": "keyframe"})
+            websocket.send_json({"type": "frame_ack", "data": {"sequence": 1}})
+            sequence, _, rects = parse(websocket.receive_bytes())
+            assert sequence == 2
+            assert [(x, y, image.size) for x, y, image in rects] == [(0, 0, (160, 100))]
+
+            websocket.send_json({"type": "vnc_status"})
+            assert websocket.receive_json()["data"]["status"] == "streaming"
+    finally:
+        image_pool.close()
+
+
+def test_viewer_of_a_missing_session(monkeypatch, tmp_path):
+    """The socket is closed with an error rather than streaming some display"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(engine))
+    client = TestClient(app)
+    try:
+        with client.websocket_connect("/ws/vnc/missing") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "viewer_start"})
+            message = websocket.receive_json()
+            assert message["type"] == "error"
+            assert "not found" in message["data"]["error"]
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_json()
+            assert exc_info.value.code == CLOSE_SESSION_NOT_FOUND
+    finally:
+        asyncio.run(engine.dispose())
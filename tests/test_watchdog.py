@@ -0,0 +1,35 @@
+"""
+Tests for the event loop watchdog
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.core.watchdog import LoopWatchdog
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_watchdog_reports_blocking_stack():
+    """A synchronous sleep on the loop is reported with the blocking frame"""
+    watchdog = LoopWatchdog(interval=0.02, threshold=0.05)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.05)
+        assert watchdog.reports == []
+
+        _block_the_loop(0.3)
+        await asyncio.sleep(0.05)
+    finally:
+        await watchdog.stop()
+
+    assert len(watchdog.reports) == 1
+    report = watchdog.reports[0]
+    assert report.duration >= 0.2
+    assert report.location == "test_watchdog.py:_block_the_loop"
+    assert "_block_the_loop" in report.stack